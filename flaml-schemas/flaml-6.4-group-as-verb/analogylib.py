@@ -327,21 +327,16 @@ def analogy_from_node_pairing(node_pairing: dict[str, str], sinister: nx.MultiDi
       # sinister source or dexter doesn't have a dexter
       continue
 
-    # print(f'sinister: {sinister_source} -{sinister_relation}-> {sinister_target}')
-    # print(f'dexter  : {dexter_source} -????????-> {dexter_target}')
+    # Pair the edge up with a dexter edge that has the same relation, and hasn't
+    # been paired up already (there can be more than one between two nodes).
+    sinister_relation = sinister.edges[sinister_edge].get('relation')
+    dexter_edges = dexter[dexter_source].get(dexter_target, {})
+    for dexter_edge_key, dexter_edge_data in dexter_edges.items():
+      dexter_edge = (dexter_source, dexter_target, dexter_edge_key)
+      if dexter_edge_data.get('relation') == sinister_relation and not is_edge_in_dexter(result, dexter_edge):
+        add_analogous_edges(result, sinister_edge, dexter_edge)
+        break
 
-    dexter_edges = dexter[dexter_source].get(dexter_target)
-    if dexter_edges is None:
-      # dexter doesn't have a matching edge
-      continue
-      
-    if len(dexter_edges.keys()) > 1:
-      # oops this is a multi-edge
-      print('WARNING: dexter has a multi-edge, we just picked the first one. edges:', dexter_edges)
-    
-    dexter_edge_key = 0
-    add_analogous_edges(result, sinister_edge, (dexter_source, dexter_target, dexter_edge_key))
-  
   return result
 
 """
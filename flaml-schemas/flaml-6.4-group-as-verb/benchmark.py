@@ -0,0 +1,177 @@
+"""
+Parser and compiler benchmarks on synthetic specs (see synthetic.py).
+
+For each size (roughly the number of compiled graph nodes), this times
+make_relations, parse_type_definitions and compile_spec, measures their peak memory,
+and writes everything to a JSON file so runs can be compared.
+
+Run with:
+python benchmark.py                                  # 10 to 100k nodes
+python benchmark.py -s 10 100 1000 -o before.json    # just the small sizes
+python benchmark.py --compare before.json after.json
+"""
+import argparse
+import datetime
+import json
+import platform
+import subprocess
+import sys
+import timeit
+import tracemalloc
+from pathlib import Path
+
+import compiler
+import parser
+import synthetic
+
+DEFAULT_SIZES = [10, 100, 1_000, 10_000, 100_000]
+DEFAULT_SHAPE = synthetic.SpecShape()
+
+BENCHMARKS = {
+  'make_relations': parser.make_relations,
+  'parse_type_definitions': parser.parse_type_definitions,
+  'compile_spec': compiler.compile_spec,
+}
+
+argp = argparse.ArgumentParser(
+                    prog='FLAML Benchmarks',
+                    description='Times the parser and compiler on synthetic specs of increasing size.')
+argp.add_argument('-s', '--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='Approximate numbers of graph nodes to benchmark.')
+argp.add_argument('-r', '--repeat', type=int, default=3, help='Runs per benchmark; the fastest is kept.')
+argp.add_argument('-o', '--outputfile', help='Where the JSON results are written. Default is benchmark-results/<time>.json.')
+argp.add_argument('-c', '--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help='Compare two JSON results instead of benchmarking.')
+argp.add_argument('--fanout', type=int, default=DEFAULT_SHAPE.fanout)
+argp.add_argument('--compound-depth', type=int, default=DEFAULT_SHAPE.compound_depth)
+argp.add_argument('--alias-chain', type=int, default=DEFAULT_SHAPE.alias_chain)
+argp.add_argument('--type-definitions', type=int, default=DEFAULT_SHAPE.type_definitions)
+argp.add_argument('--no-standard-types', dest='standard_types', action='store_false')
+argp.add_argument('--seed', type=int, default=DEFAULT_SHAPE.seed)
+
+def clear_caches():
+  """
+  Forget the parser's lexed and expanded statements, which are cached for the whole
+  process. Otherwise every run after the first would time the caches, not the parser.
+  """
+  parser.lex.cache_clear()
+  parser._expand_compound_object.cache_clear()
+
+def measure(function: callable, spec: list, repeat: int) -> dict:
+  """
+  Fastest time and peak memory (in bytes, from tracemalloc) of function(spec), each
+  run starting from cold parser caches.
+  Memory is measured on a separate run, since tracing slows everything down.
+  """
+  seconds = min(timeit.repeat(lambda: function(spec), setup=clear_caches, number=1, repeat=repeat))
+
+  clear_caches()
+  tracemalloc.start()
+  try:
+    function(spec)
+    _, peak_bytes = tracemalloc.get_traced_memory()
+  finally:
+    tracemalloc.stop()
+
+  return {'seconds': seconds, 'peak_bytes': peak_bytes}
+
+def run_size(num_nodes: int, shape_fields: dict, repeat: int, verbose=False) -> dict:
+  shape = synthetic.shape_for_nodes(num_nodes, **shape_fields)
+  spec = synthetic.make_spec(shape)
+  compiler.load_standard_library()  # loaded once per process, so it isn't timed
+  graph = compiler.compile_spec(spec)
+
+  result = {
+    'size': num_nodes,
+    'instances': shape.instances,
+    'statements': len(spec),
+    'declarations': len(parser.make_relations(spec)[0]),
+    'nodes': graph.number_of_nodes(),
+    'edges': graph.number_of_edges(),
+    'benchmarks': {},
+  }
+  for name, function in BENCHMARKS.items():
+    measurement = measure(function, spec, repeat)
+    measurement['nodes_per_second'] = result['nodes'] / measurement['seconds']
+    result['benchmarks'][name] = measurement
+    if verbose:
+      print(f'  {name:<24} {measurement["seconds"]:>10.4f}s {measurement["peak_bytes"] / 2**20:>10.2f}MiB')
+
+  return result
+
+def git_commit() -> str | None:
+  try:
+    return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                          cwd=Path(__file__).parent).stdout.strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+def run_benchmarks(sizes: list[int], shape_fields: dict = {}, repeat: int = 3, verbose=False) -> dict:
+  """
+  Benchmark every size. shape_fields are passed to synthetic.SpecShape (except instances,
+  which comes from the size).
+  """
+  results = {
+    'created': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    'commit': git_commit(),
+    'python': sys.version,
+    'platform': platform.platform(),
+    'repeat': repeat,
+    'shape': {field: value for field, value in synthetic.SpecShape(**shape_fields)._asdict().items() if field != 'instances'},
+    'runs': [],
+  }
+  for num_nodes in sizes:
+    if verbose:
+      print(f'> {num_nodes} nodes')
+    results['runs'].append(run_size(num_nodes, shape_fields, repeat, verbose=verbose))
+
+  return results
+
+def compare(before: dict, after: dict) -> list[str]:
+  """
+  One line per size and benchmark in both results, with the time and memory ratios (after / before).
+  """
+  lines = []
+  if before['shape'] != after['shape']:
+    lines.append(f'Warning: the runs used different shapes, {before["shape"]} and {after["shape"]}.')
+
+  before_runs = {run['size']: run for run in before['runs']}
+  for after_run in after['runs']:
+    before_run = before_runs.get(after_run['size'])
+    if before_run is None:
+      continue
+    for name, after_measurement in after_run['benchmarks'].items():
+      before_measurement = before_run['benchmarks'].get(name)
+      if before_measurement is None:
+        continue
+      time_ratio = after_measurement['seconds'] / before_measurement['seconds']
+      memory_ratio = after_measurement['peak_bytes'] / max(before_measurement['peak_bytes'], 1)
+      lines.append(f'{after_run["size"]:>8} {name:<24} time x{time_ratio:.2f}  memory x{memory_ratio:.2f}')
+
+  return lines
+
+if __name__ == '__main__':
+  flags = argp.parse_args()
+
+  if flags.compare is not None:
+    before_path, after_path = flags.compare
+    with open(before_path) as before_file, open(after_path) as after_file:
+      print('\n'.join(compare(json.load(before_file), json.load(after_file))))
+    sys.exit()
+
+  shape_fields = {
+    'fanout': flags.fanout,
+    'compound_depth': flags.compound_depth,
+    'alias_chain': flags.alias_chain,
+    'type_definitions': flags.type_definitions,
+    'standard_types': flags.standard_types,
+    'seed': flags.seed,
+  }
+  results = run_benchmarks(flags.sizes, shape_fields, flags.repeat, verbose=True)
+
+  output_path = flags.outputfile
+  if output_path is None:
+    timestamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+    output_path = Path(__file__).with_name('benchmark-results') / f'{timestamp}.json'
+  Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+  with open(output_path, 'w') as output_file:
+    json.dump(results, output_file, indent=2)
+  print('> Results written to', output_path)
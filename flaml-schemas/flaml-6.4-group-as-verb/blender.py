@@ -11,6 +11,7 @@ import timeit
 import yaml
 import orjson
 
+import cache
 import parser
 import compiler
 import metalgo
@@ -45,6 +46,9 @@ argp.add_argument('-v', '--verbose', action="store_true", help='Print incrementa
 argp.add_argument('-o', '--outputfile', help='Where the log file is written.')
 argp.add_argument('-c', '--continue', help='File to continue from')  # TODO
 argp.add_argument('-d', '--dump', action="store_true", help='Dump results from metalgo to a JSON.')
+argp.add_argument('-m', '--mode', choices=['exact', 'bipartite'], default='exact', help='How metalgo computes analogies. bipartite is approximate, but takes milliseconds.')
+argp.add_argument('--constrained', action="store_true", help='Only match nodes within their layer, and edges within their relation.')
+argp.add_argument('-p', '--profile', action="store_true", help='Record what each compiler pass did to json/compile-stats.json.')
 
 def json_normalize_edges(edges):
   normalized = []
@@ -53,12 +57,12 @@ def json_normalize_edges(edges):
 
   return normalized
 
-def make_analogy(sinister_name, dexter_name, sinister_graph, dexter_graph, timeout):
+def make_analogy(sinister_name, dexter_name, sinister_graph, dexter_graph, timeout, mode='exact', constrained=False):
   stdout = []
   stdout.append(f'> Pairing: {sinister_name} <=> {dexter_name}')
   
   start_time = timeit.default_timer()
-  analogy, iterations = metalgo.compute_analogy(sinister_graph, dexter_graph, timeout=timeout)
+  analogy, iterations = metalgo.compute_analogy(sinister_graph, dexter_graph, timeout=timeout, mode=mode, constrained=constrained)
   end_time = timeit.default_timer()
 
   stdout.append('> Result:')
@@ -118,8 +122,8 @@ def make_analogy(sinister_name, dexter_name, sinister_graph, dexter_graph, timeo
             "num_analogy_edges": num_analogy_edges,
             "conceptual_connectivity": conceptual_connectivity,
             "punchline": punchline,
-            "sinister_graph": nx.node_link_data(sinister_graph, edges="edges"), 
-            "dexter_graph": nx.node_link_data(dexter_graph, edges="edges"),
+            "sinister_graph": compiler.node_link_data(sinister_graph), 
+            "dexter_graph": compiler.node_link_data(dexter_graph),
             "score": score,
             "num_iterations": str(len(iterations['times'])),
             "stdout": stdout }
@@ -134,20 +138,33 @@ if __name__ == '__main__':
     timeout = int(flags.timeout)
 
   spec_graphs = {}
+  compile_stats = {}
 
   # Import and compile are specs, skipping those that don't work.
   for spec_name in spec_names:
     print('> Importing', spec_name)
-    spec_graphs[spec_name] = compiler.compile(spec_name+'.yaml')
+    if flags.profile:
+      # Skip the graph cache, so there's something to profile.
+      stats = compiler.CompileStats()
+      spec_graphs[spec_name] = compiler.compile(spec_name+'.yaml', stats=stats)
+      compile_stats[spec_name] = stats.to_json()
+      print(stats.format())
+    else:
+      spec_graphs[spec_name] = compiler.compile_cached(spec_name+'.yaml')
+
+  if flags.profile:
+    with open('json/compile-stats.json', 'wb') as f:
+      f.write(orjson.dumps(compile_stats))
 
   # Write out specs
   with open('json/specs.json', 'wb') as f:
     json_specs = { }
     for spec_name in spec_names:
-      spec_yaml = parser.spec_from_file(spec_name+'.yaml')
+      spec_file_path = parser.spec_path(spec_name+'.yaml')
+      spec_yaml = cache.load_spec(spec_file_path)
       # with open(spec_name+'.yaml') as spec_f:
       #   spec_yaml = yaml.safe_load(spec_f)
-      json_specs[spec_name] = { "yaml": spec_yaml, "lookup": parser.make_relations(spec_yaml, False)[1] }
+      json_specs[spec_name] = { "yaml": spec_yaml, "lookup": parser.compact_lookup(cache.load_relations(spec_file_path)) }
     f.write(orjson.dumps(json_specs))
 
   # Estimate
@@ -167,7 +184,7 @@ if __name__ == '__main__':
     if (sinister_graph.size() > dexter_graph.size()):
       combinations[i] = [combinations[i][1], combinations[i][0]]
   
-  analogies = Parallel(n_jobs=-1)(delayed(make_analogy)(sinister_name, dexter_name, spec_graphs[sinister_name], spec_graphs[dexter_name], timeout) for sinister_name, dexter_name in combinations)
+  analogies = Parallel(n_jobs=-1)(delayed(make_analogy)(sinister_name, dexter_name, spec_graphs[sinister_name], spec_graphs[dexter_name], timeout, flags.mode, flags.constrained) for sinister_name, dexter_name in combinations)
 
   stdout = [analogy[0] for analogy in analogies]
   print("\n\n".join(stdout))
@@ -0,0 +1,138 @@
+"""
+On-disk cache for loaded, parsed and compiled specs.
+
+Loading YAML and parsing it into declarations is the slow part of compiling a spec,
+and the blender, tests and scripts keep doing it for the same files. Each result is
+pickled under a key made from the file's content and the parser's source, so
+editing either a spec or parser.py invalidates the entry automatically. Compiled
+graphs are also keyed by the compiler's source and standard.yaml.
+
+Every load returns a fresh copy, so callers are free to modify what they get.
+
+The cache lives in .cache/ next to this file. Set FLAML_CACHE_DIR to move it, or
+FLAML_CACHE=0 to turn it off.
+"""
+import functools
+import hashlib
+import os
+import pickle
+import tempfile
+from pathlib import Path
+
+import yaml
+import parser
+
+# Bump this when the format of cached results changes without parser.py changing.
+CACHE_VERSION = 1
+
+def cache_dir() -> Path:
+  return Path(os.environ.get('FLAML_CACHE_DIR', Path(__file__).with_name('.cache')))
+
+def is_enabled() -> bool:
+  return os.environ.get('FLAML_CACHE', '1') != '0'
+
+@functools.cache
+def parser_version() -> str:
+  """
+  Hash of the parser's source, so that cached results don't outlive the code that made them.
+  """
+  source = Path(parser.__file__).read_bytes()
+  return hashlib.blake2b(source + str(CACHE_VERSION).encode(), digest_size=16).hexdigest()
+
+@functools.cache
+def _compiler_source() -> bytes:
+  return Path(__file__).with_name('compiler.py').read_bytes()
+
+def compiler_version() -> str:
+  """
+  Hash of the compiler's source and the standard library, which compiled graphs
+  depend on as well as the parser. standard.yaml is read every time, since it can
+  change while running (see compiler.load_standard_library).
+  """
+  return hashlib.blake2b(_compiler_source() + parser.standard_path().read_bytes(), digest_size=16).hexdigest()
+
+def content_key(content: bytes) -> str:
+  return hashlib.blake2b(content + parser_version().encode(), digest_size=16).hexdigest()
+
+def _cached(file_path, artifact: str, compute: callable, version: str = ''):
+  """
+  Return compute(content) for the file at file_path, from the cache if possible.
+  artifact names the kind of result, since one file has several.
+  """
+  return _cached_content(Path(file_path).read_bytes(), artifact, compute, version)
+
+def _cached_content(content: bytes, artifact: str, compute: callable, version: str = ''):
+  """
+  Return compute(content), from the cache if possible. version is anything else
+  the result depends on (besides the parser).
+  """
+  if not is_enabled():
+    return compute(content)
+
+  entry_path = cache_dir().joinpath(f'{content_key(content + version.encode())}.{artifact}.pickle')
+  try:
+    with open(entry_path, 'rb') as file_handle:
+      return pickle.load(file_handle)
+  except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+    # Missing or unreadable entry: recompute it.
+    pass
+
+  result = compute(content)
+
+  # Write to a temporary file first, since parallel jobs (eg. the blender) might
+  # be writing the same entry. Writing is best-effort: a read-only or full cache
+  # dir shouldn't fail the caller, who has the result anyway.
+  temp_path = None
+  try:
+    entry_path.parent.mkdir(parents=True, exist_ok=True)
+    file_descriptor, temp_path = tempfile.mkstemp(dir=entry_path.parent, suffix='.tmp')
+    with os.fdopen(file_descriptor, 'wb') as file_handle:
+      pickle.dump(result, file_handle, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_path, entry_path)
+    temp_path = None
+  except OSError:
+    pass
+  finally:
+    if temp_path is not None:
+      try:
+        os.unlink(temp_path)
+      except OSError:
+        pass
+
+  return result
+
+def _load_yaml(content: bytes):
+  return yaml.load(content, Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader))
+
+def _load_yaml_documents(content: bytes) -> list:
+  return list(yaml.load_all(content, Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader)))
+
+# --- Cached loaders
+# These take a path to a YAML file, not a name in specifications/ (see parser.spec_path).
+
+def load_spec(file_path):
+  """Cached parser.spec_from_file."""
+  return _cached(file_path, 'spec', _load_yaml)
+
+def load_spec_documents(file_path) -> list:
+  """Cached list(yaml.safe_load_all(...)), for files with several specs."""
+  return _cached(file_path, 'documents', _load_yaml_documents)
+
+def load_relations(file_path) -> tuple:
+  """Cached parser.make_relations."""
+  return _cached(file_path, 'relations', lambda content: parser.make_relations(_load_yaml(content)))
+
+def load_type_definitions(file_path) -> tuple:
+  """Cached parser.parse_type_definitions."""
+  return _cached(file_path, 'types', lambda content: parser.parse_type_definitions(_load_yaml(content)))
+
+def load_graph(file_path, compile: callable):
+  """Cached compile(content) for the spec file at file_path (see compiler.compile_cached)."""
+  return _cached(file_path, 'graph', compile, compiler_version())
+
+def load_spec_graph(spec: list, compile: callable):
+  """
+  Cached compile(spec) for a spec that's already loaded. It's keyed by its repr,
+  which is the same for equal specs.
+  """
+  return _cached_content(repr(spec).encode(), 'graph', lambda _: compile(spec), compiler_version())
@@ -8,8 +8,14 @@ TODO: 'interp' should be renamed to 'declarations' or 'decls' because it now
 
 """
 
+import itertools
 import pprint
+import timeit
+from types import MappingProxyType
+from typing import Container, Iterable, Iterator, Mapping, NamedTuple, Sequence
 import networkx as nx
+import numpy as np
+import cache
 import parser
 from parser import rel, dpower
 
@@ -21,6 +27,7 @@ argp = argparse.ArgumentParser(
                     description='Prints mermaid diagram for provided files. Default is calendar.yaml.')
 argp.add_argument('filenames', action='append')
 argp.add_argument("-v", "--verbose", action="store_true", help="Enable verbose output.")
+argp.add_argument("-p", "--profile", action="store_true", help="Print what each compiler pass did and how long it took.")
 
 # --- Helpers
 """
@@ -29,119 +36,627 @@ Find an alias if it exists.
 def lookup_alias(alias_registry: dict[str, str], name: str):
   return alias_registry.get(name, name)  # return name if it wasn't found in the registry
 
+"""
+Union-find over alias names, for the alias pass. Each class of aliases (a = b = c)
+is named by joining its members in the order they were first declared, so the name
+is the same in every run.
+"""
+class AliasResolver:
+  def __init__(self):
+    self._parents: dict[str, str] = {}  # in the order names were first seen
+    self._sizes: dict[str, int] = {}
+
+  def find(self, name: str) -> str:
+    """
+    The representative of name's class. Names that weren't declared are their own class.
+    """
+    parents = self._parents
+    if name not in parents:
+      parents[name] = name
+      self._sizes[name] = 1
+      return name
+
+    while parents[name] != name:
+      parents[name] = parents[parents[name]]  # path halving
+      name = parents[name]
+    return name
+
+  def union(self, name: str, other_name: str):
+    root = self.find(name)
+    other_root = self.find(other_name)
+    if root == other_root:
+      return
+    if self._sizes[root] < self._sizes[other_root]:
+      root, other_root = other_root, root
+    self._parents[other_root] = root
+    self._sizes[root] += self._sizes[other_root]
+
+  def classes(self) -> list[list[str]]:
+    """
+    The members of each class, in the order they were first seen.
+    """
+    members = {}
+    for name in self._parents:
+      members.setdefault(self.find(name), []).append(name)
+    return list(members.values())
+
+  def registry(self) -> dict[str, str]:
+    """
+    {name: canonical name} for every name that was declared.
+    """
+    alias_registry = {}
+    for members in self.classes():
+      combined_name = ' = '.join(members)
+      for name in members:
+        alias_registry[name] = combined_name
+    return alias_registry
+
+# --- Type Templates
+"""
+A type's declarations, prepared for instantiating the type many times.
+Nodes that mention the instance (`@`) are kept split on `@`, so that filling in an
+instance's name is a join rather than a search and replace.
+
+declarations     : every declaration, with template nodes
+type_declarations: just the rel.TYPE ones, which tag nested instances
+weak_declarations: just the weak ones, which are the only ones that can add edges
+"""
+class TypeTemplate(NamedTuple):
+  declarations: tuple
+  type_declarations: tuple
+  weak_declarations: tuple
+
+def make_node_template(node: str) -> str | tuple[str, ...]:
+  # eg. '@/timeline' => ('', '/timeline'). Nodes without `@` stay as they are.
+  if '@' not in node:
+    return node
+  return tuple(node.split('@'))
+
+def make_type_template(type_interp: list) -> TypeTemplate:
+  declarations = tuple(
+    (make_node_template(source), relation, make_node_template(target), power)
+    for source, relation, target, power in type_interp
+  )
+  # If a node is given several types, the first one wins. For flattened declarations
+  # (see TypeHierarchy.declarations), that's the type's own over its parents'.
+  type_declarations = {}
+  for declaration in declarations:
+    if declaration[1] == rel.TYPE:
+      type_declarations.setdefault(declaration[2], declaration)
+
+  return TypeTemplate(
+    declarations=declarations,
+    type_declarations=tuple(type_declarations.values()),
+    weak_declarations=tuple(declaration for declaration in declarations if declaration[3] == dpower.WEAK),
+  )
+
+def make_type_templates(type_interps: Mapping[str, list]) -> dict[str, TypeTemplate]:
+  return {type_name: make_type_template(type_interp) for type_name, type_interp in type_interps.items()}
+
+def instantiate_node(node_template: str | tuple, instance_names: list[str]) -> str:
+  """
+  Same as parser.sub_inst_name_in_node, with instance_names the instance's name split on ` = `.
+  """
+  if type(node_template) is str:
+    return node_template
+  return ' = '.join([individual_name.join(node_template) for individual_name in instance_names])
+
+def instantiate(declarations: tuple, instance_name: str) -> list[tuple]:
+  """
+  The template declarations for one instance (see parser.substitute_instance_name_in_decl).
+  """
+  instance_names = instance_name.split(' = ')
+  if len(instance_names) == 1:
+    # Not an alias, which is most of the time.
+    fill = instance_name.join
+    return [
+      (source if type(source) is str else fill(source), relation, target if type(target) is str else fill(target), power)
+      for source, relation, target, power in declarations
+    ]
+
+  return [
+    (instantiate_node(source, instance_names), relation, instantiate_node(target, instance_names), power)
+    for source, relation, target, power in declarations
+  ]
+
+"""
+Spread the presentation and action layers to everything the nodes of those layers
+group, in one breadth-first pass from all of them at once.
+
+A node takes the layer of the nearest node that groups it (or itself) and isn't
+conceptual. If a presentation and an action node are equally near, the one that
+comes first in node_layers wins.
+
+Inputs:
+node_layers: {node: layer}, from each node's type
+grouped    : {node: [nodes it groups]}, ie. the rel.GROUP_FOREACH edges
+"""
+def propagate_layers(node_layers: dict[str, str], grouped: Mapping[str, list[str]]) -> dict[str, str]:
+  layers = dict(node_layers)
+  frontier = [node for node, layer in node_layers.items() if layer != 'conceptual']
+  reached = set(frontier)
+  while frontier:
+    next_frontier = []
+    for node in frontier:
+      for grouped_node in grouped.get(node, ()):
+        if grouped_node not in reached:
+          reached.add(grouped_node)
+          layers[grouped_node] = layers[node]
+          next_frontier.append(grouped_node)
+    frontier = next_frontier
+  return layers
+
+"""
+A dict that can't be changed, for attribute values that many nodes share (eg. a
+type's ancestry distances). It's still a dict, so it serializes like one.
+"""
+class FrozenDict(dict):
+  def _read_only(self, *args, **kwargs):
+    raise TypeError(f'{type(self).__name__} is read-only')
+
+  __setitem__ = __delitem__ = __ior__ = _read_only
+  clear = pop = popitem = setdefault = update = _read_only
+
+  def __reduce__(self):
+    return (type(self), (dict(self),))
+
+  def __copy__(self):
+    return self
+
+  def __deepcopy__(self, memo):
+    return self
+
+# --- Compile Statistics
+"""
+What one pass of the compiler did. The counts that don't apply to a pass are 0.
+
+declarations : declarations the pass read
+edges_added  : new edges (repeated declarations don't add any)
+weak_rejected: weak declarations dropped because their source or target isn't strongly declared
+nodes, edges : the size of the graph after the pass
+"""
+class PassStats(NamedTuple):
+  name: str
+  seconds: float
+  declarations: int = 0
+  edges_added: int = 0
+  weak_rejected: int = 0
+  nodes: int = 0
+  edges: int = 0
+
+"""
+Collects PassStats as a spec is compiled, to find out which passes are slow:
+
+stats = CompileStats()
+graph = compile_spec(spec, stats=stats)
+print(stats.format())
+"""
+class CompileStats:
+  def __init__(self):
+    self.passes: list[PassStats] = []
+    self._pass_start = timeit.default_timer()
+
+  def start(self):
+    """
+    Time the next pass from now.
+    """
+    self._pass_start = timeit.default_timer()
+
+  def record(self, name: str, **counts):
+    """
+    Add the pass that just finished, timed from the end of the previous one (or start).
+    """
+    pass_end = timeit.default_timer()
+    self.passes.append(PassStats(name, pass_end - self._pass_start, **counts))
+    self._pass_start = pass_end
+
+  def total_seconds(self) -> float:
+    return sum(pass_stats.seconds for pass_stats in self.passes)
+
+  def to_json(self) -> list[dict]:
+    return [pass_stats._asdict() for pass_stats in self.passes]
+
+  def format(self) -> str:
+    lines = [f'{"pass":<20} {"seconds":>9} {"share":>6} {"decls":>9} {"edges+":>9} {"rejected":>9} {"nodes":>9} {"edges":>9}']
+    total_seconds = self.total_seconds()
+    for pass_stats in self.passes:
+      share = pass_stats.seconds / total_seconds if total_seconds > 0 else 0
+      lines.append(f'{pass_stats.name:<20} {pass_stats.seconds:>9.4f} {share:>6.0%} {pass_stats.declarations:>9} {pass_stats.edges_added:>9} '
+                   f'{pass_stats.weak_rejected:>9} {pass_stats.nodes:>9} {pass_stats.edges:>9}')
+    lines.append(f'{"total":<20} {total_seconds:>9.4f}')
+    return '\n'.join(lines)
+
 # --- Compile
 """
-Construct an extension to a type_registry based on type_interps.
-type_interps declares a bunch of stuff. This include declaring an instance of something else.
+Construct an extension to a type_registry based on type_templates.
+Types declare a bunch of stuff. This include declaring an instance of something else.
 When that happens, we want to add that instantiation to the type_registry.
 
 For example, if we define (gui) view and gui declares (linear) /encoding.vstack,
 we want to infer that view/encoding.vstack is also (linear).
 
 Inputs:
-type_registry = {instance_name: type_name}
-type_interps  = {type_name: [type_declarations]}
+type_registry  = {instance_name: type_name}
+type_templates = {type_name: TypeTemplate}
 """
-def make_type_registry_extension(type_registry: dict[str, str], type_interps: dict[str, list], valid_nodes: list[str], get_alias: callable):
-  # Find type and add instances when used, including when nested
-  if len(type_registry.keys()) == 0:  # base case
-    return {}
-
-  type_registry_extension = {}
-  for spec_inst_name, spec_type_name in type_registry.items():
-    type_interp = type_interps.get(spec_type_name, None)
-    assert type_interp is not None, f'Type `{spec_type_name}` was used with `{spec_inst_name}` but not declared.'
-
-    for type_declaration in type_interp:
-      type_declaration = parser.substitute_instance_name_in_decl(type_declaration, spec_inst_name)
-      
-      source = get_alias(parser.get_declaration_source(type_declaration))  # type name
-      relation = parser.get_declaration_relation(type_declaration)
-      target = get_alias(parser.get_declaration_target(type_declaration))  # declaration instance node
-
-      # parser.print_declaration(type_declaration)  # DEBUG
-      if relation == rel.TYPE and target in valid_nodes:
-        # Tag node (target) with the type (source)
-        type_registry_extension[target] = source
-  
-  return type_registry_extension | make_type_registry_extension(type_registry_extension, type_interps, valid_nodes, get_alias)
+def make_type_registry_extension(type_registry: dict[str, str], type_templates: Mapping[str, TypeTemplate], valid_nodes: Container[str], get_alias: callable):
+  return trace_type_registry_extension(type_registry, type_templates, valid_nodes, get_alias).extension
 
+"""
+make_type_registry_extension, and what it depended on (see IncrementalCompile).
 
+extension: {instance_name: type_name}, same as make_type_registry_extension
+origins  : {instance_name: (declaring instance, type declaration)} for each node in extension
+examined : nodes that were checked against valid_nodes. The extension stays the
+           same as long as the type_registry does, and these nodes stay (in)valid.
 """
-Expand type_interp with the parent's type_interp. type_interp is modified in place.
-For example, (presentation) is (gui)'s parent, so we add (presentation)'s interp to (gui)'s interp.
+class TypeRegistryTrace(NamedTuple):
+  extension: dict[str, str]
+  origins: dict[str, tuple[str, tuple]]
+  examined: set[str]
+
+def trace_type_registry_extension(type_registry: dict[str, str], type_templates: Mapping[str, TypeTemplate], valid_nodes: Container[str], get_alias: callable) -> TypeRegistryTrace:
+  # Find type and add instances when used, including when nested.
+  # The worklist is done a round at a time: each round tags the nodes declared by
+  # the previous round's instances. Later rounds win, as nested types are more specific.
+  # Each (instance, type) is only worked on once, so an instance that comes back
+  # with the same type doesn't tag the same nodes again, forever.
+  extension = {}
+  origins = {}
+  examined = set()
+  seen = set(type_registry.items())
+  worklist = type_registry
+  while worklist:
+    type_registry_extension = {}
+    for spec_inst_name, spec_type_name in worklist.items():
+      type_template = type_templates.get(spec_type_name, None)
+      assert type_template is not None, f'Type `{spec_type_name}` was used with `{spec_inst_name}` but not declared.'
+
+      for declaration in instantiate(type_template.type_declarations, spec_inst_name):
+        source, _, target, _ = declaration
+        target = get_alias(target)  # declaration instance node
+        examined.add(target)
+        if target in valid_nodes:
+          # Tag node (target) with the type (source)
+          type_registry_extension[target] = get_alias(source)
+          origins[target] = (spec_inst_name, declaration)
+
+    extension |= type_registry_extension
+    worklist = {inst: type_name for inst, type_name in type_registry_extension.items() if (inst, type_name) not in seen}
+    seen.update(worklist.items())
+  
+  return TypeRegistryTrace(extension, origins, examined)
 
-Input:
-type_interps_lists: {type_name: [type_declarations]}
-type_parents      : nx.digraph where edges are (type->parent)
 """
-def expand_type_interps(type_interps_lists: dict[str, list], type_parents: nx.digraph, verbose=False):
-  nodes_with_parents = type_parents.nodes()
-  for type_name, type_interp in type_interps_lists.items():
-    if type_name not in nodes_with_parents:
-      # Type does not have a parent.
-      continue
+Node attributes that only depend on the node's type: its layer (before grouping
+spreads it, see propagate_layers) and its ancestry distances. Nodes of the same
+type share them, so the ancestry distances are read-only.
+"""
+def make_type_attributes(hierarchy: 'TypeHierarchy', node_type: str) -> tuple[str, FrozenDict | None]:
+  if not hierarchy.has_ancestry(node_type):
+    return 'conceptual', None
 
-    parents_list = nx.descendants(type_parents, type_name)
-    for parent_name in parents_list:
-      if parent_name not in type_interps_lists.keys():
-        # This type was probably not defined with declarations eg. (structure)
-        continue
-    
-      if verbose:
-        print(f'extending ({type_name}) with ({parent_name})')
-      type_interps_lists[type_name].extend(type_interps_lists[parent_name])
-  
-  # DEBUG
-  # pprint.pprint(type_interps_lists)
+  # We tag nodes depending on whether they are in the conceptual, presentation,
+  # or behavior layer. They are mutually exclusive, and depend entirely on type.
+  # A type's ancestry includes itself.
+  ancestry = hierarchy.ancestry_distances(node_type)
+  is_presentation_layer = 'presentation' in ancestry
+  is_action_layer = 'action' in ancestry
+  assert not (is_presentation_layer and is_action_layer), f'Error: `({node_type})` is somehow both in the presentation and action layer. \n          ancestry:{list(ancestry)}'
+
+  node_layer = 'conceptual'
+  if is_presentation_layer:
+    node_layer = 'presentation'
+  elif is_action_layer:
+    node_layer = 'action'
+  return node_layer, FrozenDict(ancestry)
+
+def make_node_attributes(node_type: str | None, layer: str, standard_types: Container[str], type_attributes: Mapping[str, tuple]) -> dict:
+  if node_type is None:
+    return {'is_standard': False, 'layer': layer, 'ancestry_distances': None}
+  return {
+    'type': node_type,
+    'is_standard': node_type in standard_types,
+    'layer': layer,
+    'ancestry_distances': type_attributes[node_type][1],
+  }
+
+
+# --- Type Hierarchy
+"""
+Types and their parents. Each type's ancestry, flattened declarations and template
+are worked out once, the first time they're needed, and are read-only so that every
+node of the type shares them.
 
+type_interps: {type_name: type_declarations}, each type's own declarations
+type_parents: {type_name: parent_type_name}
+"""
+class TypeHierarchy:
+  def __init__(self, type_interps: Mapping[str, Sequence[tuple]], type_parents: Mapping[str, str], shared: 'TypeHierarchy|None' = None):
+    self.type_interps = MappingProxyType({type_name: tuple(type_interp) for type_name, type_interp in type_interps.items()})
+    self.type_parents = MappingProxyType(dict(type_parents))
+    # Types in a parent relationship; the others don't have an ancestry.
+    self._related_types = frozenset(type_parents.keys()) | frozenset(type_parents.values())
+
+    self._ancestry: dict[str, Mapping[str, int]] = {}
+    self._declarations: dict[str, tuple] = {}
+    self._templates: dict[str, TypeTemplate] = {}
+    if shared is not None:
+      self._ancestry.update(shared._ancestry)
+      self._declarations.update(shared._declarations)
+      self._templates.update(shared._templates)
+
+    # Checks for cycles up front, rather than when a type in one is used.
+    for type_name in self.type_parents:
+      self.ancestry_distances(type_name)
+
+  def extend(self, type_interps: Mapping[str, Sequence[tuple]], type_parents: Mapping[str, str]) -> 'TypeHierarchy':
+    """
+    This hierarchy with more types. This hierarchy's types win over new ones with
+    the same name. Results for this hierarchy's types are shared, unless the new
+    types change their ancestry (ie. give a parent to a type that doesn't have one).
+    """
+    return TypeHierarchy(
+      type_interps | self.type_interps,
+      type_parents | self.type_parents,
+      shared=self if self.is_closed_under(type_parents) else None,
+    )
+
+  def is_closed_under(self, type_parents: Mapping[str, str]) -> bool:
+    """
+    Whether type_parents leaves this hierarchy's ancestries alone, ie. gives none
+    of its types (even ones without a parent or children) a different parent.
+    """
+    return all(
+      type_parents[type_name] == self.type_parents.get(type_name)
+      for type_name in type_parents
+      if type_name in self.type_interps or type_name in self._related_types
+    )
+
+  def __contains__(self, type_name: str) -> bool:
+    return type_name in self.type_interps
+
+  def has_ancestry(self, type_name: str) -> bool:
+    return type_name in self._related_types
+
+  def ancestry_distances(self, type_name: str) -> Mapping[str, int]:
+    """
+    {ancestor_name: distance}, including the type itself at distance 0.
+    """
+    ancestry = self._ancestry.get(type_name)
+    if ancestry is None:
+      distances = {}
+      ancestor_name = type_name
+      while ancestor_name is not None:
+        assert ancestor_name not in distances, f'Type ancestry contains a cycle: {" -> ".join(distances)} -> {ancestor_name}'
+        distances[ancestor_name] = len(distances)
+        ancestor_name = self.type_parents.get(ancestor_name)
+      ancestry = self._ancestry[type_name] = MappingProxyType(distances)
+    return ancestry
+
+  def declarations(self, type_name: str) -> tuple:
+    """
+    The type's declarations followed by its ancestors', nearest first, without duplicates.
+    """
+    declarations = self._declarations.get(type_name)
+    if declarations is None:
+      flattened = {}
+      for ancestor_name in self.ancestry_distances(type_name):
+        flattened.update(dict.fromkeys(self.type_interps.get(ancestor_name, ())))
+      declarations = self._declarations[type_name] = tuple(flattened)
+    return declarations
+
+  def template(self, type_name: str) -> TypeTemplate:
+    type_template = self._templates.get(type_name)
+    if type_template is None:
+      type_template = self._templates[type_name] = make_type_template(self.declarations(type_name))
+    return type_template
+
+  def templates(self) -> dict[str, TypeTemplate]:
+    """
+    {type_name: TypeTemplate} for every declared type.
+    """
+    return {type_name: self.template(type_name) for type_name in self.type_interps}
 
-def compile(file_path: str, verbose=False):
-  spec = parser.spec_from_file(file_path)
-  return compile_spec(spec, verbose)
 
-def compile_spec(spec: list, verbose=False):
+"""
+The compile functions below take a CompileStats to record their passes in.
+"""
+def compile(file_path: str, verbose=False, stats: CompileStats | None = None):
+  if verbose:
+    # The verbose output comes from parsing, so don't skip it with the cache.
+    return compile_spec(parser.spec_from_file(file_path), verbose, stats=stats)
+
+  stats = stats if stats is not None else CompileStats()
+  stats.start()
+  real_path = parser.spec_path(file_path)
+  interp = cache.load_relations(real_path)
+  type_definitions = cache.load_type_definitions(real_path)
+  stats.record('load', declarations=len(interp[0]))
+  return compile_parsed(interp, type_definitions, stats=stats)
+
+def compile_spec(spec: list, verbose=False, compact=False, stats: CompileStats | None = None):
+  stats = stats if stats is not None else CompileStats()
+  stats.start()
   # TODO: technically I should rename all "interp" decl, but that's not a priority.
-  std_spec = parser.spec_from_standard()
   interp = parser.make_relations(spec)
   if verbose:
     print('\n--- Parsing spec ---')
     parser.print_interp(interp)
+  stats.record('parse', declarations=len(interp[0]))
+
+  if verbose:
+    print('\n--- Parsing spec types ---')
+  type_definitions = parser.parse_type_definitions(spec, verbose)
+  stats.record('parse types')
   
+  return compile_parsed(interp, type_definitions, verbose=verbose, compact=compact, stats=stats)
+
+"""
+compile or compile_spec, through the on-disk cache (see cache.py). spec is either
+a file name in specifications/, or a spec that's already loaded. Graphs are cached
+by the spec's content, the parser and compiler's source, and standard.yaml, so
+editing any of them recompiles.
+
+Every call returns a fresh graph, so it's free to be modified.
+"""
+def compile_cached(spec: str | list, verbose=False):
   if verbose:
-    print('\n--- Parsing standard library ---')
-  standard_type_interps, standard_type_parents = parser.parse_type_definitions(std_spec, verbose)
-  standard_types = set(standard_type_interps.keys())
+    # The verbose output comes from compiling, so don't skip it with the cache.
+    return compile(spec, verbose) if isinstance(spec, str) else compile_spec(spec, verbose)
+
+  if isinstance(spec, str):
+    real_path = parser.spec_path(spec)
+    return cache.load_graph(real_path, lambda _: compile_parsed(cache.load_relations(real_path), cache.load_type_definitions(real_path)))
+  return cache.load_spec_graph(spec, compile_spec)
 
+"""
+Compile a spec that was already parsed.
+interp is from parser.make_relations, and the type definitions are from parser.parse_type_definitions.
+With compact=True, the result is a CompactGraph instead of a networkx graph.
+"""
+def compile_parsed(interp: tuple, type_definitions: tuple, verbose=False, compact=False, stats: CompileStats | None = None):
+  stats = stats if stats is not None else CompileStats()
+  stats.start()
+  standard = load_standard_library()
   if verbose:
-    print('\n--- Parsing spec types ---')
-  type_interps, type_parents = parser.parse_type_definitions(spec, verbose)
-  type_interps = type_interps | standard_type_interps
-  type_parents = type_parents | standard_type_parents
+    print('\n--- Standard library ---')
+    print(', '.join(sorted(standard.standard_types)))
+
+  type_interps, type_parents = type_definitions
+  type_interps = type_interps | standard.hierarchy.type_interps
+  type_parents = type_parents | standard.hierarchy.type_parents
+  stats.record('standard library')
   
-  return compile_interp(interp[0], type_interps, type_parents, standard_types, verbose=verbose)
+  return compile_interp(interp[0], type_interps, type_parents, standard.standard_types, verbose=verbose, standard=standard, compact=compact, stats=stats)
+
+# --- Standard Library
+"""
+The standard library, parsed once per process. Compiles share it, so everything
+in it is read-only, and so are the results its hierarchy works out.
+
+hierarchy     : the standard types (see TypeHierarchy), with every type already worked out
+standard_types: names of the standard types
+"""
+class StandardLibrary(NamedTuple):
+  hierarchy: TypeHierarchy
+  standard_types: frozenset[str]
+
+  def is_closed_under(self, type_parents: dict[str, str]) -> bool:
+    """
+    Whether type_parents leaves the standard types' ancestry alone, ie. the spec
+    doesn't give a parent to a standard type that doesn't have one.
+    """
+    return self.hierarchy.is_closed_under(type_parents)
+
+  @property
+  def type_interps(self) -> Mapping[str, tuple]:
+    """
+    {type_name: type_declarations}, with the declarations of the type's parents.
+    """
+    return MappingProxyType({type_name: self.hierarchy.declarations(type_name) for type_name in self.standard_types})
+
+  @property
+  def type_ancestry(self) -> Mapping[str, Mapping[str, int]]:
+    """
+    {type_name: {ancestor_name: distance}}, including the type itself at distance 0.
+    """
+    return MappingProxyType({type_name: self.hierarchy.ancestry_distances(type_name) for type_name in self.hierarchy._related_types})
+
+_standard_library: StandardLibrary|None = None
+_standard_library_key: str|None = None
+
+def load_standard_library() -> StandardLibrary:
+  """
+  Returns the standard library snapshot, rebuilding it only if standard.yaml changed.
+  """
+  global _standard_library, _standard_library_key
+  standard_key = cache.content_key(parser.standard_path().read_bytes())
+  if standard_key != _standard_library_key:
+    _standard_library = make_standard_library(*cache.load_type_definitions(parser.standard_path()))
+    _standard_library_key = standard_key
+  return _standard_library
+
+def make_standard_library(type_interps: dict[str, list], type_parents: dict[str, str]) -> StandardLibrary:
+  hierarchy = TypeHierarchy(type_interps, type_parents)
+  # Work everything out now, so that compiles share it.
+  hierarchy.templates()
+
+  return StandardLibrary(
+    hierarchy=hierarchy,
+    standard_types=frozenset(type_interps.keys()),
+  )
 
-def compile_interp(interp: list, type_interps: dict[str,list], type_parents: dict[str,str], standard_types: set[str], verbose=False):
+# --- Edge Store
+"""
+The edges of every relation, kept in one place while compiling. Edges are unique
+by (source, relation, target), so repeated declarations are dealt with here. The
+networkx graph is only built at the end, by to_multidigraph.
+"""
+class EdgeStore:
+  def __init__(self):
+    self.edges: dict[tuple[str, parser.rel, str], None] = {}  # used as an ordered set
+    self.nodes: set[str] = set()
+
+  def add_edge(self, source: str, relation: parser.rel, target: str):
+    self.edges[source, relation, target] = None
+    self.nodes.add(source)
+    self.nodes.add(target)
+
+  def __contains__(self, node: str) -> bool:
+    return node in self.nodes
+
+  def __len__(self) -> int:
+    return len(self.edges)
+
+  def successors(self, relation: parser.rel) -> dict[str, list[str]]:
+    """
+    {source: [targets]} for the edges of one relation, eg. to walk rel.GROUP_FOREACH.
+    """
+    successors = {}
+    for source, edge_relation, target in self.edges:
+      if edge_relation == relation:
+        successors.setdefault(source, []).append(target)
+    return successors
+
+  def sorted_edges(self) -> list[tuple[str, parser.rel, str]]:
+    """
+    Edges grouped by relation, in the order relations are defined in. This is the
+    order that composing one graph per relation used to give.
+    """
+    return sorted(self.edges, key=lambda edge: edge[1]._value_)
+
+  def to_multidigraph(self) -> nx.MultiDiGraph:
+    graph = nx.MultiDiGraph()
+    graph.add_edges_from((source, target, {'relation': relation.name}) for source, relation, target in self.sorted_edges())
+    return graph
+
+def compile_interp(interp: parser.DeclarationTable | list, type_interps: dict[str,list], type_parents: dict[str,str], standard_types: set[str], verbose=False, standard: StandardLibrary|None = None, compact=False, stats: CompileStats | None = None):
   """
   Takes a list of interpreted relations (from the parser) and produces a networkx
   MultiGraph which represents this list. It also applies various transitive rules
   to complete the graph. 
+
+  type_interps are each type's own declarations. If standard is given, what its
+  hierarchy already worked out for the standard types is reused.
+  With compact=True, the graph is a CompactGraph instead, and networkx is skipped.
+  Each pass is recorded in stats, if given.
   """
   def vprint(*args):
     if verbose:
       print(*args)
   
+  stats = stats if stats is not None else CompileStats()
+  stats.start()
   vprint('\n--- Compiling interp ---')
 
-  # --- Initialize graphs
-  # NOTE: we make a graph for each type of relation for closures
-  graphs: dict[nx.DiGraph] = {}
-  for relation_enum in list(rel):
-    if relation_enum in (rel.TBD, rel.TYPE):
-      # ignore unparsed relations
-      continue
+  # The passes below read the table's strong/weak/by-relation views.
+  if not isinstance(interp, parser.DeclarationTable):
+    interp = parser.DeclarationTable(interp)
 
-    graphs[relation_enum] = nx.DiGraph()
+  # --- Initialize graphs
+  # NOTE: every relation's edges go in one store; the graph is built after the passes.
+  edge_store = EdgeStore()
 
   type_registry = {}  # node: type
 
@@ -156,20 +671,16 @@ def compile_interp(interp: list, type_interps: dict[str,list], type_parents: dic
   #   }
   # We do a pass on interp to get the aliases, since we'll use them for the other
   # graphs after.
-  for declaration in interp:
+  aliases = AliasResolver()
+  alias_declarations = interp.by_relation(rel.ALIAS)
+  for declaration in alias_declarations:
     source = parser.get_declaration_source(declaration)
-    relation = parser.get_declaration_relation(declaration)
     target = parser.get_declaration_target(declaration)
     # NOTE: This ignores declaration power
 
-    if relation == rel.ALIAS:
-      graphs[rel.ALIAS].add_edge(source, target, relation=rel.ALIAS)
+    aliases.union(source, target)
   
-  alias_registry = {}
-  for connected in nx.connected_components(graphs[rel.ALIAS].to_undirected()):
-    combined_name = ' = '.join(list(connected))
-    for node in connected:
-      alias_registry[node] = combined_name
+  alias_registry = aliases.registry()
   
   def get_alias(node_name):
     return lookup_alias(alias_registry, node_name)
@@ -177,22 +688,17 @@ def compile_interp(interp: list, type_interps: dict[str,list], type_parents: dic
   if verbose:
     for node, alias_name in alias_registry.items():
       vprint(f'{node:>25} : {alias_name}')
-
-  # Alias graph is no longer needed, so we delete it. This means it doesn't get
-  # combined in the final multigraph.
-  graphs.pop(rel.ALIAS)
+  stats.record('alias', declarations=len(alias_declarations))
 
 
   # --- Strong Declaration Pass
-  # Add each nodes and edges of strong declarations to the appropriate relation graph.
-  # NOTE: since these are DiGraphs, there is at most one directed edge between 
-  # two nodes. This means that duplicate relations are automatically delt with.
+  # Add each nodes and edges of strong declarations to the edge store.
+  # NOTE: the store keeps one edge per (source, relation, target). This means that
+  # duplicate relations are automatically delt with.
   vprint('\n-- Strong Declaration Pass')
-  for declaration in interp:
-    # Skip Weak and Question declarations.
-    if parser.get_declaration_power(declaration) != dpower.STRONG:
-      continue
-
+  # Weak and Question declarations are not in the strong view.
+  strong_declarations = interp.strong()
+  for declaration in strong_declarations:
     source = get_alias(parser.get_declaration_source(declaration))
     relation = parser.get_declaration_relation(declaration)
     target = get_alias(parser.get_declaration_target(declaration))
@@ -204,8 +710,7 @@ def compile_interp(interp: list, type_interps: dict[str,list], type_parents: dic
     if relation == rel.TYPE:
       # Tagging types as nodes reduces proliferating vertices (expensive)
       # but it's just as expressive as using edges.
-      # NOTE: rel.TYPE is added to the graph after compose_all to avoid
-      # losing attributes to the graph composition.
+      # NOTE: rel.TYPE is added to the graph once it's built.
 
       # Tag node (target) with the type (source)
       # TODO: When dealing with an alias, there are potentially multiple types.
@@ -218,48 +723,51 @@ def compile_interp(interp: list, type_interps: dict[str,list], type_parents: dic
       continue    
 
     vprint(f'{source} -{relation.name}-> {target}')
-    rel_graph = graphs[relation]
 
     # Finally add edge
-    rel_graph.add_edge(source, target, relation=relation.name)
+    edge_store.add_edge(source, relation, target)
+  stats.record('strong', declarations=len(strong_declarations), edges_added=len(edge_store), nodes=len(edge_store.nodes), edges=len(edge_store))
 
   # --- TYPE Declaration Pass.
   vprint('\n-- Type Declaration Pass --')
-  num_strong_declarations = len(interp)
   
   # Any instance of a type might used the type's attributes. This includes maybe
   # adding instances of other types and their attributes (recursively). However,
   # We only want to add stuff if it's actually used in the spec.
-  strong_nodes = nx.compose_all(
-    [nx.MultiDiGraph(graph) for graph in graphs.values()]
-  ).nodes()
+  # NOTE: the weak pass only adds edges between these, so the store's nodes stay the strong nodes.
+  strong_nodes = edge_store.nodes
 
-  # Add parent declarations to type declarations
-  type_ancestry = nx.DiGraph([(type_name, type_parent_name) for type_name, type_parent_name in type_parents.items()])
-  assert nx.is_directed_acyclic_graph(type_ancestry), f'Type ancestry graph contains a cycle. {type_ancestry=}'
-  expand_type_interps(type_interps, type_ancestry, verbose=verbose)
+  # Types come with their parents' declarations. The standard library's types are
+  # already worked out, so only the spec's are done here.
+  if standard is not None:
+    hierarchy = standard.hierarchy.extend(type_interps, type_parents)
+  else:
+    hierarchy = TypeHierarchy(type_interps, type_parents)
+  type_templates = hierarchy.templates()
 
-  # Find type and add instances when used, including when nested
-  type_registry = type_registry | make_type_registry_extension(type_registry, type_interps, strong_nodes, get_alias)
+  if verbose:
+    for type_name in type_interps:
+      vprint(f'({type_name}) extends', ' -> '.join(f'({ancestor_name})' for ancestor_name in hierarchy.ancestry_distances(type_name)))
+  stats.record('ancestry', declarations=sum(map(len, type_interps.values())), nodes=len(edge_store.nodes), edges=len(edge_store))
 
-  # Add declaration from type to instances
-  for spec_inst_name, spec_type_name in type_registry.items():
-    type_interp = type_interps.get(spec_type_name, None)
-    assert type_interp is not None, f'Type `{spec_type_name}` was used with `{spec_inst_name}` but not declared.'
+  # Find type and add instances when used, including when nested
+  type_registry = type_registry | make_type_registry_extension(type_registry, type_templates, strong_nodes, get_alias)
+  stats.record('type instantiation', nodes=len(edge_store.nodes), edges=len(edge_store))
 
-    for type_declaration in type_interp:
-      type_declaration = parser.substitute_instance_name_in_decl(type_declaration, spec_inst_name)
-      source = get_alias(parser.get_declaration_source(type_declaration))  # declaration type
-      relation = parser.get_declaration_relation(type_declaration)
-      target = get_alias(parser.get_declaration_target(type_declaration))  # declaration instance node
-      if relation == rel.TYPE and target in strong_nodes:
-        continue  # already dealt with types
+  # Add declaration from type to instances.
+  # Types were dealt with above, and strong declarations from types don't add
+  # nodes, so only the weak declarations are left for the weak pass.
+  # They're made as the weak pass goes, rather than all kept at once.
+  def make_type_declarations():
+    for spec_inst_name, spec_type_name in type_registry.items():
+      type_template = type_templates.get(spec_type_name, None)
+      assert type_template is not None, f'Type `{spec_type_name}` was used with `{spec_inst_name}` but not declared.'
 
-      interp.append(parser.substitute_instance_name_in_decl(type_declaration, spec_inst_name))
+      yield from instantiate(type_template.weak_declarations, spec_inst_name)
 
   vprint('\n- These declarations were added from type definitions:')
   if verbose:
-    for decl in interp[num_strong_declarations:]:
+    for decl in make_type_declarations():
       parser.print_declaration(decl)
 
   # --- Weak Declaration Pass.
@@ -268,20 +776,24 @@ def compile_interp(interp: list, type_interps: dict[str,list], type_parents: dic
   # This helps prevent the proliferation of vertices that the user doesn't actually care about
   # eg. (view/encoding.vstack, rel.SUBSET, view/encoding, dpower.WEAK) doesn't mean we care about view/encoding
 
-  for declaration in interp:
-    if parser.get_declaration_power(declaration) is not dpower.WEAK:
-      # Skip Strong and Question declarations.
-      continue
-
+  # Strong and Question declarations are not in the weak view.
+  num_strong_edges = len(edge_store)
+  num_weak_declarations = 0
+  num_weak_rejected = 0
+  for declaration in itertools.chain(interp.weak(), make_type_declarations()):
+    num_weak_declarations += 1
     source = lookup_alias(alias_registry, parser.get_declaration_source(declaration))
     relation = parser.get_declaration_relation(declaration)
     target = lookup_alias(alias_registry, parser.get_declaration_target(declaration))
 
     if source in strong_nodes and target in strong_nodes:
       vprint(f'{source} -{relation.name}-> {target}')
-      rel_graph = graphs[relation]
       # Finally add edge
-      rel_graph.add_edge(source, target, relation=relation.name)
+      edge_store.add_edge(source, relation, target)
+    else:
+      num_weak_rejected += 1
+  stats.record('weak', declarations=num_weak_declarations, edges_added=len(edge_store) - num_strong_edges,
+               weak_rejected=num_weak_rejected, nodes=len(edge_store.nodes), edges=len(edge_store))
   
 
   # --- Question Declartion Pass.
@@ -289,117 +801,830 @@ def compile_interp(interp: list, type_interps: dict[str,list], type_parents: dic
   # TODO: first need to figure out when question declarations are made and
   #       figure out how `def` stuff will work.
 
-  # --- Combine Graphs.
-  vprint('\n-- Combine Graphs')
-  # NOTE: if multiple graphs use the same node-attribute, then compose_all will
-  # use the last one. Seems like a footgun to me!
-  combined_graph = nx.compose_all(
-    [nx.MultiDiGraph(graph) for graph in graphs.values()]
-  )
+  # --- Finalise.
+  # Every node and edge attribute is worked out in columns here, then the graph is
+  # built with them in one go. Attributes that only depend on a node's type are
+  # worked out once per type, and shared by every node of that type.
+  vprint('\n-- Finalise')
 
   # - Assign types
   vprint('- Assign Types')
-  for node, node_type in type_registry.items():
-    vprint(f'({node_type}) {node}')
-    combined_graph.add_node(node, type=node_type)
-  
-  # - Assign whether type is from standard library or not
-  vprint('- Assign whether type is standard')
-  for node_name, attr in combined_graph.nodes(data=True):
-    is_standard = False
-    type_name = attr.get('type', None)
-    if type_name is not None and type_name in standard_types:
-      is_standard = True
-    combined_graph.add_node(node_name, is_standard=is_standard)
-    
+  if verbose:
+    for node, node_type in type_registry.items():
+      vprint(f'({node_type}) {node}')
 
-  for node, node_type in type_registry.items():
-    # vprint(f'({node_type}) {node}')
-    is_standard = node_type in standard_types
-    combined_graph.add_node(node, is_standard=is_standard)
+  # {type_name: (layer, ancestry_distances)}
+  type_attributes = {}
+  for node_type in dict.fromkeys(type_registry.values()):
+    type_attributes[node_type] = make_type_attributes(hierarchy, node_type)
+
+    ancestry_dist = type_attributes[node_type][1]
+    if verbose and ancestry_dist is not None:
+      vprint(f'({node_type}) parent distances')
+      pprint.pprint(ancestry_dist)
+      vprint()
+  stats.record('types', nodes=len(edge_store.nodes), edges=len(edge_store))
 
   # - Assign Layer
-  # We tag nodes depending on whether they are in the conceptual, presentation,
-  # or behavior layer. They are mutually exclusive, and depend entirely on type.
+  # First from the node's type, then spread to the items that are grouped by
+  # presentation and action items.
   vprint('\n- Assign Layer')
+  edges = edge_store.sorted_edges()
+  # Typed nodes might not be in any edge, in which case they come last.
+  nodes = list(dict.fromkeys(itertools.chain(
+    (node for source, _, target in edges for node in (source, target)),
+    type_registry,
+  )))
+  node_layers = propagate_layers(
+    {node: type_attributes[type_registry[node]][0] if node in type_registry else 'conceptual' for node in nodes},
+    edge_store.successors(rel.GROUP_FOREACH),
+  )
 
-  # First pass assigns layer based on type.
-  # print_graph(type_ancestry) # TODO: RM
-  for node_name, attr in combined_graph.nodes(data=True):
-    type_name = attr.get('type')
-    node_layer = 'conceptual'
-    if type_name is None or type_name not in type_ancestry.nodes:
-      # no type and no parents
-      pass
-    else:
-      is_presentation_layer = type_name == 'presentation' or 'presentation' in nx.descendants(type_ancestry, type_name)
-      is_action_layer = type_name == 'action' or 'action' in nx.descendants(type_ancestry, type_name)
-      assert not (is_presentation_layer and is_action_layer), f'Error: `({type_name}) {node_name}` is somehow both in the presentation and action layer. \n          nodes:{type_ancestry.nodes}\n          edges:{type_ancestry.edges}'
-
-      node_layer = 'conceptual'
-      if is_presentation_layer:
-        node_layer = 'presentation'
-      elif is_action_layer:
-        node_layer = 'action'
-    
-    # DEBUG
-    # vprint(f'({type_name}) {node_name} => {node_layer}')
-    combined_graph.add_node(node_name, layer=node_layer)
-
-  # Second pass looks at the items that are grouped by presentation and action items.
-  for node_name, attr in combined_graph.nodes(data=True):
-    node_layer = attr.get('layer')
-    if node_layer == 'conceptual':
-      continue
-
-    if node_name not in graphs[rel.GROUP_FOREACH].nodes():
-      continue
+  def make_graph_nodes():
+    for node in nodes:
+      yield node, make_node_attributes(type_registry.get(node), node_layers[node], standard_types, type_attributes)
 
-    for grouped_node in nx.descendants(graphs[rel.GROUP_FOREACH], node_name):
-      combined_graph.add_node(grouped_node, layer=node_layer)
-      # DEBUG
-      # vprint(f'converting {grouped_node} to {node_layer} layer')
-  
   if verbose:
-    for node_name, attr in combined_graph.nodes(data=True):
-      type_name = attr.get('type')
-      node_layer = attr.get('layer')
+    for node_name in nodes:
+      type_name = type_registry.get(node_name)
       type_str = f'({type_name}) ' if type_name is not None else ''
-      vprint(f'{node_layer}: {type_str}{node_name}')
-
-  # Label edges based which layer it comes from/gets to
-  for edge in combined_graph.edges:
-    source, target, key = edge
-    source_layer = combined_graph.nodes[source].get('layer')
-    target_layer = combined_graph.nodes[target].get('layer')
-    nx.set_edge_attributes(combined_graph, {
-      edge: {'layers': (source_layer, target_layer)}
-    })
-  
-  # - Assign type parents
-  vprint('\n- Assign parent distances')
-  for node_name, attr in combined_graph.nodes(data=True):
-    ancestry_dist = None
+      vprint(f'{node_layers[node_name]}: {type_str}{node_name}')
+  stats.record('layers', nodes=len(nodes), edges=len(edges))
+
+  # Label edges based which layer it comes from/gets to. There are only a few
+  # combinations, so they're shared too.
+  layer_pairs = {}
+  def make_graph_edges():
+    for source, relation, target in edges:
+      layers = (node_layers[source], node_layers[target])
+      yield source, target, {
+        'relation': relation.name,
+        'layers': layer_pairs.setdefault(layers, layers),
+      }
+
+  if compact:
+    compact_graph = _make_compact_graph(
+      nodes,
+      ((source, relation._value_, target) for source, relation, target in edges),
+      [type_registry.get(node) for node in nodes],
+      [node_layers[node] for node in nodes],
+      {node_type: ancestry_dist for node_type, (_, ancestry_dist) in type_attributes.items()},
+      standard_types,
+      alias_registry,
+    )
+    stats.record('combine', nodes=compact_graph.number_of_nodes(), edges=compact_graph.number_of_edges())
+    return compact_graph
+
+  # Built straight from generators, so the attributes are never held twice.
+  # {alias: node name}, so that any of an alias' names can be looked up without splitting node names.
+  combined_graph = nx.MultiDiGraph(aliases=alias_registry)
+  combined_graph.add_nodes_from(make_graph_nodes())
+  combined_graph.add_edges_from(make_graph_edges())
+  stats.record('combine', nodes=combined_graph.number_of_nodes(), edges=combined_graph.number_of_edges())
 
-    node_type = attr.get('type')
-    if node_type is not None and node_type in type_ancestry.nodes:
-      ancestry_dist = nx.shortest_path_length(type_ancestry, source=node_type)
+  return combined_graph
 
-      if verbose:
-        vprint(f'({node_type}) {node_name}')
-        pprint.pprint(ancestry_dist)
-        vprint()
+# --- Compact Graph
+LAYERS = ('conceptual', 'presentation', 'action')
+_LAYER_CODES = {layer: code for code, layer in enumerate(LAYERS)}
+_RELATION_NAMES = {relation._value_: relation.name for relation in rel}
 
-    combined_graph.add_node(node_name, ancestry_distances=ancestry_dist)
+"""
+A compiled graph as integer ids and arrays, for code that would rather not hash
+node names (eg. `videos.in-editor = editors/videos`) over and over.
+
+Nodes are numbered in the graph's node order. Edges are stored by source (CSR),
+in the order networkx iterates them, so both forms list nodes and edges the same way.
+
+nodes         : node names, by node id
+node_ids      : {node name: node id}
+types         : type names, by type id
+ancestry      : ancestry distances (or None) of each type, by type id
+node_type     : type id of each node, or -1 if it has no type
+node_layer    : layer of each node, as an index in LAYERS
+is_standard   : whether each node's type is from the standard library
+edge_offsets  : node i's edges are edge_offsets[i]:edge_offsets[i + 1] in the edge arrays
+edge_targets  : target node id of each edge
+edge_relations: relation of each edge, as a rel value
+aliases       : {alias: node name}, same as graph.graph['aliases']
+"""
+class CompactGraph(NamedTuple):
+  nodes: tuple[str, ...]
+  node_ids: dict[str, int]
+  types: tuple[str, ...]
+  ancestry: tuple[FrozenDict | None, ...]
+  node_type: np.ndarray
+  node_layer: np.ndarray
+  is_standard: np.ndarray
+  edge_offsets: np.ndarray
+  edge_targets: np.ndarray
+  edge_relations: np.ndarray
+  aliases: dict[str, str]
+
+  def number_of_nodes(self) -> int:
+    return len(self.nodes)
+
+  def number_of_edges(self) -> int:
+    return len(self.edge_targets)
+
+  def edge_sources(self) -> np.ndarray:
+    """
+    Source node id of each edge. With edge_targets, this is the COO form.
+    """
+    return np.repeat(np.arange(len(self.nodes), dtype=np.int32), np.diff(self.edge_offsets))
+
+  def edge_keys(self) -> np.ndarray:
+    """
+    networkx's key of each edge, ie. how many edges between the same nodes come before it.
+    """
+    sources = self.edge_sources()
+    indices = np.arange(len(sources))
+    # Edges between the same nodes are next to each other.
+    is_first = np.ones(len(sources), dtype=bool)
+    is_first[1:] = (sources[1:] != sources[:-1]) | (self.edge_targets[1:] != self.edge_targets[:-1])
+    return indices - np.maximum.accumulate(np.where(is_first, indices, 0))
+
+  def node_data(self) -> Iterator[tuple[str, dict]]:
+    """
+    Same as graph.nodes(data=True).
+    """
+    standard_types = {self.types[type_id] for type_id in np.unique(self.node_type[self.is_standard]).tolist()}
+    type_attributes = {node_type: (None, ancestry_dist) for node_type, ancestry_dist in zip(self.types, self.ancestry)}
+    for node, type_id, layer_code in zip(self.nodes, self.node_type.tolist(), self.node_layer.tolist()):
+      node_type = self.types[type_id] if type_id >= 0 else None
+      yield node, make_node_attributes(node_type, LAYERS[layer_code], standard_types, type_attributes)
+
+  def edge_data(self) -> Iterator[tuple[str, str, dict]]:
+    """
+    Same as graph.edges(data=True).
+    """
+    nodes = self.nodes
+    node_layers = [LAYERS[layer_code] for layer_code in self.node_layer.tolist()]
+    layer_pairs = {}
+    for source_id, target_id, relation_value in zip(self.edge_sources().tolist(), self.edge_targets.tolist(), self.edge_relations.tolist()):
+      layers = (node_layers[source_id], node_layers[target_id])
+      yield nodes[source_id], nodes[target_id], {
+        'relation': _RELATION_NAMES[relation_value],
+        'layers': layer_pairs.setdefault(layers, layers),
+      }
+
+  def to_multidigraph(self) -> nx.MultiDiGraph:
+    graph = nx.MultiDiGraph(aliases=self.aliases)
+    graph.add_nodes_from(self.node_data())
+    graph.add_edges_from(self.edge_data())
+    return graph
+
+  def node_link_data(self) -> dict:
+    """
+    Same as nx.node_link_data(graph, edges='edges'), for JSON.
+    """
+    return {
+      'directed': True,
+      'multigraph': True,
+      'graph': {'aliases': self.aliases},
+      'nodes': [{**attributes, 'id': node} for node, attributes in self.node_data()],
+      'edges': [
+        {**attributes, 'source': source, 'target': target, 'key': key}
+        for (source, target, attributes), key in zip(self.edge_data(), self.edge_keys().tolist())
+      ],
+    }
 
+"""
+The CompactGraph of a compiled graph. compile_spec(spec, compact=True) makes one
+without building the networkx graph first.
+"""
+def make_compact_graph(graph: nx.MultiDiGraph) -> CompactGraph:
+  node_types = []
+  node_layers = []
+  ancestry = {}  # {type_name: ancestry_distances}
+  standard_types = set()
+  for _, attributes in graph.nodes(data=True):
+    node_type = attributes.get('type')
+    node_types.append(node_type)
+    node_layers.append(attributes['layer'])
+    if node_type is not None:
+      ancestry.setdefault(node_type, attributes.get('ancestry_distances'))
+      if attributes.get('is_standard'):
+        standard_types.add(node_type)
 
-  return combined_graph
+  edges = ((source, rel[attributes['relation']]._value_, target) for source, target, attributes in graph.edges(data=True))
+  return _make_compact_graph(list(graph), edges, node_types, node_layers, ancestry, standard_types, graph.graph.get('aliases', {}))
+
+"""
+For code that needs networkx (eg. graph edit distance) but might be given either form.
+"""
+def as_multidigraph(graph: 'nx.MultiDiGraph | CompactGraph') -> nx.MultiDiGraph:
+  return graph.to_multidigraph() if isinstance(graph, CompactGraph) else graph
+
+"""
+edges are (source, relation value, target), and the node_* lists go with nodes.
+"""
+def _make_compact_graph(
+    nodes: list[str],
+    edges: Iterable[tuple[str, int, str]],
+    node_types: list[str | None],
+    node_layers: list[str],
+    ancestry: Mapping[str, FrozenDict | None],
+    standard_types: Container[str],
+    aliases: dict[str, str],
+  ) -> CompactGraph:
+  num_nodes = len(nodes)
+  node_ids = {node: node_id for node_id, node in enumerate(nodes)}
+  type_ids = dict.fromkeys(node_type for node_type in node_types if node_type is not None)
+  type_ids = {node_type: type_id for type_id, node_type in enumerate(type_ids)}
+
+  node_type = np.fromiter((type_ids.get(node_type, -1) for node_type in node_types), dtype=np.int32, count=num_nodes)
+  node_layer = np.fromiter((_LAYER_CODES[layer] for layer in node_layers), dtype=np.int8, count=num_nodes)
+  # Untyped nodes (-1) get the extra False at the end.
+  is_standard = np.array([node_type in standard_types for node_type in type_ids] + [False])[node_type]
+
+  # Lay edges out the way networkx iterates them: by source, then by target in
+  # the order they first appear with that source.
+  # {source_id: {target_id: [relation values]}}
+  adjacency = {}
+  for source, relation_value, target in edges:
+    adjacency.setdefault(node_ids[source], {}).setdefault(node_ids[target], []).append(relation_value)
+
+  degrees = [0] * num_nodes
+  edge_targets = []
+  edge_relations = []
+  for source_id in sorted(adjacency):
+    for target_id, relation_values in adjacency[source_id].items():
+      edge_targets.extend(itertools.repeat(target_id, len(relation_values)))
+      edge_relations.extend(relation_values)
+      degrees[source_id] += len(relation_values)
+
+  edge_offsets = np.zeros(num_nodes + 1, dtype=np.int64)
+  np.cumsum(np.array(degrees, dtype=np.int64), out=edge_offsets[1:])
+  return CompactGraph(
+    nodes=tuple(nodes),
+    node_ids=node_ids,
+    types=tuple(type_ids),
+    ancestry=tuple(ancestry[node_type] for node_type in type_ids),
+    node_type=node_type,
+    node_layer=node_layer,
+    is_standard=is_standard,
+    edge_offsets=edge_offsets,
+    edge_targets=np.array(edge_targets, dtype=np.int32),
+    edge_relations=np.array(edge_relations, dtype=np.int8),
+    aliases=aliases,
+  )
+
+# --- Incremental Compile
+"""
+What produced a node or an edge of a compiled graph (see IncrementalCompile).
+
+kind       : 'strong', 'weak' or 'type'
+declaration: the spec's declaration. For 'type', it's the type's declaration,
+             instantiated for instance.
+instance   : for 'type', the instance whose type made the declaration
+"""
+class Provenance(NamedTuple):
+  kind: str
+  declaration: tuple
+  instance: str | None = None
+
+"""
+How an update changed the compiled graph. Edges are (source, relation, target).
+changed_nodes were already in the graph, but their attributes changed.
+"""
+class GraphDelta(NamedTuple):
+  added_nodes: list[str]
+  removed_nodes: list[str]
+  changed_nodes: list[str]
+  added_edges: list[tuple[str, parser.rel, str]]
+  removed_edges: list[tuple[str, parser.rel, str]]
+
+def _type_definition_statements(spec: list) -> list:
+  # The top-level statements that parser.parse_type_definitions looks at (it also
+  # checks that dicts have one key).
+  assert type(spec) is list, 'Top level of YAML specification must be a list.'
+  return [
+    statement for statement in spec
+    if (type(statement) is str and statement[:4] == 'def ')
+      or (type(statement) is dict and (len(statement) != 1 or str(next(iter(statement)))[:4] == 'def '))
+  ]
+
+"""
+Keeps a compiled graph up to date as its spec is edited, eg. in an editor loop:
+
+  incremental = IncrementalCompile()
+  incremental.update(spec)         # compiles everything
+  delta = incremental.update(edited_spec)  # only redoes what the edit touched
+  incremental.graph                # same as compile_spec(edited_spec), changed in place
+
+Every node and edge keeps the declarations that produced it (see node_provenance
+and edge_provenance), so removing a declaration only removes what nothing else
+produces. An edit redoes:
+- alias declarations: the alias classes, and the declarations that mention a renamed node
+- strong declarations: their edges, and the weak edges of nodes that became (or
+  stopped being) strong nodes
+- type declarations, or strong nodes that a type declares: the type registry, and
+  the declarations of the instances whose type changed
+- grouping edges or types: the layers
+Editing a type definition or the standard library recompiles everything, and so
+does the update after one that failed.
+
+NOTE: the graph's nodes and edges aren't in the same order as compile_spec's. So
+when a presentation and an action node are equally near a node, the layer it gets
+can differ (see propagate_layers).
+"""
+class IncrementalCompile:
+  def __init__(self):
+    self.parse = parser.IncrementalParse()
+    self.graph = nx.MultiDiGraph(aliases={})
+    self._type_definitions = None  # of the spec, None to recompile everything
+    self._definition_statements = None
+    self._standard = None
+    self.hierarchy = None
+    self._clear()
+
+  def _clear(self):
+    self._alias_registry = {}
+    # Spec declarations that make edges (whether or not they're in the graph)
+    self._resolved = {}                # {declaration: (source, relation, target)}, with aliases
+    self._declarations_by_name = {}    # {name before aliasing: {declaration: None}}
+    self._strong_edges = {}            # {(source, relation, target): {Provenance: None}}
+    self._weak_edges = {}              # same, whether or not both ends are strong nodes
+    self._weak_edges_by_node = {}      # {node: {(source, relation, target): None}}
+    self._strong_nodes = {}            # {node: {Provenance: count}}, the ends of strong edges
+    self._strong_node_set = set()      # strong nodes as of the last update
+    # Types
+    self._spec_type_declarations = {}  # {node: {type_name: {declaration: None}}}, the spec's strong type declarations
+    self._spec_types = {}              # {node: type_name}
+    # The type registry extension is traced from each node in _spec_types on its own,
+    # so that an edit only redoes the traces it affects.
+    self._traces = {}                  # {node: TypeRegistryTrace}
+    self._claims = {}                  # {node: {traced node: type_name}}, the traces that tag node
+    self._examiners = {}               # {node: {traced node: None}}, the traces that examined node
+    self._conflicts = set()            # nodes that traces tag with different types
+    self._is_traced_together = False   # whether the registry is from one trace of every node (see _update_type_registry)
+    self._type_registry = {}           # {node: type_name}, including what types declare
+    self._type_origins = {}            # {node: (instance, declaration)}, for what types declare
+    self._instance_edges = {}          # {instance: [((source, relation, target), Provenance)]}
+    self._type_attributes = {}         # {type_name: (layer, ancestry_distances)}
+    # The graph
+    self._edge_keys = {}               # {(source, relation, target): key in graph}
+    self._node_degrees = {}            # {node: number of edge ends at node}
+    self._grouped = {}                 # {node: {grouped node: None}}, the rel.GROUP_FOREACH edges
+    self._layers = {}                  # {node: layer}, the layers that aren't conceptual
+    self._layer_pairs = {}
+
+  def _restart(self, type_definitions: tuple, standard: StandardLibrary) -> tuple[list, list]:
+    # Start over with new types, returning what was in the graph.
+    removed_nodes = list(self.graph.nodes)
+    removed_edges = list(self._edge_keys)
+    self.graph.clear()
+    self.graph.graph['aliases'] = {}
+    self._clear()
+    self.parse = parser.IncrementalParse()
+
+    type_interps, type_parents = type_definitions
+    self.hierarchy = standard.hierarchy.extend(type_interps | standard.hierarchy.type_interps, type_parents | standard.hierarchy.type_parents)
+    self._templates = self.hierarchy.templates()
+    self._type_definitions = type_definitions
+    self._standard = standard
+    return removed_nodes, removed_edges
+
+  def update(self, spec: list) -> GraphDelta:
+    """
+    Compile spec, reusing what the previous update compiled. Returns how the graph changed.
+    """
+    # Type definitions are only parsed again if they changed.
+    definition_statements = _type_definition_statements(spec)
+    standard = load_standard_library()
+    removed_nodes, removed_edges = [], []
+    if self._type_definitions is None or definition_statements != self._definition_statements or standard is not self._standard:
+      type_definitions = parser.parse_type_definitions(definition_statements)
+      if type_definitions != self._type_definitions or standard is not self._standard:
+        removed_nodes, removed_edges = self._restart(type_definitions, standard)
+      self._definition_statements = definition_statements
+
+    declaration_delta = self.parse.update(spec)
+    try:
+      delta = self.apply(declaration_delta, self.parse.interp)
+    except BaseException:
+      self._type_definitions = None  # the compile is half done, so start over next time
+      raise
+
+    if removed_nodes or removed_edges:
+      delta = delta._replace(removed_nodes=removed_nodes + delta.removed_nodes, removed_edges=removed_edges + delta.removed_edges)
+    return delta
+
+  def apply(self, delta: parser.DeclarationDelta, interp: tuple) -> GraphDelta:
+    """
+    Update the graph with the declarations that were added and removed. interp is
+    the parse that delta leads to (eg. IncrementalParse.interp); aliases and types
+    are taken from it in order, so they match compile_spec's.
+    """
+    assert self.hierarchy is not None, 'The types need to be set by update before applying declarations.'
+    table = interp[0]
+    self._touched_edges = {}
+    self._touched_nodes = {}
+    self._touched_spec_types = {}
+
+    # --- Aliases
+    aliases_changed = any(parser.get_declaration_relation(declaration) is rel.ALIAS for declaration in itertools.chain(delta.added, delta.removed))
+    previous_registry = self._alias_registry
+    redone = {}
+    renamed = set()
+    if aliases_changed:
+      aliases = AliasResolver()
+      for declaration in table.by_relation(rel.ALIAS):
+        aliases.union(parser.get_declaration_source(declaration), parser.get_declaration_target(declaration))
+      alias_registry = aliases.registry()
+
+      # Declarations that mention a renamed node are redone.
+      for name in dict.fromkeys(itertools.chain(previous_registry, alias_registry)):
+        if previous_registry.get(name, name) != alias_registry.get(name, name):
+          renamed.add(name)
+          redone.update(self._declarations_by_name.get(name, {}))
+
+      self._alias_registry = alias_registry
+      self.graph.graph['aliases'] = alias_registry
+
+    # --- Declarations
+    for declaration in itertools.chain(delta.removed, redone):
+      self._retract(declaration)
+    removed = set(delta.removed)
+    for declaration in itertools.chain((declaration for declaration in redone if declaration not in removed), delta.added):
+      self._contribute(declaration)
+
+    # Weak edges only go between strong nodes, and types only declare strong nodes.
+    retraced = {}
+    for node in self._touched_nodes:
+      is_strong = node in self._strong_nodes
+      if is_strong != (node in self._strong_node_set):
+        if is_strong:
+          self._strong_node_set.add(node)
+        else:
+          self._strong_node_set.discard(node)
+        self._touched_edges.update(self._weak_edges_by_node.get(node, {}))
+        retraced.update(self._examiners.get(node, {}))
+
+    # --- Types
+    for node in self._touched_spec_types:
+      type_names = list(self._spec_type_declarations.get(node, ()))
+      assert len(type_names) <= 1, f'Double type assignment: Trying to assign `({type_names[-1]})` to `{node}`, but it already has type ({type_names[0]}). Is this an alias problem?'
+      type_name = type_names[0] if type_names else None
+      if type_name != self._spec_types.get(node):
+        if type_name is None:
+          del self._spec_types[node]
+        else:
+          self._spec_types[node] = type_name
+        retraced[node] = None
+
+    if renamed:
+      if any(name in self._templates for name in renamed):
+        retraced.update(self._traces)  # a type was aliased (!)
+      # Traces that looked at a renamed node are redone.
+      for name in renamed:
+        retraced.update(self._examiners.get(previous_registry.get(name, name), {}))
+
+    retyped = {}
+    if retraced or renamed:
+      retyped = self._update_type_registry(table, retraced, renamed)
+
+    return self._update_graph(retyped)
+
+  def _get_alias(self, name: str) -> str:
+    return lookup_alias(self._alias_registry, name)
+
+  def _contribute(self, declaration: tuple):
+    source, relation, target, power = declaration
+    if power is dpower.STRONG:
+      # Like the strong declaration pass, types and aliases aren't edges.
+      if relation in (rel.TBD, rel.ALIAS):
+        return
+      provenance = Provenance('strong', declaration)
+    elif power is dpower.WEAK:
+      provenance = Provenance('weak', declaration)
+    else:
+      return  # Question declarations aren't compiled yet.
+
+    edge = (self._get_alias(source), relation, self._get_alias(target))
+    self._resolved[declaration] = edge
+    for name in (source, target):
+      self._declarations_by_name.setdefault(name, {})[declaration] = None
+    if power is not dpower.STRONG:
+      self._add_weak_edge(edge, provenance)
+    elif relation is rel.TYPE:
+      # Tag node (target) with the type (source)
+      self._spec_type_declarations.setdefault(edge[2], {}).setdefault(edge[0], {})[declaration] = None
+      self._touched_spec_types[edge[2]] = None
+    else:
+      self._add_strong_edge(edge, provenance)
+
+  def _retract(self, declaration: tuple):
+    edge = self._resolved.pop(declaration, None)
+    if edge is None:
+      return
+    for name in (declaration[0], declaration[2]):
+      declarations = self._declarations_by_name[name]
+      declarations.pop(declaration, None)
+      if not declarations:
+        del self._declarations_by_name[name]
+
+    source, relation, target = edge
+    if parser.get_declaration_power(declaration) is not dpower.STRONG:
+      self._remove_weak_edge(edge, Provenance('weak', declaration))
+    elif relation is rel.TYPE:
+      type_declarations = self._spec_type_declarations[target]
+      del type_declarations[source][declaration]
+      if not type_declarations[source]:
+        del type_declarations[source]
+        if not type_declarations:
+          del self._spec_type_declarations[target]
+      self._touched_spec_types[target] = None
+    else:
+      self._remove_strong_edge(edge, Provenance('strong', declaration))
+
+  def _add_strong_edge(self, edge: tuple, provenance: Provenance):
+    self._strong_edges.setdefault(edge, {})[provenance] = None
+    self._touched_edges[edge] = None
+    for node in (edge[0], edge[2]):
+      references = self._strong_nodes.setdefault(node, {})
+      references[provenance] = references.get(provenance, 0) + 1
+      self._touched_nodes[node] = None
+
+  def _remove_strong_edge(self, edge: tuple, provenance: Provenance):
+    producers = self._strong_edges[edge]
+    del producers[provenance]
+    if not producers:
+      del self._strong_edges[edge]
+    self._touched_edges[edge] = None
+    for node in (edge[0], edge[2]):
+      references = self._strong_nodes[node]
+      references[provenance] -= 1
+      if references[provenance] == 0:
+        del references[provenance]
+        if not references:
+          del self._strong_nodes[node]
+      self._touched_nodes[node] = None
+
+  def _add_weak_edge(self, edge: tuple, provenance: Provenance):
+    self._weak_edges.setdefault(edge, {})[provenance] = None
+    self._touched_edges[edge] = None
+    for node in (edge[0], edge[2]):
+      self._weak_edges_by_node.setdefault(node, {})[edge] = None
+
+  def _remove_weak_edge(self, edge: tuple, provenance: Provenance):
+    producers = self._weak_edges[edge]
+    del producers[provenance]
+    self._touched_edges[edge] = None
+    if producers:
+      return
+    del self._weak_edges[edge]
+    for node in (edge[0], edge[2]):
+      edges = self._weak_edges_by_node.get(node)
+      if edges is not None:
+        edges.pop(edge, None)
+        if not edges:
+          del self._weak_edges_by_node[node]
+
+  def _trace(self, node: str):
+    type_name = self._spec_types.get(node)
+    if type_name is None:
+      return
+    trace = self._traces[node] = trace_type_registry_extension({node: type_name}, self._templates, self._strong_node_set, self._get_alias)
+    for tagged_node, tagged_type in trace.extension.items():
+      claims = self._claims.setdefault(tagged_node, {})
+      claims[node] = tagged_type
+      if len(set(claims.values())) > 1:
+        self._conflicts.add(tagged_node)
+    for examined_node in trace.examined:
+      self._examiners.setdefault(examined_node, {})[node] = None
+
+  def _untrace(self, node: str):
+    trace = self._traces.pop(node, None)
+    if trace is None:
+      return
+    for tagged_node in trace.extension:
+      claims = self._claims[tagged_node]
+      del claims[node]
+      if not claims:
+        del self._claims[tagged_node]
+      if len(set(claims.values())) <= 1:
+        self._conflicts.discard(tagged_node)
+    for examined_node in trace.examined:
+      examiners = self._examiners[examined_node]
+      del examiners[node]
+      if not examiners:
+        del self._examiners[examined_node]
+
+  def _update_type_registry(self, table: parser.DeclarationTable, retraced: dict[str, None], renamed: set[str]) -> dict[str, None]:
+    # Redoes the traces of the type registry extension, then the weak declarations
+    # of the instances whose type changed, or that mention a renamed node. Returns
+    # the nodes whose type changed.
+    changed = dict(retraced)  # nodes whose type might have changed
+    for node in retraced:
+      changed.update(dict.fromkeys(self._traces[node].extension if node in self._traces else ()))
+      self._untrace(node)
+      self._trace(node)
+      changed.update(dict.fromkeys(self._traces[node].extension if node in self._traces else ()))
+
+    previous_registry = self._type_registry
+    previous_types = {node: previous_registry.get(node) for node in changed}
+    if self._conflicts:
+      # Traces disagree on a node's type, so it depends on which tags it last (see
+      # trace_type_registry_extension). Everything is traced at once, in the same
+      # order as compile_spec.
+      spec_types = {}
+      for declaration in table.by_relation(rel.TYPE):
+        if parser.get_declaration_power(declaration) is dpower.STRONG:
+          spec_types[self._get_alias(parser.get_declaration_target(declaration))] = self._get_alias(parser.get_declaration_source(declaration))
+      trace = trace_type_registry_extension(spec_types, self._templates, self._strong_node_set, self._get_alias)
+      self._type_registry = spec_types | trace.extension
+      self._type_origins = dict(trace.origins)
+      self._is_traced_together = True
+      changed = dict.fromkeys(itertools.chain(previous_registry, self._type_registry))
+      previous_types = previous_registry
+    elif self._is_traced_together:
+      # Back to tracing nodes on their own.
+      self._type_registry = dict(self._spec_types)
+      self._type_origins = {}
+      for node, trace in self._traces.items():
+        self._type_registry.update(trace.extension)
+        self._type_origins.update(trace.origins)
+      self._is_traced_together = False
+      changed = dict.fromkeys(itertools.chain(previous_registry, self._type_registry))
+      previous_types = previous_registry
+    else:
+      for node in changed:
+        claims = self._claims.get(node)
+        if claims:
+          traced_node, type_name = next(iter(claims.items()))
+          self._type_registry[node] = type_name
+          self._type_origins[node] = self._traces[traced_node].origins[node]
+          continue
+        self._type_origins.pop(node, None)
+        type_name = self._spec_types.get(node)
+        if type_name is None:
+          self._type_registry.pop(node, None)
+        else:
+          self._type_registry[node] = type_name
+
+    redone = set()
+    if renamed:
+      for node, instance_edges in self._instance_edges.items():
+        if any(provenance.declaration[0] in renamed or provenance.declaration[2] in renamed for _, provenance in instance_edges):
+          redone.add(node)
+    changed.update(dict.fromkeys(redone))
+
+    retyped = {}
+    for node in changed:
+      type_name = self._type_registry.get(node)
+      if node not in redone and previous_types.get(node) == type_name:
+        continue
+      retyped[node] = None
+      for edge, provenance in self._instance_edges.pop(node, ()):
+        self._remove_weak_edge(edge, provenance)
+      if type_name is None:
+        continue
+
+      type_template = self._templates.get(type_name, None)
+      assert type_template is not None, f'Type `{type_name}` was used with `{node}` but not declared.'
+      instance_edges = []
+      for declaration in instantiate(type_template.weak_declarations, node):
+        edge = (self._get_alias(declaration[0]), declaration[1], self._get_alias(declaration[2]))
+        provenance = Provenance('type', declaration, node)
+        self._add_weak_edge(edge, provenance)
+        instance_edges.append((edge, provenance))
+      self._instance_edges[node] = instance_edges
+
+    return retyped
+
+  def _type_attributes_of(self, node_type: str) -> tuple[str, FrozenDict | None]:
+    type_attributes = self._type_attributes.get(node_type)
+    if type_attributes is None:
+      type_attributes = self._type_attributes[node_type] = make_type_attributes(self.hierarchy, node_type)
+    return type_attributes
+
+  def _update_graph(self, retyped: dict[str, None]) -> GraphDelta:
+    strong_node_set = self._strong_node_set
+    added_edges = []
+    removed_edges = []
+    for edge in self._touched_edges:
+      source, relation, target = edge
+      is_present = edge in self._strong_edges or (edge in self._weak_edges and source in strong_node_set and target in strong_node_set)
+      if is_present != (edge in self._edge_keys):
+        (added_edges if is_present else removed_edges).append(edge)
+
+    # - Nodes are the ends of edges, and typed nodes.
+    grouping_changed = False
+    touched_nodes = dict(retyped)
+    for edges, change in ((removed_edges, -1), (added_edges, 1)):
+      for source, relation, target in edges:
+        for node in (source, target):
+          self._node_degrees[node] = self._node_degrees.get(node, 0) + change
+          touched_nodes[node] = None
+        if relation is rel.GROUP_FOREACH:
+          grouping_changed = True
+          if change > 0:
+            self._grouped.setdefault(source, {})[target] = None
+          else:
+            del self._grouped[source][target]
+            if not self._grouped[source]:
+              del self._grouped[source]
+
+    added_nodes = []
+    removed_nodes = []
+    for node in touched_nodes:
+      is_present = self._node_degrees.get(node, 0) > 0 or node in self._type_registry
+      if self._node_degrees.get(node) == 0:
+        del self._node_degrees[node]
+      if is_present != (node in self.graph):
+        (added_nodes if is_present else removed_nodes).append(node)
+
+    # - Layers
+    previous_layers = self._layers
+    relayered = {}
+    if grouping_changed or retyped:
+      node_layers = {}
+      for node, node_type in self._type_registry.items():
+        node_layer = self._type_attributes_of(node_type)[0]
+        if node_layer != 'conceptual':
+          node_layers[node] = node_layer
+      self._layers = propagate_layers(node_layers, self._grouped)
+      for node in dict.fromkeys(itertools.chain(previous_layers, self._layers)):
+        if previous_layers.get(node) != self._layers.get(node):
+          relayered[node] = None
+
+    # - Update the graph
+    graph = self.graph
+    for source, relation, target in removed_edges:
+      graph.remove_edge(source, target, key=self._edge_keys.pop((source, relation, target)))
+    graph.remove_nodes_from(removed_nodes)
+
+    added_node_set = set(added_nodes)
+    graph.add_nodes_from((node, self._node_attributes(node)) for node in added_nodes)
+    changed_nodes = []
+    for node in dict.fromkeys(itertools.chain(retyped, relayered)):
+      if node in graph and node not in added_node_set:
+        attributes = graph.nodes[node]
+        node_attributes = self._node_attributes(node)
+        if attributes != node_attributes:
+          attributes.clear()
+          attributes.update(node_attributes)
+          changed_nodes.append(node)
+
+    for edge in added_edges:
+      source, relation, target = edge
+      self._edge_keys[edge] = graph.add_edge(source, target, relation=relation.name, layers=self._edge_layers(source, target))
+    for node in relayered:
+      if node in graph:
+        for source, target, attributes in itertools.chain(graph.out_edges(node, data=True), graph.in_edges(node, data=True)):
+          attributes['layers'] = self._edge_layers(source, target)
+
+    return GraphDelta(added_nodes, removed_nodes, changed_nodes, added_edges, removed_edges)
+
+  def _node_attributes(self, node: str) -> dict:
+    node_type = self._type_registry.get(node)
+    if node_type is not None:
+      self._type_attributes_of(node_type)
+    return make_node_attributes(node_type, self._layers.get(node, 'conceptual'), self._standard.standard_types, self._type_attributes)
+
+  def _edge_layers(self, source: str, target: str) -> tuple[str, str]:
+    layers = (self._layers.get(source, 'conceptual'), self._layers.get(target, 'conceptual'))
+    return self._layer_pairs.setdefault(layers, layers)
+
+  def node_provenance(self, node: str) -> list[Provenance]:
+    """
+    The declarations that put node in the graph (strong declarations), and that gave it its type.
+    """
+    provenance = list(self._strong_nodes.get(node, {}))
+    origin = self._type_origins.get(node)
+    if origin is not None:
+      instance, declaration = origin
+      provenance.append(Provenance('type', declaration, instance))
+    elif node in self._spec_types:
+      provenance.extend(Provenance('strong', declaration) for declaration in self._spec_type_declarations[node][self._spec_types[node]])
+    return provenance
+
+  def edge_provenance(self, source: str, relation: parser.rel, target: str) -> list[Provenance]:
+    """
+    The declarations that made the edge, or [] if it isn't in the graph.
+    """
+    edge = (source, relation, target)
+    if edge not in self._edge_keys:
+      return []
+    return [*self._strong_edges.get(edge, {}), *self._weak_edges.get(edge, {})]
 
 # ---- Presenting Results ----
+# These take either a networkx graph or a CompactGraph.
+def node_data(graph: 'nx.MultiDiGraph | CompactGraph'):
+  return graph.node_data() if isinstance(graph, CompactGraph) else graph.nodes.data()
+
+def edge_data(graph: 'nx.MultiDiGraph | CompactGraph'):
+  return graph.edge_data() if isinstance(graph, CompactGraph) else graph.edges.data()
+
+def node_link_data(graph: 'nx.MultiDiGraph | CompactGraph') -> dict:
+  return graph.node_link_data() if isinstance(graph, CompactGraph) else nx.node_link_data(graph, edges='edges')
+
 # --- Printing Graphs
-def print_graph(graph: nx.MultiDiGraph):
-  nodes = graph.nodes().data()
-  edges = graph.edges.data()
+def print_graph(graph: 'nx.MultiDiGraph | CompactGraph'):
+  nodes = list(node_data(graph))
+  edges = list(edge_data(graph))
   print(f'-- {len(nodes)} nodes, {len(edges)} edges')
   print('-- Nodes')
   for node in nodes:
@@ -414,13 +1639,13 @@ def print_graph(graph: nx.MultiDiGraph):
     relation = attr.get('relation')
     print(f'{source} -{relation}-> {target}')
 
-def get_type_stats(graph: nx.MultiDiGraph, verbose=False):
+def get_type_stats(graph: 'nx.MultiDiGraph | CompactGraph', verbose=False):
   if verbose:
-    print(f'nodes: {len(graph.nodes())}, edges: {len(list(graph.edges))}')
+    print(f'nodes: {graph.number_of_nodes()}, edges: {graph.number_of_edges()}')
 
   node_types = {} # {str(node): int(count)}
   non_standard_types = set()
-  for node, attr in graph.nodes().items():
+  for node, attr in node_data(graph):
     node_type = attr.get('type')
     if attr.get('is_standard'):
       node_types[node_type] = 1 + node_types.get(node_type, 0)
@@ -435,7 +1660,7 @@ def get_type_stats(graph: nx.MultiDiGraph, verbose=False):
     print(non_standard_types)
   
   edge_types = {}  # {relation type: count}
-  for edge in graph.edges.data():
+  for edge in edge_data(graph):
     source, target, attr = edge
     relation = attr.get('relation')
     edge_types[relation] = 1 + edge_types.get(relation, 0)
@@ -447,7 +1672,7 @@ def get_type_stats(graph: nx.MultiDiGraph, verbose=False):
 
 # --- Mermaid Visualization ---
 def mermaid_graph_core(
-    graph: nx.MultiDiGraph,
+    graph: 'nx.MultiDiGraph | CompactGraph',
     should_color_node: callable,
     should_color_edge: callable,
     pad: str,
@@ -458,7 +1683,7 @@ def mermaid_graph_core(
   
   mermaid = f"{pad}classDef Highlighted fill:#fbcef6,stroke:#8353e4;\n\n"
   # --- List nodes
-  for node_name, attributes in graph.nodes.data():
+  for node_name, attributes in node_data(graph):
     # Prefix (type) if it exists.
     node_type = attributes.get('type', None)
     type_prefix = ''
@@ -479,7 +1704,7 @@ def mermaid_graph_core(
   # of appearance: https://mermaid.js.org/syntax/flowchart.html#styling-links
   highlighted_links = []
   link_count = 0
-  for source, target, attributes in graph.edges.data():
+  for source, target, attributes in edge_data(graph):
     assert (
       source in id_dict.keys()
     ), f"missing source from edge: {source} (~~> {target})"
@@ -506,7 +1731,7 @@ def mermaid_graph_core(
   
 
 def mermaid_graph(
-    graph: nx.MultiDiGraph,
+    graph: 'nx.MultiDiGraph | CompactGraph',
     should_color_node: callable = None,
     should_color_edge: callable = None,
     verbose=False):
@@ -545,5 +1770,9 @@ if __name__ == '__main__':
       print(f'Skipping `{spec_file}` because it does not exist.')
       continue
 
-    test_graph = compile(spec_file, verbose=args.verbose)
+    stats = CompileStats()
+    test_graph = compile(spec_file, verbose=args.verbose, stats=stats)
     mermaid_graph(test_graph, verbose=True)
+    if args.profile:
+      print(f'\n--- Compiler passes ({spec_file}) ---')
+      print(stats.format())
@@ -28,7 +28,7 @@ specs_image_names = {
 
 specs = get_specs()
 for [spec, yaml] in specs.items():
-    lookup = parser.make_relations(yaml, False)[1]
+    lookup = parser.compact_lookup(parser.make_relations(yaml, False))
     image_names = []
     if spec in specs_image_names:
         image_names = specs_image_names[spec]
@@ -45,8 +45,8 @@ analogies = [
 ]
 
 for analogy in analogies:
-    a = compiler.compile_spec(specs[analogy["inputs"][0]]["yaml"])
-    b = compiler.compile_spec(specs[analogy["inputs"][1]]["yaml"])
+    a = compiler.compile_cached(specs[analogy["inputs"][0]]["yaml"])
+    b = compiler.compile_cached(specs[analogy["inputs"][1]]["yaml"])
     cv_metalgo, _ = metalgo.compute_analogy(a, b, timeout=60)
     analogy["analogy"] = cv_metalgo[0]
 
@@ -0,0 +1,563 @@
+"""
+Graph edit distance search for analogies (see metalgo.compute_analogy).
+
+optimize_edit_paths is a replacement for nx.optimize_edit_paths with the same
+contract: a generator of (node_edit_path, edge_edit_path, cost), each cheaper than
+the last, until the search is done or times out. It's built for compiled graphs,
+which have few kinds of nodes and edges:
+
+- Nodes and edges are given integer label codes. A label is everything a node's
+  (or an edge's) costs depend on, which by default is all of its attributes. The
+  cost functions are only called once per pair of labels.
+- G1's nodes are matched one at a time, depth-first, cheapest estimate first. An
+  edge is costed as soon as both of its ends are matched (or one is deleted).
+- The estimate of what's left is a lower bound from label counts. Edges that are
+  left are grouped by the matched node they hang off, since they can only be
+  matched to edges that hang off that node's match.
+
+Only directed graphs are supported, like the compiler's.
+"""
+import itertools
+import timeit
+from typing import NamedTuple, Sequence
+
+import networkx as nx
+import numpy as np
+import scipy.optimize
+
+_UNMATCHED = -2  # G1 node that hasn't been matched yet
+_DELETED = -1    # G1 node that was matched to nothing
+
+"""
+A hashable version of an attribute value, so that attributes can be labels.
+"""
+def _freeze(value):
+  if isinstance(value, dict):
+    return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+  if isinstance(value, (list, tuple)):
+    return tuple(_freeze(item) for item in value)
+  if isinstance(value, set):
+    return frozenset(_freeze(item) for item in value)
+  return value
+
+"""
+The default label: all of the attributes.
+"""
+def attribute_label(attributes: dict):
+  return _freeze(attributes)
+
+"""
+Integer codes for labels, and a representative attribute dict for each, which is
+what the cost functions are called with.
+"""
+class _Labels:
+  def __init__(self, label: callable):
+    self.label = label
+    self.codes = {}
+    self.attributes = []
+
+  def code(self, attributes: dict) -> int:
+    label = self.label(attributes)
+    code = self.codes.get(label)
+    if code is None:
+      code = self.codes[label] = len(self.attributes)
+      self.attributes.append(attributes)
+    return code
+
+"""
+Cost of matching two groups of parallel edges (the edges from one node to another)
+given their label codes, and which edge goes with which: (i, j), (i, None) or (None, j).
+"""
+class _ParallelEdges:
+  def __init__(self, edge_subst: list[list[float]], edge_del: list[float], edge_ins: list[float]):
+    self.edge_subst = edge_subst
+    self.edge_del = edge_del
+    self.edge_ins = edge_ins
+    self._matches = {}
+
+  def cost(self, labels1: tuple, labels2: tuple) -> float:
+    if not labels2:
+      return sum(self.edge_del[label] for label in labels1)
+    if not labels1:
+      return sum(self.edge_ins[label] for label in labels2)
+    if len(labels1) == 1 and len(labels2) == 1:
+      label1, = labels1
+      label2, = labels2
+      return min(self.edge_subst[label1][label2], self.edge_del[label1] + self.edge_ins[label2])
+    return self.match(labels1, labels2)[0]
+
+  def match(self, labels1: tuple, labels2: tuple) -> tuple[float, list[tuple]]:
+    key = (labels1, labels2)
+    match = self._matches.get(key)
+    if match is None:
+      match = self._matches[key] = self._assign(labels1, labels2)
+    return match
+
+  def _assign(self, labels1: tuple, labels2: tuple) -> tuple[float, list[tuple]]:
+    # The usual square cost matrix: substitutions, then deletions and insertions on
+    # the diagonals of their blocks. Groups are small, so this is cheap.
+    m = len(labels1)
+    n = len(labels2)
+    forbidden = sum(self.edge_del[label] for label in labels1) + sum(self.edge_ins[label] for label in labels2) + 1
+    costs = np.zeros((m + n, m + n))
+    costs[:m, :n] = [[self.edge_subst[label1][label2] for label2 in labels2] for label1 in labels1]
+    costs[:m, n:] = forbidden
+    costs[m:, :n] = forbidden
+    costs[range(m), range(n, n + m)] = [self.edge_del[label] for label in labels1]
+    costs[range(m, m + n), range(n)] = [self.edge_ins[label] for label in labels2]
+    rows, columns = scipy.optimize.linear_sum_assignment(costs)
+
+    pairs = []
+    for row, column in zip(rows.tolist(), columns.tolist()):
+      if row < m or column < n:
+        pairs.append((row if row < m else None, column if column < n else None))
+    return float(costs[rows, columns].sum()), pairs
+
+"""
+What the search needs to know about the costs: a label code for each node and edge
+(in the order of G.nodes and G.edges), and the costs of labels, indexed by code.
+Codes are shared between G1 and G2.
+"""
+class Costs(NamedTuple):
+  node_codes1: Sequence[int]
+  node_codes2: Sequence[int]
+  node_subst: Sequence[Sequence[float]]  # [G1 code][G2 code]
+  node_del: Sequence[float]
+  node_ins: Sequence[float]
+  edge_codes1: Sequence[int]
+  edge_codes2: Sequence[int]
+  edge_subst: Sequence[Sequence[float]]
+  edge_del: Sequence[float]
+  edge_ins: Sequence[float]
+
+"""
+Costs from cost functions of attribute dicts, which are only called once per pair
+of labels.
+"""
+def label_costs(
+  G1: nx.DiGraph,
+  G2: nx.DiGraph,
+  node_subst_cost: callable,
+  node_del_cost: callable,
+  node_ins_cost: callable,
+  edge_subst_cost: callable,
+  edge_del_cost: callable,
+  edge_ins_cost: callable,
+  node_label: callable = attribute_label,
+  edge_label: callable = attribute_label,
+) -> Costs:
+  node_labels = _Labels(node_label)
+  node_codes1 = [node_labels.code(attributes) for _, attributes in G1.nodes(data=True)]
+  node_codes2 = [node_labels.code(attributes) for _, attributes in G2.nodes(data=True)]
+  node_attributes = node_labels.attributes
+  labels1 = set(node_codes1)
+  labels2 = set(node_codes2)
+  node_subst = [[0.0] * len(node_attributes) for _ in node_attributes]
+  for code1, code2 in itertools.product(labels1, labels2):
+    node_subst[code1][code2] = node_subst_cost(node_attributes[code1], node_attributes[code2])
+  node_del = [node_del_cost(attributes) if code in labels1 else 0.0 for code, attributes in enumerate(node_attributes)]
+  node_ins = [node_ins_cost(attributes) if code in labels2 else 0.0 for code, attributes in enumerate(node_attributes)]
+
+  edge_labels = _Labels(edge_label)
+  edge_codes1 = [edge_labels.code(attributes) for *_, attributes in G1.edges(data=True)]
+  edge_codes2 = [edge_labels.code(attributes) for *_, attributes in G2.edges(data=True)]
+  edge_attributes = edge_labels.attributes
+  labels1 = set(edge_codes1)
+  labels2 = set(edge_codes2)
+  edge_subst = [[0.0] * len(edge_attributes) for _ in edge_attributes]
+  for code1, code2 in itertools.product(labels1, labels2):
+    edge_subst[code1][code2] = edge_subst_cost(edge_attributes[code1], edge_attributes[code2])
+  edge_del = [edge_del_cost(attributes) if code in labels1 else 0.0 for code, attributes in enumerate(edge_attributes)]
+  edge_ins = [edge_ins_cost(attributes) if code in labels2 else 0.0 for code, attributes in enumerate(edge_attributes)]
+
+  return Costs(node_codes1, node_codes2, node_subst, node_del, node_ins, edge_codes1, edge_codes2, edge_subst, edge_del, edge_ins)
+
+"""
+Edit paths from G1 to G2, like nx.optimize_edit_paths. The costs are functions of
+attribute dicts, and they have to only depend on what node_label and edge_label
+return (by default, all of the attributes). Alternatively, costs can be given
+already worked out (eg. NumPy arrays), and then the cost functions aren't needed.
+Substitutions that cost inf are never made, so they can rule out pairs of nodes or
+edges altogether.
+
+Yields (node_edit_path, edge_edit_path, cost), where node_edit_path is [(u, v)],
+edge_edit_path is [(G1 edge, G2 edge)] with edges as in G.edges (ie. with keys for
+multigraphs), and None stands for deletions and insertions. With strictly_decreasing,
+every path is cheaper than the last; otherwise, paths that cost the same as the
+best so far are yielded too.
+"""
+def optimize_edit_paths(
+  G1: nx.DiGraph,
+  G2: nx.DiGraph,
+  node_subst_cost: callable = None,
+  node_del_cost: callable = None,
+  node_ins_cost: callable = None,
+  edge_subst_cost: callable = None,
+  edge_del_cost: callable = None,
+  edge_ins_cost: callable = None,
+  node_label: callable = attribute_label,
+  edge_label: callable = attribute_label,
+  strictly_decreasing=True,
+  timeout: float | None = None,
+  costs: Costs | None = None,
+):
+  assert G1.is_directed() and G2.is_directed(), 'Only directed graphs are supported.'
+  assert timeout is None or timeout > 0, 'Timeout value must be greater than 0'
+  start_time = timeit.default_timer()
+
+  # --- Labels and costs
+  if costs is None:
+    costs = label_costs(G1, G2, node_subst_cost, node_del_cost, node_ins_cost, edge_subst_cost, edge_del_cost, edge_ins_cost, node_label, edge_label)
+  # Lists, since indexing them is faster than indexing arrays.
+  node_codes1, node_codes2, node_subst, node_del, node_ins, edge_codes1, edge_codes2, edge_subst, edge_del, edge_ins = (
+    np.asarray(table).tolist() for table in costs
+  )
+  nodes1 = list(G1.nodes)
+  nodes2 = list(G2.nodes)
+  assert len(node_codes1) == len(nodes1) and len(node_codes2) == len(nodes2), 'Every node needs a label code.'
+  num_node_labels = len(node_subst)
+  labels1 = sorted(set(node_codes1))
+  labels2 = sorted(set(node_codes2))
+
+  edges1 = list(G1.edges(keys=True) if G1.is_multigraph() else G1.edges)
+  edges2 = list(G2.edges(keys=True) if G2.is_multigraph() else G2.edges)
+  assert len(edge_codes1) == len(edges1) and len(edge_codes2) == len(edges2), 'Every edge needs a label code.'
+  num_edge_labels = len(edge_subst)
+  edge_labels1 = set(edge_codes1)
+  edge_labels2 = set(edge_codes2)
+  parallel = _ParallelEdges(edge_subst, edge_del, edge_ins)
+
+  # Edges that are left over are bounded per group of labels, where edges from
+  # different groups are never cheaper to substitute than to delete and insert (in
+  # metalgo, the groups are relations). Within a group, the bound uses the cheapest
+  # costs between its labels.
+  edge_groups = list(range(num_edge_labels))
+  def find(code):
+    while edge_groups[code] != code:
+      code = edge_groups[code]
+    return code
+  for code1, code2 in itertools.product(edge_labels1, edge_labels2):
+    if edge_subst[code1][code2] < edge_del[code1] + edge_ins[code2]:
+      edge_groups[find(code1)] = find(code2)
+  group_ids = {}
+  edge_group = [group_ids.setdefault(find(code), len(group_ids)) for code in range(num_edge_labels)]
+  num_edge_groups = len(group_ids)
+  inf = float('inf')
+  group_del = [inf] * num_edge_groups
+  group_ins = [inf] * num_edge_groups
+  group_pair = [inf] * num_edge_groups
+  for code in edge_labels1:
+    group_del[edge_group[code]] = min(group_del[edge_group[code]], edge_del[code])
+  for code in edge_labels2:
+    group_ins[edge_group[code]] = min(group_ins[edge_group[code]], edge_ins[code])
+  for code1, code2 in itertools.product(edge_labels1, edge_labels2):
+    if edge_group[code1] == edge_group[code2]:
+      group_pair[edge_group[code1]] = min(group_pair[edge_group[code1]], edge_subst[code1][code2])
+  for group in range(num_edge_groups):
+    group_pair[group] = min(group_pair[group], group_del[group] + group_ins[group])
+
+  # --- Adjacency
+  # out1[a] = {b: label codes of the edges a -> b}; in1 is the reverse.
+  # group_edges1[a][b] = the edges a -> b, in the same order as the codes.
+  def make_adjacency(nodes, edges, edge_codes):
+    node_ids = {node: node_id for node_id, node in enumerate(nodes)}
+    outgoing = [{} for _ in nodes]
+    incoming = [{} for _ in nodes]
+    group_edges = [{} for _ in nodes]
+    for edge, code in zip(edges, edge_codes):
+      source_id = node_ids[edge[0]]
+      target_id = node_ids[edge[1]]
+      outgoing[source_id][target_id] = outgoing[source_id].get(target_id, ()) + (code,)
+      incoming[target_id][source_id] = outgoing[source_id][target_id]
+      group_edges[source_id].setdefault(target_id, []).append(edge)
+    return outgoing, incoming, group_edges
+
+  out1, in1, group_edges1 = make_adjacency(nodes1, edges1, edge_codes1)
+  out2, in2, group_edges2 = make_adjacency(nodes2, edges2, edge_codes2)
+  num1 = len(nodes1)
+  num2 = len(nodes2)
+
+  # Match G1's nodes starting from the most connected one, then whichever has the
+  # most edges to the nodes so far, so that edges get costed early on.
+  degree1 = [len(out1[node_id]) + len(in1[node_id]) for node_id in range(num1)]
+  order = []
+  links = [0] * num1
+  unordered = set(range(num1))
+  while unordered:
+    node_id = min(unordered, key=lambda node_id: (-links[node_id], -degree1[node_id], node_id))
+    unordered.remove(node_id)
+    order.append(node_id)
+    for neighbor_id in itertools.chain(out1[node_id], in1[node_id]):
+      links[neighbor_id] += 1
+
+  # What each G1 node can be matched to. Substitutions that cost inf never are.
+  candidates = {
+    code1: [v for v in range(num2) if node_subst[code1][node_codes2[v]] != float('inf')]
+    for code1 in labels1
+  }
+
+  # --- Search state
+  matches = [_UNMATCHED] * num1   # G1 node -> G2 node, or _DELETED
+  matched_by = [-1] * num2        # G2 node -> G1 node, or -1 if it's free
+  left1 = [0] * num_node_labels   # unmatched G1 nodes per label
+  left2 = [0] * num_node_labels   # free G2 nodes per label
+  for code in node_codes1:
+    left1[code] += 1
+  for code in node_codes2:
+    left2[code] += 1
+  ins_order = sorted(labels2, key=lambda code: node_ins[code])
+
+  # Edges that aren't costed yet, counted per (class, label group). Class 0 is edges
+  # between unmatched nodes. Class 1 + 2 * u (+ 1) is edges out of (into) the matched
+  # G1 node u whose other end isn't matched, and the same for u's match in G2.
+  # count1 and count2 are G1's and G2's counts, and edge_bound is the sum of their bounds.
+  num_keys = (1 + 2 * num1) * num_edge_groups
+  count1 = [0] * num_keys
+  count2 = [0] * num_keys
+  for code in edge_codes1:
+    count1[edge_group[code]] += 1
+  for code in edge_codes2:
+    count2[edge_group[code]] += 1
+
+  def key_bound(key: int, a: int, b: int) -> float:
+    group = key % num_edge_groups
+    pairs = a if a < b else b
+    return (pairs * group_pair[group] if pairs else 0.0) + \
+      ((a - pairs) * group_del[group] if a > pairs else 0.0) + \
+      ((b - pairs) * group_ins[group] if b > pairs else 0.0)
+
+  edge_bound = sum(key_bound(key, count1[key], count2[key]) for key in range(num_edge_groups))
+  # What inserting all of G2's edges that are left would cost, which is what they
+  # cost once G1's nodes are all matched.
+  edge_inserts = sum(edge_ins[code] for code in edge_codes2)
+  cost = 0.0
+  trail = []  # (key, count1, count2) before each change, to undo
+
+  def recount(edge_class: int, code: int, change1: int, change2: int):
+    nonlocal edge_bound, edge_inserts
+    key = edge_class * num_edge_groups + edge_group[code]
+    a = count1[key]
+    b = count2[key]
+    trail.append((key, a, b))
+    count1[key] = a + change1
+    count2[key] = b + change2
+    edge_bound += key_bound(key, a + change1, b + change2) - key_bound(key, a, b)
+    edge_inserts += change2 * edge_ins[code]
+
+  def node_bound() -> float:
+    # Each unmatched G1 node costs at least its cheapest match or deletion, and the
+    # G2 nodes it can't match are inserted.
+    free_labels = [code for code in labels2 if left2[code]]
+    bound = 0.0
+    num_left1 = 0
+    for code1 in labels1:
+      if left1[code1]:
+        cheapest = node_del[code1]
+        for code2 in free_labels:
+          if node_subst[code1][code2] < cheapest:
+            cheapest = node_subst[code1][code2]
+        bound += left1[code1] * cheapest
+        num_left1 += left1[code1]
+    num_inserted = sum(left2[code] for code in free_labels) - num_left1
+    for code in ins_order:
+      if num_inserted <= 0:
+        break
+      inserted = min(num_inserted, left2[code])
+      bound += inserted * node_ins[code]
+      num_inserted -= inserted
+    return bound
+
+  # Match u to v (or delete it, if v is _DELETED), and cost the edges that can be.
+  def match(u: int, v: int):
+    nonlocal cost
+    trail.append((-1, cost, (edge_bound, edge_inserts)))
+    u_class = 1 + 2 * u
+    left1[node_codes1[u]] -= 1
+    matches[u] = v
+
+    if v == _DELETED:
+      cost += node_del[node_codes1[u]]
+      for target, codes in out1[u].items():
+        state = matches[target]
+        if state == _DELETED and target != u:
+          continue
+        for code in codes:
+          cost += edge_del[code]
+          recount(0 if state == _UNMATCHED or target == u else 2 + 2 * target, code, -1, 0)
+      for source, codes in in1[u].items():
+        state = matches[source]
+        if state == _DELETED or source == u:
+          continue
+        for code in codes:
+          cost += edge_del[code]
+          recount(0 if state == _UNMATCHED else 1 + 2 * source, code, -1, 0)
+      return
+
+    cost += node_subst[node_codes1[u]][node_codes2[v]]
+    left2[node_codes2[v]] -= 1
+    matched_by[v] = u
+
+    # Move the edges that now hang off u (and v) out of class 0, and take out the
+    # ones that get costed.
+    neighbors = {u}
+    for target, codes in out1[u].items():
+      state = matches[target]
+      if target == u or state == _DELETED:
+        continue
+      for code in codes:
+        if state == _UNMATCHED:
+          recount(0, code, -1, 0)
+          recount(u_class, code, 1, 0)
+        else:
+          recount(2 + 2 * target, code, -1, 0)
+      if state != _UNMATCHED:
+        neighbors.add(target)
+    for source, codes in in1[u].items():
+      state = matches[source]
+      if source == u or state == _DELETED:
+        continue
+      for code in codes:
+        if state == _UNMATCHED:
+          recount(0, code, -1, 0)
+          recount(u_class + 1, code, 1, 0)
+        else:
+          recount(1 + 2 * source, code, -1, 0)
+      if state != _UNMATCHED:
+        neighbors.add(source)
+    for target, codes in out2[v].items():
+      if target == v:
+        continue
+      other = matched_by[target]
+      for code in codes:
+        if other < 0:
+          recount(0, code, 0, -1)
+          recount(u_class, code, 0, 1)
+        else:
+          recount(2 + 2 * other, code, 0, -1)
+      if other >= 0:
+        neighbors.add(other)
+    for source, codes in in2[v].items():
+      if source == v:
+        continue
+      other = matched_by[source]
+      for code in codes:
+        if other < 0:
+          recount(0, code, 0, -1)
+          recount(u_class + 1, code, 0, 1)
+        else:
+          recount(1 + 2 * other, code, 0, -1)
+      if other >= 0:
+        neighbors.add(other)
+
+    # Cost the edges between u and the matched nodes, including loops.
+    for neighbor in neighbors:
+      if neighbor == u:
+        loops1 = out1[u].get(u, ())
+        loops2 = out2[v].get(v, ())
+        for code in loops1:
+          recount(0, code, -1, 0)
+        for code in loops2:
+          recount(0, code, 0, -1)
+        cost += parallel.cost(loops1, loops2)
+        continue
+      match_id = matches[neighbor]
+      cost += parallel.cost(out1[u].get(neighbor, ()), out2[v].get(match_id, ()))
+      cost += parallel.cost(out1[neighbor].get(u, ()), out2[match_id].get(v, ()))
+
+  def unmatch(u: int):
+    nonlocal cost, edge_bound, edge_inserts
+    while True:
+      key, a, b = trail.pop()
+      if key < 0:
+        cost = a
+        edge_bound, edge_inserts = b
+        break
+      count1[key] = a
+      count2[key] = b
+    v = matches[u]
+    matches[u] = _UNMATCHED
+    left1[node_codes1[u]] += 1
+    if v != _DELETED:
+      matched_by[v] = -1
+      left2[node_codes2[v]] += 1
+
+  # The ways to match the node at depth, cheapest estimate first, as (estimate,
+  # tie-break, v). At the last depth, the estimates are the costs: the free G2 nodes
+  # and edges are inserted.
+  def expand(depth: int) -> list[tuple]:
+    u = order[depth]
+    is_last = depth + 1 == num1
+    children = []
+    node_bounds = {}  # the node bound only depends on v's label
+    for v in itertools.chain((v for v in candidates[node_codes1[u]] if matched_by[v] < 0), (_DELETED,)):
+      match(u, v)
+      code = node_codes2[v] if v != _DELETED else -1
+      bound = node_bounds.get(code)
+      if bound is None:
+        bound = node_bounds[code] = node_bound()
+      children.append((cost + bound + (edge_inserts if is_last else edge_bound), v if v != _DELETED else num2, v))
+      unmatch(u)
+    children.sort()
+    return children
+
+  def edit_paths(best_cost: float) -> tuple[list, list, float]:
+    node_path = [(nodes1[u], nodes2[matches[u]] if matches[u] != _DELETED else None) for u in order]
+    node_path.extend((None, nodes2[v]) for v in range(num2) if matched_by[v] < 0)
+
+    edge_path = []
+    matched2 = set()
+    for source1 in range(num1):
+      for target1, edges in group_edges1[source1].items():
+        source2 = matches[source1]
+        target2 = matches[target1]
+        edges2 = group_edges2[source2].get(target2, []) if source2 >= 0 and target2 >= 0 else []
+        if not edges2:
+          edge_path.extend((edge, None) for edge in edges)
+          continue
+        _, pairs = parallel.match(out1[source1][target1], out2[source2][target2])
+        edge_path.extend((edges[i] if i is not None else None, edges2[j] if j is not None else None) for i, j in pairs)
+        matched2.add((source2, target2))
+    for source2 in range(num2):
+      for target2, edges in group_edges2[source2].items():
+        if (source2, target2) not in matched2:
+          edge_path.extend((None, edge) for edge in edges)
+    return node_path, edge_path, float(best_cost)
+
+  def is_pruned(estimate: float) -> bool:
+    return estimate >= best_cost if strictly_decreasing else estimate > best_cost
+
+  # --- Search
+  # Depth-first, with each depth's children in an explicit open list. Children are
+  # tried cheapest estimate first, and dropped once their estimate can't beat the best.
+  best_cost = float('inf')
+  if num1 == 0:
+    yield edit_paths(node_bound() + edge_inserts)
+    return
+
+  open_lists = [[expand(0), 0, False]]  # [children, next child, whether a child is matched]
+  while open_lists:
+    if timeout is not None and timeit.default_timer() - start_time > timeout:
+      return
+
+    open_list = open_lists[-1]
+    depth = len(open_lists) - 1
+    u = order[depth]
+    if open_list[2]:
+      unmatch(u)
+      open_list[2] = False
+
+    children, index = open_list[0], open_list[1]
+    if index >= len(children) or is_pruned(children[index][0]):
+      open_lists.pop()
+      continue
+
+    estimate, _, v = children[index]
+    open_list[1] = index + 1
+    match(u, v)
+    open_list[2] = True
+    if depth + 1 < num1:
+      open_lists.append([expand(depth + 1), 0, False])
+      continue
+
+    best_cost = estimate
+    yield edit_paths(best_cost)
@@ -7,14 +7,19 @@ edges in individual graphs.
 
 """
 import enum
+import itertools
 import pprint
 import timeit
 import math
 import argparse
+from typing import NamedTuple
 
 import networkx as nx
+import numpy as np
+import scipy.optimize
 import compiler
 import analogylib
+import ged
 from analogylib import Analogy, Hand
 from parser import rel
 
@@ -168,150 +173,342 @@ def edge_diff_cost(edge):
   return EDGE_BASE_COST
 
 """
-Compute analogy. This can terminate on its own, but it'll stop at the timeout
-provided in the prep_analogy
+What the costs above depend on. The search only asks for the costs of each pair of
+these once, rather than for every pair of nodes (or edges).
 """
-def compute_analogy(
-  sinister_graph: nx.MultiDiGraph, dexter_graph: nx.MultiDiGraph, preferred_matches:dict|None = None, timeout: int = 1 * 60, verbose=False
-):
+def node_label(node):
+  return (node.get('layer'), node.get('type'), node.get('is_standard'), node.get('preference_id'))
+
+def edge_label(edge):
+  return edge.get('relation')
+
+# --- Cost Model
+"""
+The cost functions above, worked out for every pair of nodes (and edges) of two
+graphs at once. Nodes have codes for their labels (see node_label) shared by both
+graphs, and edges are coded by their relation's value.
+Node and edge lists are in the order of graph.nodes and graph.edges(keys=True).
+"""
+class CostModel(NamedTuple):
+  sinister_nodes: list[str]
+  dexter_nodes: list[str]
+  sinister_node_codes: np.ndarray
+  dexter_node_codes: np.ndarray
+  node_subst: np.ndarray       # [label code, label code]
+  node_diff: np.ndarray        # [label code]
+  sinister_edges: list[tuple]
+  dexter_edges: list[tuple]
+  sinister_relations: np.ndarray
+  dexter_relations: np.ndarray
+  edge_subst: np.ndarray       # [relation value, relation value]
+  relation_diff: np.ndarray    # [relation value]
+
+  def node_subst_costs(self) -> np.ndarray:
+    """[sinister node, dexter node]"""
+    return self.node_subst[np.ix_(self.sinister_node_codes, self.dexter_node_codes)]
+
+  def sinister_node_diff(self) -> np.ndarray:
+    return self.node_diff[self.sinister_node_codes]
+
+  def dexter_node_diff(self) -> np.ndarray:
+    return self.node_diff[self.dexter_node_codes]
+
+  def edge_subst_costs(self) -> np.ndarray:
+    """[sinister edge, dexter edge]"""
+    return self.edge_subst[np.ix_(self.sinister_relations, self.dexter_relations)]
+
+  def sinister_edge_diff(self) -> np.ndarray:
+    return self.relation_diff[self.sinister_relations]
+
+  def dexter_edge_diff(self) -> np.ndarray:
+    return self.relation_diff[self.dexter_relations]
+
+  def ged_costs(self) -> ged.Costs:
+    return ged.Costs(
+      self.sinister_node_codes, self.dexter_node_codes, self.node_subst, self.node_diff, self.node_diff,
+      self.sinister_relations, self.dexter_relations, self.edge_subst, self.relation_diff, self.relation_diff,
+    )
+
+"""
+With constrained, nodes from different layers and edges with different relations
+can't be matched at all: they cost inf rather than MAX_COST, so the search never
+tries them. Analogies that don't need MAX_COST matches cost the same either way.
+"""
+def cost_model(sinister_graph: nx.MultiDiGraph, dexter_graph: nx.MultiDiGraph, constrained=False) -> CostModel:
+  labels = {}    # label -> code
+  examples = []  # attributes of a node with each label
+  def code(data):
+    label = node_label(data)
+    if label not in labels:
+      labels[label] = len(examples)
+      examples.append(data)
+    return labels[label]
+  sinister_node_codes = np.array([code(data) for _, data in sinister_graph.nodes(data=True)], dtype=np.intp)
+  dexter_node_codes = np.array([code(data) for _, data in dexter_graph.nodes(data=True)], dtype=np.intp)
+
+  # The cost functions, once per pair of labels (and relations).
+  node_subst = np.array([[node_subst_cost(data1, data2) for data2 in examples] for data1 in examples], dtype=np.int64).reshape(len(examples), len(examples))
+  node_diff = np.array([node_diff_cost(data) for data in examples], dtype=np.int64)
+
+  num_relations = max(relation.value for relation in rel) + 1
+  edge_subst = np.full((num_relations, num_relations), MAX_COST, dtype=np.int64)
+  relation_diff = np.zeros(num_relations, dtype=np.int64)
+  for relation1 in rel:
+    relation_diff[relation1.value] = edge_diff_cost({'relation': relation1.name})
+    for relation2 in rel:
+      edge_subst[relation1.value, relation2.value] = edge_subst_cost({'relation': relation1.name}, {'relation': relation2.name})
+
+  if constrained:
+    node_subst = np.where(node_subst >= MAX_COST, np.inf, node_subst)
+    edge_subst = np.where(edge_subst >= MAX_COST, np.inf, edge_subst)
+
+  def relations(graph):
+    return np.array([rel[relation].value for *_, relation in graph.edges(keys=True, data='relation')], dtype=np.intp)
+
+  return CostModel(
+    list(sinister_graph.nodes), list(dexter_graph.nodes), sinister_node_codes, dexter_node_codes, node_subst, node_diff,
+    list(sinister_graph.edges(keys=True)), list(dexter_graph.edges(keys=True)), relations(sinister_graph), relations(dexter_graph),
+    edge_subst, relation_diff,
+  )
+
+"""
+Pair up nodes in one go, by solving the (n + m) x (n + m) assignment problem from
+Riesen and Bunke's bipartite graph edit distance. Each node's costs include the
+cost of matching (or deleting, or inserting) the edges around it, which only
+matches edges with the same relation (others cost MAX_COST).
+"""
+def bipartite_node_pairing(model: CostModel) -> dict[str, str]:
+  n = len(model.sinister_nodes)
+  m = len(model.dexter_nodes)
+  num_relations = len(model.relation_diff)
+
+  # Number of outgoing and incoming edges of each relation, for each node.
+  def relation_counts(nodes, edges, relations):
+    node_ids = {node: node_id for node_id, node in enumerate(nodes)}
+    sources = np.array([node_ids[source] for source, _, _ in edges], dtype=np.intp)
+    targets = np.array([node_ids[target] for _, target, _ in edges], dtype=np.intp)
+    counts = np.zeros((2, len(nodes), num_relations), dtype=np.int64)
+    np.add.at(counts[0], (sources, relations), 1)
+    np.add.at(counts[1], (targets, relations), 1)
+    return counts
+
+  sinister_counts = relation_counts(model.sinister_nodes, model.sinister_edges, model.sinister_relations)
+  dexter_counts = relation_counts(model.dexter_nodes, model.dexter_edges, model.dexter_relations)
+  sinister_edge_diff = (sinister_counts * model.relation_diff).sum(axis=(0, 2))
+  dexter_edge_diff = (dexter_counts * model.relation_diff).sum(axis=(0, 2))
+
+  # Deleting and inserting all the edges, less what matching them saves, one
+  # relation and direction at a time to keep to a single n x m matrix.
+  savings = 2 * model.relation_diff - np.minimum(np.diagonal(model.edge_subst), 2 * model.relation_diff)
+  edge_costs = np.add.outer(sinister_edge_diff, dexter_edge_diff).astype(float)
+  for relation in np.flatnonzero(savings).tolist():
+    for direction in range(2):
+      edge_costs -= savings[relation] * np.minimum.outer(sinister_counts[direction, :, relation], dexter_counts[direction, :, relation])
+
+  # [substitutions, deletions]
+  # [insertions,    nothing  ]
+  costs = np.zeros((n + m, n + m))
+  costs[:n, m:] = np.inf
+  costs[n:, :m] = np.inf
+  costs[:n, :m] = model.node_subst_costs() + edge_costs
+  costs[range(n), range(m, m + n)] = model.sinister_node_diff() + sinister_edge_diff
+  costs[range(n, n + m), range(m)] = model.dexter_node_diff() + dexter_edge_diff
+
+  rows, columns = scipy.optimize.linear_sum_assignment(costs)
+  return {model.sinister_nodes[i]: model.dexter_nodes[j] for i, j in zip(rows.tolist(), columns.tolist()) if i < n and j < m}
+
+"""
+Nodes that are isolated at the end (ie. not connected to any edge) could be
+mapped in anyway. Their lack of connect with anything else in the analogy suggests
+that it's not a very structurally minded mapping.
+Therefore, we prune them.
+"""
+def prune_isolates(analogy: Analogy, verbose=False):
   if verbose:
-    print('\n---- Starting Analogy ----')
+    print('---- Pruning isolated nodes')
 
-  # Prepare preferred matches for "efficient" matching
-  # Really it's mostly massaging aliases so the user can input any of the names.
-  if preferred_matches is not None:
-    assert isinstance(preferred_matches, dict), 'Type Error'
-
-    # The user should be able to use any of the names for an alias, so we need to
-    # correct the name. The alias name's order is not fixed so this is required.
-    sinister_aliases = {}
-    for sinister_node in sinister_graph.nodes():
-      if ' = ' in sinister_node:
-        for alias in sinister_node.split(' = '):
-          sinister_aliases[alias] = sinister_node
-    
-    dexter_aliases = {}
-    for dexter_node in dexter_graph.nodes():
-      if ' = ' in dexter_node:
-        for alias in dexter_node.split(' = '):
-          dexter_aliases[alias] = dexter_node
+  analogy_graph = analogylib.graph_from_analogy(analogy, Hand.SINISTER)
+  for node_name in nx.isolates(analogy_graph):
+    if verbose:
+      dexter_node_name = analogylib.get_analogous_node(analogy, node_name)
+      print(f'pruning isolate: {node_name:>30} <=> {dexter_node_name:<30}')
+
+    analogylib.set_is_pruned(analogy, node_name, True)
+
+"""
+Pin the user's preferred matches on the graphs, as a shared preference_id on each
+pair of nodes (the cost model only substitutes nodes with equal ids).
+Really it's mostly massaging aliases so the user can input any of the names.
+"""
+def prefer_matches(sinister_graph: nx.MultiDiGraph, dexter_graph: nx.MultiDiGraph, preferred_matches: dict, verbose=False):
+  assert isinstance(preferred_matches, dict), 'Type Error'
+
+  # The user should be able to use any of the names for an alias, so we need to
+  # correct the name. The compiler keeps an index of them for this.
+  sinister_aliases = sinister_graph.graph.get('aliases', {})
+  dexter_aliases = dexter_graph.graph.get('aliases', {})
 
-    # print(dexter_aliases)
+  if verbose:
+    print('-- User defined preferred pairings')
+
+  preference_id = 0  # the node_subst_cost function will match based on this id
+  # NOTE: a slightly crazier thing would be to add the node's name as an attribute
+  # but that seems excessive, and not useful for anything else.
+  for sinister_node, dexter_node in preferred_matches.items():
+    if ' = ' in sinister_node:
+      # If the order is wrong, pick the first name and rely on the alias lookup
+      sinister_node = sinister_node.split(' = ')[0]
     
+    if ' = ' in dexter_node:
+      # If the order is wrong, pick the first name and rely on the alias lookup
+      dexter_node = dexter_node.split(' = ')[0]
+
+    # Replace name with looked up name
+    sinister_node = sinister_aliases.get(sinister_node, sinister_node)
+    dexter_node = dexter_aliases.get(dexter_node, dexter_node)
+
+    assert sinister_node in sinister_graph.nodes, f'Could not find node `{sinister_node}` in sinister graph.'
+    assert dexter_node in dexter_graph.nodes, f'Could not find node `{dexter_node}` in dexter graph.'
+
+    sinister_graph.add_node(sinister_node, preference_id=preference_id)
+    dexter_graph.add_node(dexter_node, preference_id=preference_id)
+    preference_id += 1
     if verbose:
-      print('-- User defined preferred pairings')
- 
-    fixed_preferred_matches = {}
-    preference_id = 0  # the node_subst_cost function will match based on this id
-    # NOTE: a slightly crazier thing would be to add the node's name as an attribute
-    # but that seems excessive, and not useful for anything else.
-    for sinister_node, dexter_node in preferred_matches.items():
-      if ' = ' in sinister_node:
-        # If the order is wrong, pick the first name and rely on the alias lookup
-        sinister_node = sinister_node.split(' = ')[0]
-      
-      if ' = ' in dexter_node:
-        # If the order is wrong, pick the first name and rely on the alias lookup
-        dexter_node = dexter_node.split(' = ')[0]
-
-      # Replace name with looked up name
-      # print(dexter_node)
-      sinister_node = sinister_aliases.get(sinister_node, sinister_node)
-      dexter_node = dexter_aliases.get(dexter_node, dexter_node)
-      fixed_preferred_matches[sinister_node] = dexter_node
-      # print(dexter_node)
-
-      assert sinister_node in sinister_graph.nodes, f'Could not find node `{sinister_node}` in sinister graph.'
-      assert dexter_node in dexter_graph.nodes, f'Could not find node `{dexter_node}` in dexter graph.'
-
-      sinister_graph.add_node(sinister_node, preference_id=preference_id)
-      dexter_graph.add_node(dexter_node, preference_id=preference_id)
-      preference_id += 1
-      if verbose:
-        print(f"{sinister_node:>30} <=> {dexter_node:<30}")
-    
-  geds = nx.optimize_edit_paths(
+      print(f"{sinister_node:>30} <=> {dexter_node:<30}")
+
+"""
+Make the (pruned) analogy for an edit path from ged.optimize_edit_paths.
+"""
+def analogy_from_edit_path(node_edit_path: list, edge_edit_path: list, verbose=False) -> Analogy:
+  analogy = analogylib.new()
+  for lhs, rhs in node_edit_path:
+    analogylib.add_analogous_nodes(analogy, lhs, rhs)
+
+  # NOTE: edges are (source, target, key), where the key is used by the multigraph
+  # to keep track of parallel edges.
+  for sinister_edge, dexter_edge in edge_edit_path:
+    analogylib.add_analogous_edges(analogy, sinister_edge, dexter_edge)
+
+  prune_isolates(analogy, verbose=verbose)
+  return analogy
+
+"""
+An analogy found by stream_analogies, with its cost and the seconds since the stream
+started. The analogy itself is only made (and pruned) the first time it's asked for,
+so callers that only watch the costs don't pay for every improvement.
+"""
+class StreamedAnalogy:
+  def __init__(self, cost: float, seconds: float, make_analogy: callable):
+    self.cost = cost
+    self.seconds = seconds
+    self._make_analogy = make_analogy
+    self._analogy = None
+
+  def analogy(self, verbose=False) -> Analogy:
+    if self._analogy is None:
+      self._analogy = self._make_analogy(verbose)
+    return self._analogy
+
+  def __repr__(self):
+    return f'StreamedAnalogy(cost={self.cost}, seconds={self.seconds:.3f})'
+
+"""
+Stream analogies as the search improves on them: yields a StreamedAnalogy for each
+cheaper analogy, as soon as it's found. Stop whenever the first good-enough answer
+comes in: breaking out of the loop (or closing the generator) stops the search.
+Arguments are as in compute_analogy, and the graphs' nodes get the same preference_ids.
+"""
+def stream_analogies(
+  sinister_graph: nx.MultiDiGraph, dexter_graph: nx.MultiDiGraph, preferred_matches:dict|None = None, timeout: int = 1 * 60, verbose=False,
+  mode='exact', constrained=False
+):
+  assert mode in ('exact', 'bipartite'), f'Unknown mode `{mode}`.'
+  start_time = timeit.default_timer()
+  sinister_graph = compiler.as_multidigraph(sinister_graph)
+  dexter_graph = compiler.as_multidigraph(dexter_graph)
+  if preferred_matches is not None:
+    prefer_matches(sinister_graph, dexter_graph, preferred_matches, verbose=verbose)
+
+  model = cost_model(sinister_graph, dexter_graph, constrained=constrained)
+  if mode == 'bipartite':
+    # The cost needs the analogy, so there is nothing to defer.
+    analogy = analogylib.analogy_from_node_pairing(bipartite_node_pairing(model), sinister_graph, dexter_graph)
+    prune_isolates(analogy, verbose=verbose)
+    cost = calculate_cost(analogy, sinister_graph, dexter_graph, model=model)
+    yield StreamedAnalogy(cost, timeit.default_timer() - start_time, lambda verbose: analogy)
+    return
+
+  geds = ged.optimize_edit_paths(
     sinister_graph,
     dexter_graph,
     timeout=timeout,
-    node_subst_cost=node_subst_cost,
-    node_ins_cost=node_diff_cost,
-    node_del_cost=node_diff_cost,
-    edge_subst_cost=edge_subst_cost,
-    edge_ins_cost=edge_diff_cost,
-    edge_del_cost=edge_diff_cost,
+    costs=model.ged_costs(),
     # strictly_decreasing=False,
   )
+  try:
+    for node_edit_path, edge_edit_path, cost in geds:
+      def make_analogy(verbose, node_edit_path=node_edit_path, edge_edit_path=edge_edit_path):
+        return analogy_from_edit_path(node_edit_path, edge_edit_path, verbose=verbose)
+      yield StreamedAnalogy(cost, timeit.default_timer() - start_time, make_analogy)
+  finally:
+    geds.close()
 
-  analogy = analogylib.new()
+"""
+Compute analogy. This can terminate on its own, but it'll stop at the timeout
+provided in the prep_analogy
+The graphs can also be CompactGraphs, which are converted to networkx for the search.
+Returns the cheapest analogy found, with the cost and seconds taken for each improvement.
+Use stream_analogies to see the improvements as they come in.
+
+mode is either
+- 'exact': search for the cheapest graph edit, until the timeout.
+- 'bipartite': pair up the nodes in one go with bipartite_node_pairing, which takes
+  milliseconds but is only approximate.
+With constrained, nodes are only matched within their layer and edges within their
+relation (see cost_model). It's faster, and finds analogies just as cheap unless
+they need cross-layer matches.
+"""
+def compute_analogy(
+  sinister_graph: nx.MultiDiGraph, dexter_graph: nx.MultiDiGraph, preferred_matches:dict|None = None, timeout: int = 1 * 60, verbose=False,
+  mode='exact', constrained=False
+):
+  if verbose:
+    print('\n---- Starting Analogy ----')
+
+  best = None
   costs = []
   timings = []
-  start_time = timeit.default_timer()
-  for ged in geds:
-    analogy = analogylib.new()
-    node_edit_path, edge_edit_path, cost = ged
-
+  for streamed in stream_analogies(sinister_graph, dexter_graph, preferred_matches, timeout, verbose, mode, constrained):
+    timings.append(streamed.seconds - (best.seconds if best is not None else 0))
+    costs.append(streamed.cost)
+    best = streamed
     if verbose:
-      print("\n\n-- cost:", cost)
-
-    for node_edit in node_edit_path:
-      lhs, rhs = node_edit
-      analogylib.add_analogous_nodes(analogy, lhs, rhs)
-
-    for edge_edit in edge_edit_path:
-      lhs, rhs = edge_edit
-
-      sinister_edge = None
-      if lhs is not None:
-        # NOTE: the last unpacked item is used by the multigraph to keep track
-        # of different edges, so we don't need it.
-        edge_src, edge_trg, edge_key = lhs
-        lhs = f"{edge_src} ~ {edge_trg}"
-        sinister_edge = (edge_src, edge_trg, edge_key)
-
-      dexter_edge = None
-      if rhs is not None:
-        # NOTE: the last unpacked item is used by the multigraph to keep track
-        # of different edges, so we don't need it.s
-        edge_src, edge_trg, edge_key = rhs
-        rhs = f"{edge_src} ~ {edge_trg}"
-        dexter_edge = (edge_src, edge_trg, edge_key)
-
-      analogylib.add_analogous_edges(analogy, sinister_edge, dexter_edge)
-
-    # Nodes that are isolated at the end (ie. not connected to any edge) could be
-    # mapped in anyway. Their lack of connect with anything else in the analogy suggests
-    # that it's not a very structurally minded mapping.
-    # Therefore, we prune them.
-    if verbose:
-      print('---- Pruning isolated nodes')
-
-    analogy_graph = analogylib.graph_from_analogy(analogy, Hand.SINISTER)
-    for node_name in nx.isolates(analogy_graph):
-      if verbose:
-        dexter_node_name = analogylib.get_analogous_node(analogy, node_name)
-        print(f'pruning isolate: {node_name:>30} <=> {dexter_node_name:<30}')
-
-      analogylib.set_is_pruned(analogy, node_name, True)
-
-    if verbose:
-      analogylib.print_analogy(analogy)
-
-    elapsed_time = timeit.default_timer() - start_time
-    timings.append(elapsed_time)
-    costs.append(cost)
-    if verbose:
-      print(f'Iteration took {elapsed_time:.2f}s.')
-    start_time = timeit.default_timer()
-    # NOTE: Restart here rather than at the top of the loop since the iteration
-    # is the expensive call (because geds is a generator, not a list of results)
+      print("\n\n-- cost:", streamed.cost)
+      analogylib.print_analogy(streamed.analogy(verbose=True))
+      print(f'Iteration took {timings[-1]:.2f}s.')
 
+  # Only the best analogy is made, unless verbose printed them all.
+  analogy = best.analogy(verbose=verbose) if best is not None else analogylib.new()
   return analogy, {'costs': costs, 'times': timings}
 
 """
 Calculate the cost of a given analogy.
+The costs come from the graphs' cost model, which can be passed in if it's already made.
 """
-def calculate_cost(analogy: Analogy, sinister: nx.MultiDiGraph, dexter: nx.MultiDiGraph, itemized=False, verbose=False) -> int:
+def calculate_cost(analogy: Analogy, sinister: nx.MultiDiGraph, dexter: nx.MultiDiGraph, itemized=False, verbose=False, model: CostModel | None = None) -> int:
+  sinister = compiler.as_multidigraph(sinister)
+  dexter = compiler.as_multidigraph(dexter)
+  if model is None:
+    model = cost_model(sinister, dexter)
+  # Label codes and relations, to look the costs up pair by pair.
+  sinister_codes = dict(zip(model.sinister_nodes, model.sinister_node_codes.tolist()))
+  dexter_codes = dict(zip(model.dexter_nodes, model.dexter_node_codes.tolist()))
+  sinister_relations = dict(zip(model.sinister_edges, model.sinister_relations.tolist()))
+  dexter_relations = dict(zip(model.dexter_edges, model.dexter_relations.tolist()))
+  node_subst = model.node_subst.tolist()
+  node_diff = model.node_diff.tolist()
+  edge_subst = model.edge_subst.tolist()
+  relation_diff = model.relation_diff.tolist()
   cost = 0
   def vprint(*args):
     if verbose:
@@ -336,10 +533,8 @@ def calculate_cost(analogy: Analogy, sinister: nx.MultiDiGraph, dexter: nx.Multi
   # NOTE: by definition, these should not have edges.
   prune_cost = 0
   for sinister_name, dexter_name in analogylib.get_nodes(analogy, side=None, include_pruned=True):
-    sinister_node = sinister[sinister_name]
-    dexter_node = dexter[dexter_name]
     if analogylib.get_is_pruned(analogy, sinister_name, side=Hand.SINISTER):
-      prune_cost += node_subst_cost(sinister_node, dexter_node)
+      prune_cost += node_subst[sinister_codes[sinister_name]][dexter_codes[dexter_name]]
       vprint(f'Pruned: {sinister_name}  <=>  {dexter_name}')
   
   if itemized or verbose:
@@ -354,7 +549,7 @@ def calculate_cost(analogy: Analogy, sinister: nx.MultiDiGraph, dexter: nx.Multi
       continue
 
     elif not analogylib.is_node_in_sinister(analogy, node):
-      res = node_diff_cost(sinister[node])
+      res = node_diff[sinister_codes[node]]
       vprint(f'Deleted ({res}): {node}')
       node_deletion_cost += res
   
@@ -371,7 +566,7 @@ def calculate_cost(analogy: Analogy, sinister: nx.MultiDiGraph, dexter: nx.Multi
       continue
 
     elif not analogylib.is_node_in_dexter(analogy, node):
-      res = node_diff_cost(dexter[node])
+      res = node_diff[dexter_codes[node]]
       vprint(f'Inserted ({res}): {node}')
       node_insertion_cost += res
   
@@ -384,7 +579,7 @@ def calculate_cost(analogy: Analogy, sinister: nx.MultiDiGraph, dexter: nx.Multi
   # loop through analogy
   node_substitution_cost = 0
   for sinister_node, dexter_node in analogylib.get_nodes(analogy, side=None):
-    res = node_subst_cost(sinister.nodes[sinister_node], dexter.nodes[dexter_node])
+    res = node_subst[sinister_codes[sinister_node]][dexter_codes[dexter_node]]
     vprint(f'Substitution ({res}): {sinister_node} ==> {dexter_node}')
     vprint(f'                  {str(sinister.nodes[sinister_node])} ==> {str(dexter.nodes[dexter_node])}')
     node_substitution_cost += res
@@ -407,7 +602,7 @@ def calculate_cost(analogy: Analogy, sinister: nx.MultiDiGraph, dexter: nx.Multi
   edge_deletion_cost = 0
   for edge in sinister.edges(keys=True):
     if not analogylib.is_edge_in_sinister(analogy, edge):
-      res = edge_diff_cost(sinister.edges[edge])
+      res = relation_diff[sinister_relations[edge]]
       vprint(f'Deleted edge ({res}): {edge[:2]}')
       edge_deletion_cost += res
   
@@ -420,7 +615,7 @@ def calculate_cost(analogy: Analogy, sinister: nx.MultiDiGraph, dexter: nx.Multi
   edge_insertion_cost = 0
   for edge in dexter.edges(keys=True):
     if not analogylib.is_edge_in_dexter(analogy, edge):
-      res = edge_diff_cost(dexter.edges[edge])
+      res = relation_diff[dexter_relations[edge]]
       vprint(f'Inserted edge ({res}): {edge[:2]}')
       edge_insertion_cost += res
   
@@ -432,7 +627,7 @@ def calculate_cost(analogy: Analogy, sinister: nx.MultiDiGraph, dexter: nx.Multi
   # edge substitution
   edge_substition_cost = 0
   for sinister_edge, dexter_edge in analogylib.get_edges(analogy, side=None):
-    res = edge_subst_cost(sinister.edges[sinister_edge], dexter.edges[dexter_edge])
+    res = edge_subst[sinister_relations[sinister_edge]][dexter_relations[dexter_edge]]
     sinister_relation = sinister.edges[sinister_edge].get('relation')
     dexter_relation = dexter.edges[dexter_edge].get('relation')
     vprint(f'Substitution ({res}): {sinister_edge[0]} -{sinister_relation}-> {sinister_edge[1]}')
@@ -459,6 +654,7 @@ NOTE: this does count relation> updates as 2 individual edges, which is a bit
 """
 def conceptual_connectivity(analogy: Analogy, graph: nx.MultiDiGraph, side=Hand.SINISTER, verbose=False):
   assert isinstance(side, Hand), f'Type Error. Expected Hand, got {type(side)} instead'
+  graph = compiler.as_multidigraph(graph)
   analogy_graph = analogylib.graph_from_analogy(analogy, side)
 
   def is_node_conceptual(node):
@@ -496,7 +692,12 @@ def conceptual_connectivity(analogy: Analogy, graph: nx.MultiDiGraph, side=Hand.
   
   return len(conceptual_edges)
 
-def get_conceptual_adjacent_edges(graph: nx.MultiDiGraph):
+def get_conceptual_adjacent_edges(graph: nx.MultiDiGraph | compiler.CompactGraph):
+  if isinstance(graph, compiler.CompactGraph):
+    is_conceptual = graph.node_layer == compiler.LAYERS.index('conceptual')
+    is_adjacent = is_conceptual[graph.edge_sources()] | is_conceptual[graph.edge_targets]
+    return list(itertools.compress(graph.edge_data(), is_adjacent.tolist()))
+
   assert isinstance(graph, nx.MultiDiGraph)
 
   res = []
@@ -8,32 +8,101 @@ A YAML file looks like this:
 # TODO: fill this out for documentation.
 
 interp (short for interpretation) is a tuple of:
-- a list of declarations         (used by the compiler for its nefarious compilation deeds)
+- a DeclarationTable             (used by the compiler for its nefarious compilation deeds)
 - a list of [statements, path]   (used by the frontend to the location of keywords in the spec)
+                                 NOTE: these paths are PathNodes, see get_lookup.
 """
 import yaml
 from pprint import pformat, pprint
 from pathlib import Path
 import re
 import enum
+import bisect
+import difflib
+import functools
+import itertools
+from array import array
 from enum import Enum
+from typing import Generator, Iterator, NamedTuple
 
 SpecPath = list[int, str, tuple[str, str | int]]
 
+"""
+While parsing, paths are linked nodes (parent_node, segment) with None as the root.
+Children share their parent's node, so going one level deeper doesn't copy the path.
+materialize_path turns a node into the SpecPath that the frontend uses.
+"""
+PathNode = tuple | None
+
 def new_interp():
-  return ([], [])
+  return (DeclarationTable(), [])
+
+class _Discard:
+  # Stands in for the declarations or paths of an interp whose contents aren't needed.
+  def append(self, item):
+    pass
+
+# Parsing with this is cheaper than making a new_interp() just to throw it away.
+_DISCARDED_INTERP = (_Discard(), _Discard())
 
-def record_path(statement: str, interp: tuple[list, list], path: SpecPath):
+def record_path(statement: str, interp: tuple[list, list], path: PathNode):
     interp[1].append([statement, path])
 
-def spec_from_file(file_name):
+def materialize_path(path: PathNode) -> SpecPath:
+  segments = []
+  while path is not None:
+    path, segment = path
+    segments.append(segment)
+  segments.reverse()
+  return segments
+
+def get_lookup(interp: tuple[list, list]) -> list[tuple[str, SpecPath]]:
+  """
+  [statement, SpecPath] for every recorded statement.
+  """
+  return [[statement, materialize_path(path)] for statement, path in interp[1]]
+
+def compact_lookup(interp: tuple[list, list]) -> dict:
+  """
+  The lookup in the compact form used by specs.json. Paths are stored once, as a tree:
+  {
+    'nodes'  : [[parent_node_index, segment], ...],  # -1 is the root. Parents come before their children.
+    'entries': [[statement, node_index], ...],
+  }
+  """
+  nodes = []
+  node_indices = {}  # (parent_node_index, segment): node_index
+  node_indices_by_id = {}  # id(node): node_index, to skip walking up shared nodes again
+
+  def get_node_index(path: PathNode) -> int:
+    if path is None:
+      return -1
+    node_index = node_indices_by_id.get(id(path))
+    if node_index is None:
+      parent, segment = path
+      node = (get_node_index(parent), segment)
+      node_index = node_indices.get(node)
+      if node_index is None:
+        node_index = node_indices[node] = len(nodes)
+        nodes.append(list(node))
+      node_indices_by_id[id(path)] = node_index
+    return node_index
+
+  entries = [[statement, get_node_index(path)] for statement, path in interp[1]]
+  return {'nodes': nodes, 'entries': entries}
+
+def spec_path(file_name) -> Path:
   # https://stackoverflow.com/a/65174822
-  real_path = Path(__file__).parent.joinpath('specifications', file_name)
-  return _spec_from_filepath(real_path)
+  return Path(__file__).parent.joinpath('specifications', file_name)
+
+def standard_path() -> Path:
+  return Path(__file__).with_name('standard.yaml')
+
+def spec_from_file(file_name):
+  return _spec_from_filepath(spec_path(file_name))
 
 def spec_from_standard():
-  real_path = Path(__file__).with_name('standard.yaml')
-  return _spec_from_filepath(real_path)
+  return _spec_from_filepath(standard_path())
 
 def _spec_from_filepath(file_path):
   with open(file_path, "r") as file_handle:
@@ -44,6 +113,82 @@ def spec_from_string(yaml_str: str):
   assert type(yaml_str) is str
   return yaml.safe_load(yaml_str)
 
+# --- streaming
+# The functions above load the whole spec before parsing it. The stream_* functions
+# instead read YAML events and build one top-level statement at a time, so a huge
+# spec never exists as a single nested tree. make_relations, stream_relations and
+# parse_type_definitions all accept these streams in place of a spec list.
+# NOTE: a stream can only be consumed once.
+
+# libyaml's loader is much faster, if PyYAML was built with it.
+_StreamLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+def stream_spec_from_file(file_name) -> Iterator:
+  with open(spec_path(file_name), "r") as file_handle:
+    yield from stream_spec(file_handle)
+
+def stream_spec(yaml_stream) -> Iterator:
+  """
+  Yields the top-level statements of the spec in yaml_stream (a string or a file)
+  one by one. Only the first YAML document is read.
+  """
+  loader = _StreamLoader(yaml_stream)
+  try:
+    loader.get_event()  # StreamStartEvent
+    assert loader.check_event(yaml.DocumentStartEvent), 'Top level of YAML specification must be a list.'
+    loader.get_event()
+    assert loader.check_event(yaml.SequenceStartEvent), 'Top level of YAML specification must be a list.'
+    loader.get_event()
+
+    anchors = {}  # anchors can be used by later statements, so they're kept for the whole document
+    while not loader.check_event(yaml.SequenceEndEvent):
+      node = _compose_event_node(loader, anchors)
+      yield loader.construct_document(node)
+  finally:
+    loader.dispose()
+
+def _compose_event_node(loader, anchors: dict) -> yaml.Node:
+  # This does what yaml.composer.Composer does, which the libyaml loader doesn't expose.
+  event = loader.get_event()
+  if isinstance(event, yaml.AliasEvent):
+    assert event.anchor in anchors, f'Found undefined alias `{event.anchor}` at {event.start_mark}'
+    return anchors[event.anchor]
+
+  if isinstance(event, yaml.ScalarEvent):
+    tag = event.tag
+    if tag is None or tag == '!':
+      tag = loader.resolve(yaml.ScalarNode, event.value, event.implicit)
+    node = yaml.ScalarNode(tag, event.value, event.start_mark, event.end_mark, style=event.style)
+    if event.anchor is not None:
+      anchors[event.anchor] = node
+    return node
+
+  if isinstance(event, yaml.SequenceStartEvent):
+    tag = event.tag
+    if tag is None or tag == '!':
+      tag = loader.resolve(yaml.SequenceNode, None, event.implicit)
+    node = yaml.SequenceNode(tag, [], event.start_mark, None, flow_style=event.flow_style)
+    if event.anchor is not None:
+      anchors[event.anchor] = node
+    while not loader.check_event(yaml.SequenceEndEvent):
+      node.value.append(_compose_event_node(loader, anchors))
+    node.end_mark = loader.get_event().end_mark
+    return node
+
+  assert isinstance(event, yaml.MappingStartEvent), f'Unexpected YAML event: {event}'
+  tag = event.tag
+  if tag is None or tag == '!':
+    tag = loader.resolve(yaml.MappingNode, None, event.implicit)
+  node = yaml.MappingNode(tag, [], event.start_mark, None, flow_style=event.flow_style)
+  if event.anchor is not None:
+    anchors[event.anchor] = node
+  while not loader.check_event(yaml.MappingEndEvent):
+    key_node = _compose_event_node(loader, anchors)
+    value_node = _compose_event_node(loader, anchors)
+    node.value.append((key_node, value_node))
+  node.end_mark = loader.get_event().end_mark
+  return node
+
 # --- interpreted relations
 class rel(Enum):
   # objects
@@ -86,19 +231,191 @@ class dpower(Enum):
   QUESTION = enum.auto()
 
 # -- Declarations
+class DeclarationTable:
+  """
+  Insertion-ordered set of declarations, stored column-wise.
+
+  Node names are interned into a symbol table, so a declaration is a row of four
+  small ints (source id, relation code, target id, power code) instead of a tuple of
+  strings and enums. Appending a declaration that's already there does nothing.
+
+  Iterating the table (or one of its views) still yields the usual
+  (source, relation, target, power) tuples, so get_declaration_* keep working.
+  """
+  def __init__(self, declarations=()):
+    self.symbols: list[str] = []          # node id -> node name
+    self._symbol_ids: dict[str, int] = {}  # node name -> node id
+
+    # Columns
+    self.sources = array('i')
+    self.relations = array('B')  # rel.value
+    self.targets = array('i')
+    self.powers = array('B')     # dpower.value
+
+    # Row indices for the filtered views, keyed by code. Filled in as rows arrive.
+    self._rows_by_power: dict[int, array] = {power.value: array('i') for power in dpower}
+    self._rows_by_relation: dict[int, array] = {relation.value: array('i') for relation in rel}
+
+    # Packed rows that are already in the table, for de-duplication
+    self._keys: set[int] = set()
+
+    self.extend(declarations)
+
+  def intern(self, name: str) -> int:
+    node_id = self._symbol_ids.get(name)
+    if node_id is None:
+      node_id = len(self.symbols)
+      # Ids have to fit in their field of the packed rows (append interns every new node).
+      assert node_id < 1 << _NODE_BITS, f'Too many nodes to pack declarations: {name}'
+      self.symbols.append(name)
+      self._symbol_ids[name] = node_id
+    return node_id
+
+  def append(self, declaration: tuple):
+    source, relation, target, power = declaration
+    symbol_ids = self._symbol_ids
+    source_id = symbol_ids.get(source)
+    if source_id is None:
+      source_id = self.intern(source)
+    target_id = symbol_ids.get(target)
+    if target_id is None:
+      target_id = self.intern(target)
+    # _value_ skips the Enum.value descriptor, which shows up in profiles.
+    relation_code = relation._value_
+    power_code = power._value_
+
+    key = (((source_id << _NODE_BITS) | target_id) << _RELATION_BITS | relation_code) << _POWER_BITS | power_code
+    keys = self._keys
+    if key in keys:
+      return
+    keys.add(key)
+
+    row = len(self.sources)
+    self.sources.append(source_id)
+    self.relations.append(relation_code)
+    self.targets.append(target_id)
+    self.powers.append(power_code)
+    self._rows_by_power[power_code].append(row)
+    self._rows_by_relation[relation_code].append(row)
+
+  def extend(self, declarations):
+    for declaration in declarations:
+      self.append(declaration)
+
+  def head(self, num_rows: int) -> 'DeclarationTable':
+    """
+    A new table with the first num_rows declarations. This is much cheaper than
+    appending them to an empty table.
+    """
+    head = DeclarationTable()
+    head.symbols = self.symbols[:]  # might include names that only later rows use
+    head._symbol_ids = dict(self._symbol_ids)
+    head.sources = self.sources[:num_rows]
+    head.relations = self.relations[:num_rows]
+    head.targets = self.targets[:num_rows]
+    head.powers = self.powers[:num_rows]
+    # Row indices are sorted.
+    head._rows_by_power = {code: rows[:bisect.bisect_left(rows, num_rows)] for code, rows in self._rows_by_power.items()}
+    head._rows_by_relation = {code: rows[:bisect.bisect_left(rows, num_rows)] for code, rows in self._rows_by_relation.items()}
+    if 2 * num_rows > len(self):
+      # Mostly kept (eg. an edit near the end of a spec): drop the other rows' keys.
+      head._keys = self._keys.difference(
+        _pack_row(self.sources[row], self.relations[row], self.targets[row], self.powers[row]) for row in range(num_rows, len(self))
+      )
+    else:
+      head._keys = set(itertools.starmap(_pack_row, zip(head.sources, head.relations, head.targets, head.powers)))
+    return head
+
+  def _rows(self, rows) -> Iterator[tuple]:
+    # Materialize the given rows as declaration tuples.
+    symbols, sources, relations, targets, powers = self.symbols, self.sources, self.relations, self.targets, self.powers
+    for row in rows:
+      yield (symbols[sources[row]], _RELATION_BY_CODE[relations[row]], symbols[targets[row]], _POWER_BY_CODE[powers[row]])
+
+  def __iter__(self) -> Iterator[tuple]:
+    return zip(
+      map(self.symbols.__getitem__, self.sources),
+      map(_RELATION_BY_CODE.__getitem__, self.relations),
+      map(self.symbols.__getitem__, self.targets),
+      map(_POWER_BY_CODE.__getitem__, self.powers),
+    )
+
+  def __len__(self):
+    return len(self.sources)
+
+  def __contains__(self, declaration):
+    source, relation, target, power = declaration
+    source_id = self._symbol_ids.get(source)
+    target_id = self._symbol_ids.get(target)
+    if source_id is None or target_id is None:
+      return False
+    return _pack_row(source_id, relation._value_, target_id, power._value_) in self._keys
+
+  def __getitem__(self, index: int | slice):
+    if isinstance(index, slice):
+      return list(self._rows(range(len(self))[index]))
+    return next(self._rows([range(len(self))[index]]))
+
+  def __eq__(self, other):
+    if isinstance(other, DeclarationTable):
+      return list(self) == list(other)
+    return NotImplemented
+
+  def __repr__(self):
+    return f'DeclarationTable({list(self)})'
+
+  # Filtered views
+  def strong(self) -> 'DeclarationView':
+    return DeclarationView(self, self._rows_by_power[dpower.STRONG.value])
+
+  def weak(self) -> 'DeclarationView':
+    return DeclarationView(self, self._rows_by_power[dpower.WEAK.value])
+
+  def by_relation(self, relation: rel) -> 'DeclarationView':
+    return DeclarationView(self, self._rows_by_relation[relation.value])
+
+"""
+A filtered, read-only view of a DeclarationTable. It reflects rows appended to the
+table after it was made.
+"""
+class DeclarationView:
+  def __init__(self, table: DeclarationTable, rows: array):
+    self.table = table
+    self.rows = rows
+
+  def __iter__(self) -> Iterator[tuple]:
+    return self.table._rows(self.rows)
+
+  def __len__(self):
+    return len(self.rows)
+
+_RELATION_BY_CODE = {relation.value: relation for relation in rel}
+_POWER_BY_CODE = {power.value: power for power in dpower}
+
+# Rows are packed into (positive) int64 keys: the relation and power get as many bits
+# as their enums need, and the node ids split the rest.
+_RELATION_BITS = max(relation.value for relation in rel).bit_length()
+_POWER_BITS = max(power.value for power in dpower).bit_length()
+_NODE_BITS = (63 - _RELATION_BITS - _POWER_BITS) // 2
+assert _NODE_BITS >= 24, f'rel and dpower leave only {_NODE_BITS} bits for node ids in packed rows.'
+
+def _pack_row(source_id: int, relation_code: int, target_id: int, power_code: int) -> int:
+  # NOTE: DeclarationTable.append inlines this.
+  return (((source_id << _NODE_BITS) | target_id) << _RELATION_BITS | relation_code) << _POWER_BITS | power_code
+
 def declare(interp: tuple[list, list], source: str, relation: rel, target: str, power: dpower, verbose=False):
   """
   Declares an edge in the graph by appending it to interp.
   """
   interp[0].append((source, relation, target, power))
 
-  pretty_relation = relation.name
-
-  assert source is not None, f'`source` cannot be None in: {source}  -{pretty_relation}->  {target}'
-  assert relation is not None, f'`relation` cannot be None in: {source}  -{pretty_relation}->  {target}'
-  assert target is not None, f'`target` cannot be None in: {source}  -{pretty_relation}->  {target}'
+  # NOTE: assert messages are only formatted on failure, so relation.name (which
+  # is surprisingly slow on enums) is only looked up when it's needed.
+  assert source is not None, f'`source` cannot be None in: {source}  -{relation.name}->  {target}'
+  assert relation is not None, f'`relation` cannot be None in: {source}  -{relation}->  {target}'
+  assert target is not None, f'`target` cannot be None in: {source}  -{relation.name}->  {target}'
   if verbose:
-    print(f'{source}  -{pretty_relation}->  {target}')
+    print(f'{source}  -{relation.name}->  {target}')
 
 def get_declaration_source(edge: tuple) -> str:
   return edge[0]
@@ -161,6 +478,98 @@ def print_interp(interp: tuple[list, list]):
   for declaration in decls:
     print_declaration(declaration)
 
+# --- Lexer
+"""
+Statements (ie. YAML keys and values) are lexed once into a stream of tokens, which
+the parser then walks instead of re-scanning the string with splits and regexes.
+
+eg. '(gui) a.b->/c and d =' =>
+  TYPE'(gui) ' ATOM'a' DOT'.' ATOM'b' ARROW'->' SLASH'/' ATOM'c' AND' and ' ATOM'd' ALIAS' ='
+
+Every character belongs to exactly one token, so joining the text of a sequence of
+tokens gives back the exact substring it was lexed from.
+"""
+class tok(Enum):
+  TYPE = enum.auto()      # `(type) ` prefix, including the trailing space
+  ATOM = enum.auto()      # names eg. `videos`, `in-editor`, `@`, `!dm`
+  ARROW = enum.auto()     # `->`
+  DOT = enum.auto()       # `.`
+  SLASH = enum.auto()     # `/`
+  AND = enum.auto()       # ` and `
+  ALIAS = enum.auto()     # trailing ` =`
+  MAP = enum.auto()       # trailing ` <>`
+  RELATION = enum.auto()  # `relation>` keywords eg. `subset>`, `group foreach>`
+  SPACE = enum.auto()     # any other space
+
+Token = tuple[tok, str]
+
+# NOTE: order matters, the first alternative that matches at a position wins.
+# eg. ` and ` must be tried before SPACE, and `->` must not be eaten by an ATOM.
+_TOKEN_RE = re.compile(r"""
+   (?P<TYPE>\([\w\-]+\)\ )
+  |(?P<AND>\ and\ )
+  |(?P<ALIAS>\ =$)
+  |(?P<MAP>\ <>$)
+  |(?P<SPACE>\ )
+  |(?P<ARROW>->)
+  |(?P<DOT>\.)
+  |(?P<SLASH>/)
+  |(?P<RELATION>[a-z]+(?:\ foreach)?>)
+  |(?P<ATOM>(?:[^\ ./\-]|-(?!>))+)
+""", re.VERBOSE)
+
+# tok[name] goes through EnumType.__getitem__, which shows up in profiles.
+_TOK_BY_GROUP = {kind.name: kind for kind in tok}
+
+# The first term of a compound phrase must start like a name (or a type).
+_LEADING_TERM_RE = re.compile(r'\(|[\w\-@]')
+
+class Lexed(NamedTuple):
+  tokens: tuple[Token, ...]
+  # Flags so the parser doesn't have to look through the tokens again.
+  has_and: bool
+  has_space: bool
+  is_compound: bool  # has `->`, `.` or `/`
+
+@functools.lru_cache(maxsize=2**16)
+def lex(statement: str) -> Lexed:
+  """
+  Lex a statement into its tokens. Statements repeat a lot in a spec (eg. parents),
+  so this is cached.
+  """
+  matches = list(_TOKEN_RE.finditer(statement))
+  tokens = tuple([(_TOK_BY_GROUP[match.lastgroup], match.group()) for match in matches])
+  # Group names rather than toks, since hashing an Enum member is a Python call.
+  groups = {match.lastgroup for match in matches}
+  return Lexed(
+    tokens=tokens,
+    has_and='AND' in groups,
+    has_space='SPACE' in groups,
+    is_compound='ARROW' in groups or 'DOT' in groups or 'SLASH' in groups,
+  )
+
+def tokenize(statement: str) -> tuple[Token, ...]:
+  """
+  Lex a statement into a tuple of (tok, text) tokens.
+  """
+  assert type(statement) is str, f'Type error, expected str got {type(statement)}'
+  return lex(statement).tokens
+
+def tokens_to_str(tokens: tuple[Token, ...], skip_types=False) -> str:
+  # Types are skipped to produce the same result as strip_type.
+  return ''.join(text for kind, text in tokens if not (skip_types and kind is tok.TYPE))
+
+def split_tokens(tokens: tuple[Token, ...], separator: tok) -> list[tuple[Token, ...]]:
+  # Like str.split, but on a kind of token. The separators are dropped.
+  splits = []
+  start = 0
+  for idx, (kind, _) in enumerate(tokens):
+    if kind is separator:
+      splits.append(tokens[start:idx])
+      start = idx + 1
+  splits.append(tokens[start:])
+  return splits
+
 # --- Parse spec
 def incrementally_aggregate(array: list, symbol: str):
   # Map an array to such that each term uses a combined sequence of the previous.
@@ -212,19 +621,36 @@ def parse_compound_object(statement: str, parent: str, interp: tuple[list, list]
    / means component (it's really a sort of group though)
    NOTE: `and` is parsed in the caller parse_str
   
-  NOTE: This function will result in a lot of duplicate relations if a compound
-  item is called multiple times. We could cache results if things get out of hand.
+  NOTE: The same compound item shows up many times in a spec, so the expansion is
+  memoized on (statement, parent) and the cached declarations are replayed.
   NOTE: This function returns a statement with / prefixed appropriately.
   """
+  declarations, rebuilt_statement = _expand_compound_object(statement, parent)
+  for declaration in declarations:
+    interp[0].append(declaration)
+  return rebuilt_statement
+
+@functools.lru_cache(maxsize=2**16)
+def _expand_compound_object(statement: str, parent: str|None) -> tuple[tuple[tuple, ...], str]:
+  # Returns the (immutable) declarations and the rebuilt statement.
   assert ' and ' not in statement, "Found `and` in compound parse_compound_object. This should be dealt with in parse_str."
+  # A plain list, since the declarations are interned when they're replayed.
+  declarations = []
+  rebuilt_statement = _parse_compound_str(statement, parent, (declarations, _DISCARDED_INTERP[1]))
+  return tuple(declarations), rebuilt_statement
+
+def _parse_compound_str(statement: str, parent: str|None, interp: tuple[list, list]) -> str:
+  # NOTE: `->`, `.` and `/` are always tokens of their own (see lex), so plain
+  # str.split finds the same phrases and segments as the tokens would, only faster.
 
   # 1. Parse ->
   # First, prepend parent when the term starts with `/`
   arrow_split = []
   for phrase in statement.split('->'):
+    assert len(phrase) > 0, f'Found an empty term around `->` in: {statement}'
     if phrase[0] == '/':
       assert parent is not None, f'`{phrase}` starts with `/`, but its parent is None.'
-      phrase = parent+phrase
+      phrase = parent + phrase
     arrow_split.append(phrase)
 
   for arrow_idx, target in enumerate(arrow_split):
@@ -249,6 +675,9 @@ def parse_compound_object(statement: str, parent: str, interp: tuple[list, list]
   # NOTE: they don't interact with arrows at all, so we look at the phrases between arrows
   for phrase in arrow_split:
     # phrase is a combination of atoms split by . and / ie. matches [\w\-\/\.]+
+    # slash_phrases is the phrase split by / and then by .
+    # eg. a.b/c.d => [['a', 'b'], ['c', 'd']]
+    slash_phrases = [segment.split('.') for segment in phrase.split('/')]
 
     # 3. Parse /
     # The first item in the lhs chain of `.` is groups the first item
@@ -256,14 +685,10 @@ def parse_compound_object(statement: str, parent: str, interp: tuple[list, list]
     # a -GROUP-> a/c
     # a/c -GROUP-> a/c/f
 
-    # Get the first term (before `.` or `/`)
-    first_dot_term = re.match(r'(^\([\w\-]+\) )?[\w\-@]+', phrase)
-    assert first_dot_term is not None, f"The first term of this dot sequence is malformed: {phrase} in {statement}"
-
-    # Add every term following a `/`
+    # Get the first term (before `.` or `/`) of every segment
     # eg. a.b/c.d/e.f => [a, c, e]
-    leading_dot_terms = [first_dot_term.group()] + \
-      list(map(lambda x: x[1:], re.findall(r'\/[\w\-@]+', phrase)))
+    leading_dot_terms = [dot_terms[0] for dot_terms in slash_phrases]
+    assert _LEADING_TERM_RE.match(leading_dot_terms[0]) is not None, f"The first term of this dot sequence is malformed: {phrase} in {statement}"
 
     # 3. Parse `/` relations.
     # Aggregate terms incrementally
@@ -298,15 +723,15 @@ def parse_compound_object(statement: str, parent: str, interp: tuple[list, list]
     # a.b/d/g -SUB-> a/d/g  |   a.b.c/d/g -SUB-> a/d/g  # lhs subsets
     # a/d.e/g -SUB-> a/d/g  |   a/d.e.f/g -SUB-> a/d/g
 
-    slash_phrases = phrase.split('/')
-    for idx, slash_term in enumerate(slash_phrases):
+    for idx, dot_terms in enumerate(slash_phrases):
       prefix = '' if idx == 0 else aggregated_leading_terms[idx-1]+'/'
 
       # a.b.c => [a, a.b, a.b.c]
-      dot_aggregates = incrementally_aggregate(slash_term.split('.'), '.')
+      dot_aggregates = incrementally_aggregate(dot_terms, '.')
 
       # [a, a.b, a.b.c] => [prefix/a, prefix/a.b, prefix/a.b.c]
-      dot_aggregates = list(map(lambda t: prefix+t, dot_aggregates))
+      if prefix:
+        dot_aggregates = [prefix+t for t in dot_aggregates]
 
       # rhs subsets
       # iterate through pairs and add an edge.
@@ -332,7 +757,7 @@ def parse_compound_object(statement: str, parent: str, interp: tuple[list, list]
 
   return rebuilt_statement
 
-def parse_str(statement: str, parent: str|None, interp: tuple[list, list], depth: int, path: list[int] = []) -> str:
+def parse_str(statement: str, parent: str|None, interp: tuple[list, list], depth: int, path: PathNode = None) -> str:
   """
   Parses the string and returns an identifier that the caller can use in a relation.
   NOTE: that this will clean up the statement eg. remove (type), =, etc.
@@ -352,48 +777,55 @@ def parse_str(statement: str, parent: str|None, interp: tuple[list, list], depth
   # Syntax for attribute maps
   if statement[-3:] == " <>":
     statement = statement[:-3] # trim mapping syntax
-  
-  # Parse `and` statement and recurse on each phrase
-  if ' and ' in statement:
-    and_splits = statement.split(' and ')
-
-    # remove the (type) signatures in the parsed output
-    statement_without_types = strip_type(statement)
-    for and_phrase in and_splits:
-      assert ' and ' not in and_phrase, 'ERROR: `and` found where it shouldn\'t be'
-      # a and b => a -SUBSET-> a and b, b -SUBSET-> a and b
-      declare(interp=interp, 
-                source=strip_type(and_phrase), relation=rel.SUBSET, target=statement_without_types,
-                power=dpower.WEAK)
-
-      # Each "phrase" (as in `phrase1 and phrase2`) is parsed as its own string
-      parse_str(and_phrase, parent=parent, interp=interp, depth=depth+1)  # recurse on each phrase
 
-    record_path(statement, interp, path)
-    return statement_without_types
-      
-  # Syntax for instantiation eg. (linear) alphabetical
-  if type_match := re.match(r'^\((?P<type>[\w\-]+)\) (?P<instance>[\w\-\.\/>@]+)', statement):
-    # extract type=`type` and instance='thingy.xyz' in `(type) thingy.xyz`.
-    # NOTE: ?P<instance> captures compound statements like a.b->c/d
-    # NOTE: the match will fail if it doesn't get both. So if you only provide 
-    # the type, it will not match, which might come across as a silent failure.
-    extracted_type = type_match.group('type')
-    extracted_instance = type_match.group('instance')
-
-    # If we're declaring a typed attribute eg. (linear) /timeline, prefix the parent
-    # NOTE: maybe this should use parse_compound_object, but that feels overkill.
-    if extracted_instance[0] == '/':
-      # TODO: handle None parent
-      extracted_instance = parent + extracted_instance
-
-    # TYPE relation only applies to the first part of a compound phrase, so we grab that with a regex.
-    first_instance_word = extracted_instance.split('->')[0]
-    declare(interp=interp, source=extracted_type, relation=rel.TYPE, target=first_instance_word, power=dpower.STRONG)
-    statement = extracted_instance
-  
+  # `and`s and (type)s come with spaces, so only statements with spaces are lexed.
+  # The rest of the syntax is one character (or `->`) that is always a token of
+  # its own, so it can be read off the string.
+  if ' ' in statement:
+    lexed = lex(statement)
+    tokens = lexed.tokens
+
+    # Parse `and` statement and recurse on each phrase
+    if lexed.has_and:
+      # remove the (type) signatures in the parsed output
+      statement_without_types = tokens_to_str(tokens, skip_types=True)
+      for and_tokens in split_tokens(tokens, tok.AND):
+        # a and b => a -SUBSET-> a and b, b -SUBSET-> a and b
+        declare(interp=interp, 
+                  source=tokens_to_str(and_tokens, skip_types=True), relation=rel.SUBSET, target=statement_without_types,
+                  power=dpower.WEAK)
+
+        # Each "phrase" (as in `phrase1 and phrase2`) is parsed as its own string
+        parse_str(tokens_to_str(and_tokens), parent=parent, interp=interp, depth=depth+1)  # recurse on each phrase
+
+      record_path(statement, interp, path)
+      return statement_without_types
+
+    # Syntax for instantiation eg. (linear) alphabetical
+    if tokens[0][0] is tok.TYPE and len(tokens) > 1 and tokens[1][0] is not tok.SPACE:
+      # extract type=`type` and instance='thingy.xyz' in `(type) thingy.xyz`.
+      # NOTE: the instance includes compound statements like a.b->c/d, but stops
+      # at the first space.
+      extracted_type = tokens[0][1][1:-2]  # `(type) ` => `type`
+      instance_tokens = split_tokens(tokens[1:], tok.SPACE)[0]
+
+      # If we're declaring a typed attribute eg. (linear) /timeline, prefix the parent
+      # NOTE: maybe this should use parse_compound_object, but that feels overkill.
+      extracted_instance = tokens_to_str(instance_tokens)
+      if instance_tokens[0][0] is tok.SLASH:
+        # TODO: handle None parent
+        extracted_instance = parent + extracted_instance
+
+      # Carry on with the instance, which has no spaces.
+      statement = extracted_instance
+
+      # TYPE relation only applies to the first part of a compound phrase.
+      first_instance_word = statement.split('->')[0]
+      declare(interp=interp, source=extracted_type, relation=rel.TYPE, target=first_instance_word, power=dpower.STRONG)
+
   # Syntax for target relation (eg. update: A.selected subset> A)
-  if prepare_target_relation_statement(statement) is not None:
+  # NOTE: target relations always have spaces, so we can skip the check otherwise.
+  if ' ' in statement and prepare_target_relation_statement(statement) is not None:
     # NOTE: this relies on having removed <> previously
     # HACK: this is needed for parse_list, so that it can pass the whole statement
     # back to parse_dict. We can't just parse these kinds of statement in here
@@ -412,7 +844,7 @@ def parse_str(statement: str, parent: str|None, interp: tuple[list, list], depth
     statement = parent + statement
 
   # Compound objects have these characters.
-  if '.' in statement or '->' in statement or '/' in statement:
+  if '->' in statement or '.' in statement or '/' in statement:
     statement = parse_compound_object(statement=statement, parent=parent, interp=interp)
   
   # Declare the parent for /statement after it's been prefixed properly.
@@ -427,6 +859,7 @@ def parse_str(statement: str, parent: str|None, interp: tuple[list, list], depth
   record_path(statement, interp, path)
   return statement
 
+
 def parse_relation(statement: str) -> rel|None:
   """
   Map keywords to relations. 
@@ -474,7 +907,37 @@ def parse_relation(statement: str) -> rel|None:
 
   return res
 
-def parse_list(statements: list, key_parent: str|None, val_parent: str|None, interp: tuple[list, list], depth: int, path: SpecPath = []):
+# --- parse walk
+# parse_list and parse_dict call each other for every level of nesting in the spec.
+# Instead of recursing, their steps are generators: a nested parse is yielded, and
+# run_parse_steps sends its result back once it's done. Deep specs then don't hit the
+# recursion limit.
+
+def parse_list(statements: list, key_parent: str|None, val_parent: str|None, interp: tuple[list, list], depth: int, path: PathNode = None):
+  return run_parse_steps(_parse_list_steps(statements, key_parent=key_parent, val_parent=val_parent, interp=interp, depth=depth, path=path))
+
+def parse_dict(statement: dict, key_parent: str|None, val_parent: str|None, interp: tuple[list, list], depth: int, path: PathNode = None):
+  return run_parse_steps(_parse_dict_steps(statement, key_parent=key_parent, val_parent=val_parent, interp=interp, depth=depth, path=path))
+
+def run_parse_steps(steps: Generator):
+  """
+  Runs steps with an explicit stack, and returns its result.
+  """
+  stack = [steps]
+  result = None
+  while True:
+    try:
+      nested_steps = stack[-1].send(result)
+    except StopIteration as stop:
+      stack.pop()
+      result = stop.value
+      if len(stack) == 0:
+        return result
+    else:
+      stack.append(nested_steps)
+      result = None
+
+def _parse_list_steps(statements: list, key_parent: str|None, val_parent: str|None, interp: tuple[list, list], depth: int, path: PathNode = None):
   """
   Parses every item in the list and returns a list of identifiers for the parent to use.
   It passes its parent down to its items.
@@ -484,13 +947,13 @@ def parse_list(statements: list, key_parent: str|None, val_parent: str|None, int
   results = []
   for i, statement in enumerate(statements):
     if type(statement) is str:
-      results.append(parse_str(statement, parent=val_parent, interp=interp, depth=depth+1, path=[*path, i]))
+      results.append(parse_str(statement, parent=val_parent, interp=interp, depth=depth+1, path=(path, i)))
     elif type(statement) is dict:
-      results.append(parse_dict(statement, key_parent=key_parent, val_parent=val_parent, interp=interp, depth=depth+1, path=[*path, i]))
+      results.append((yield _parse_dict_steps(statement, key_parent=key_parent, val_parent=val_parent, interp=interp, depth=depth+1, path=(path, i))))
   
   return results
 
-def parse_dict(statement: dict, key_parent: str|None, val_parent: str|None, interp: tuple[list, list], depth: int, path: SpecPath = []):
+def _parse_dict_steps(statement: dict, key_parent: str|None, val_parent: str|None, interp: tuple[list, list], depth: int, path: PathNode = None):
   """
   Dictionaries are used in a few ways.
 
@@ -516,7 +979,7 @@ def parse_dict(statement: dict, key_parent: str|None, val_parent: str|None, inte
   for key, value in statement.items():
     # TODO: validate key
     # TODO: validate value
-    parsed_key = parse_str(key, parent=key_parent, interp=interp, depth=depth+1, path=[*path, ("__KEY", key)],)
+    parsed_key = parse_str(key, parent=key_parent, interp=interp, depth=depth+1, path=(path, ("__KEY", key)),)
 
     # 1. If the key is a relation, then it declares: parent -relation-> value(s).
     relation = parse_relation(key)
@@ -529,10 +992,10 @@ def parse_dict(statement: dict, key_parent: str|None, val_parent: str|None, inte
       if type(value) is str:
         if prepare_target_relation_statement(value) is not None:
           # parse as a target_relation (eg. update: a.sub subset> a), if that doesn't work deal with it as a string
-          parse_target_relation(value, inflicting_action=key_parent, parent=val_parent, interp=interp, depth=depth, verbose=False, path=[*path, key])
+          parse_target_relation(value, inflicting_action=key_parent, parent=val_parent, interp=interp, depth=depth, verbose=False, path=(path, key))
         else:
           # Since this is the value, we just pass val_parent as parent.
-          parsed_value = parse_str(value, parent=val_parent, interp=interp, depth=depth+1, path=[*path, key])
+          parsed_value = parse_str(value, parent=val_parent, interp=interp, depth=depth+1, path=(path, key))
 
           # but it's the key_parent that relates to the parsed value. NGL, I'm also a bit confused.
           # print(f'{parsed_key}: {parsed_value}')
@@ -540,12 +1003,12 @@ def parse_dict(statement: dict, key_parent: str|None, val_parent: str|None, inte
       elif type(value) is list:
         # if the value is a list, then we make a relation for each item
         # NOTE: Key/val parent doesn't really matter here, parse_list will just pass it down.
-        value_items = parse_list(value, key_parent=key_parent, val_parent=val_parent, interp=interp, depth=depth+1, path=[*path, key])
+        value_items = (yield _parse_list_steps(value, key_parent=key_parent, val_parent=val_parent, interp=interp, depth=depth+1, path=(path, key)))
 
         for item in value_items:
           if prepare_target_relation_statement(item) is not None:
             # parse as a target_relation (eg. update: a.sub subset> a), if that doesn't work deal with it as a string
-            parse_target_relation(item, inflicting_action=key_parent, parent=val_parent, interp=interp, depth=depth, verbose=False, path=[*path, key])
+            parse_target_relation(item, inflicting_action=key_parent, parent=val_parent, interp=interp, depth=depth, verbose=False, path=(path, key))
           else:
             # parent (from key) relates to each item
             declare(interp=interp, source=key_parent, relation=relation, target=item, power=dpower.STRONG)
@@ -609,12 +1072,12 @@ def parse_dict(statement: dict, key_parent: str|None, val_parent: str|None, inte
         
       parsed_value = None
       if type(value) is str:
-        parsed_value = parse_str(value, parent=val_parent, interp=interp, depth=depth+1, path=[*path, key])
+        parsed_value = parse_str(value, parent=val_parent, interp=interp, depth=depth+1, path=(path, key))
       elif type(value) is dict:
-        parsed_value = parse_dict(value, key_parent=next_key_parent, val_parent=next_val_parent, interp=interp, depth=depth+1, path=[*path, key])
+        parsed_value = (yield _parse_dict_steps(value, key_parent=next_key_parent, val_parent=next_val_parent, interp=interp, depth=depth+1, path=(path, key)))
       elif type(value) is list:
         # eg. thing <>: one, two
-        parsed_value = parse_list(value, key_parent=next_key_parent, val_parent=next_val_parent, interp=interp, depth=depth+1, path=[*path, key])
+        parsed_value = (yield _parse_list_steps(value, key_parent=next_key_parent, val_parent=next_val_parent, interp=interp, depth=depth+1, path=(path, key)))
       else:
         assert False, f"Value condition not met. That's weird. {value=}"
 
@@ -632,12 +1095,12 @@ def parse_dict(statement: dict, key_parent: str|None, val_parent: str|None, inte
     elif key[-2:] == " =": # TODO: do this properly with a regex to make the space optional (see other)
       # TODO: repeated code with the alias check `elif key[0] == '/'`. Could abstract as a function?
       if type(value) is str:
-        parsed_value = parse_str(value, parent=val_parent, interp=interp, depth=depth+1, path=[*path, key])
+        parsed_value = parse_str(value, parent=val_parent, interp=interp, depth=depth+1, path=(path, key))
         declare(interp=interp, source=parsed_value, relation=rel.ALIAS, target=parsed_key, power=dpower.STRONG)
 
       elif type(value) is list:
         # NOTE: I didn't intend for this to be listable, but it's kind of cool
-        for list_parsed_value in parse_list(value, key_parent=key_parent, val_parent=val_parent, interp=interp, depth=depth+1, path=[*path, key]):
+        for list_parsed_value in (yield _parse_list_steps(value, key_parent=key_parent, val_parent=val_parent, interp=interp, depth=depth+1, path=(path, key))):
           declare(interp=interp, source=parsed_key, relation=rel.ALIAS, target=list_parsed_value, power=dpower.STRONG)
 
       else:
@@ -648,7 +1111,7 @@ def parse_dict(statement: dict, key_parent: str|None, val_parent: str|None, inte
     # 3. If there's a single key and its value is a list/dict,
     #    then its the parent to declaration involving the items in its value.
     elif type(value) is list:
-      parse_list(value, key_parent=key_parent, val_parent=val_parent, interp=interp, depth=depth+1, path=[*path, key])
+      yield _parse_list_steps(value, key_parent=key_parent, val_parent=val_parent, interp=interp, depth=depth+1, path=(path, key))
     
     elif type(value) is dict:  
       # There are two scenarios in which you pass down your name as parents for children.
@@ -656,14 +1119,14 @@ def parse_dict(statement: dict, key_parent: str|None, val_parent: str|None, inte
       if rel.GROUP_FOREACH in map(lambda x: parse_relation(x), value.keys()):
         # In this case, the key is the source of the relation and one of the values is `group_foreach`
         # Therefore, the key and value parents are relation source aka parsed_key
-        parse_dict(value, key_parent=parsed_key, val_parent=parsed_key, interp=interp, depth=depth+1, path=[*path, key])
+        yield _parse_dict_steps(value, key_parent=parsed_key, val_parent=parsed_key, interp=interp, depth=depth+1, path=(path, key))
       
       # b. you are an instance statement that's not an element of a parent
       # TODO: probably use proper regex...
       elif key[0] == '(':
         # key parent is the instance name, while val parent is the previous val parent
         # This is an intentional bifurcation of parents.
-        parse_dict(value, key_parent=parsed_key, val_parent=val_parent, interp=interp, depth=depth+1, path=[*path, key])
+        yield _parse_dict_steps(value, key_parent=parsed_key, val_parent=val_parent, interp=interp, depth=depth+1, path=(path, key))
 
         # Add group_foreach edges between instance and attributes.
         for value_key in value.keys():
@@ -678,14 +1141,14 @@ def parse_dict(statement: dict, key_parent: str|None, val_parent: str|None, inte
       else:
         # If the key is just a variable name, then it's just an object with group/foreach relation
         # Just pass it down to the values as parents.
-        parse_dict(value, key_parent=parsed_key, val_parent=parsed_key, interp=interp, depth=depth+1, path=[*path, key])
+        yield _parse_dict_steps(value, key_parent=parsed_key, val_parent=parsed_key, interp=interp, depth=depth+1, path=(path, key))
     else:
       assert False, f"Key condition not met. That's very weird. key='{key}'"
   
   # Dictionaries that need to return an identifier always have one key.
   if len(statement.keys()) == 1:
-    # NOTE: interp is [] because this key's edges was already added ot interp in the `for key, val` loop
-    return parse_str(list(statement.keys())[0], parent=key_parent, interp=([], []), depth=depth)
+    # NOTE: interp is discarded because this key's edges was already added ot interp in the `for key, val` loop
+    return parse_str(list(statement.keys())[0], parent=key_parent, interp=_DISCARDED_INTERP, depth=depth)
   return
 
 """
@@ -749,7 +1212,7 @@ def prepare_target_relation_statement(statement: str):
 """
 Parse a string like 'items.selected subset> items'.
 """
-def parse_target_relation(statement: str, inflicting_action: str, parent: str, interp: tuple[list, list], depth: int, verbose=False, path: SpecPath = []) -> str|None:
+def parse_target_relation(statement: str, inflicting_action: str, parent: str, interp: tuple[list, list], depth: int, verbose=False, path: PathNode = None) -> str|None:
   raw_source, raw_relation, raw_target = prepare_target_relation_statement(statement)
   source = parse_str(raw_source, parent=parent, interp=interp, depth=depth+1, path=path)
   target = parse_str(raw_target, parent=parent, interp=interp, depth=depth+1, path=path)
@@ -768,13 +1231,14 @@ And a dictionary for type parenthood:
 Any attribute declaration is prefixed with @ as a placeholder for the instance name.
 """
 def parse_type_definitions(spec, verbose=False) -> tuple:
-  assert type(spec) is list, 'Top level of YAML specification must be a list.'
+  # spec can also be a stream from stream_spec.
+  assert type(spec) is list or isinstance(spec, Iterator), 'Top level of YAML specification must be a list.'
   instance_name = '@'  # This is used in place of the instance-name
   declarations_dict = {}  # {str(type_name): [type_declarations]}
   parent_dict = {}  # {str(type_name): str(parent_type_name)}
 
   for statement in spec:
-    type_declarations = []
+    type_declarations = DeclarationTable()
     # Ignore anything that's not a top level definition
     # NOTE: This approach silently ignores type definitions that are inline.
     #       These aren't supported anyway, but it'd be nice to error on them.
@@ -836,35 +1300,181 @@ def parse_type_definitions(spec, verbose=False) -> tuple:
         if type(group_foreach_content) is str:
           parse_str(group_foreach_content, parent=instance_name, interp=(type_declarations, []), depth=2)
         elif type(group_foreach_content) is list:
-          parse_list(group_foreach_content, key_parent=instance_name, val_parent=instance_name, interp=(type_declarations, []), depth=2, path=[])
+          parse_list(group_foreach_content, key_parent=instance_name, val_parent=instance_name, interp=(type_declarations, []), depth=2)
         else:
           assert False, f'Type Error: group_foreach_content should be str or list, got `{type(group_foreach_content)}` instead.'
     
     # Make all of the relations weak so that the compiler can decide which edges are useful.
-    weakened_type_decls = []
+    # NOTE: declarations that only differed by power are now duplicates.
+    weakened_type_decls = DeclarationTable()
     for declaration in type_declarations:
       weak_declaration = update_declaration_power(declaration, dpower.WEAK)
       weakened_type_decls.append(weak_declaration)
 
     # Add to result dict
-    declarations_dict[type_name] = weakened_type_decls
+    declarations_dict[type_name] = list(weakened_type_decls)
   
   return declarations_dict, parent_dict
 
 
 def make_relations(spec, verbose=False):
-  assert type(spec) is list, 'Top level of YAML specification must be a list.'
-
+  """
+  spec is either a spec list, or a stream of its top-level statements (see stream_spec).
+  """
   interp = new_interp()
-  parse_list(spec, key_parent=None, val_parent=None, interp=interp, depth=0)
+  if isinstance(spec, Iterator):
+    for _ in stream_relations(spec, interp):
+      pass
+  else:
+    assert type(spec) is list, 'Top level of YAML specification must be a list.'
+    parse_list(spec, key_parent=None, val_parent=None, interp=interp, depth=0)
 
   if verbose:
-    print(pformat(spec))
+    if not isinstance(spec, Iterator):
+      print(pformat(spec))
     print('\nresult:')
     print_interp(interp)
 
   return interp
 
+def stream_relations(spec, interp: tuple[list, list]|None = None) -> Iterator[tuple]:
+  """
+  Parses the top-level statements of spec one at a time, and yields each new
+  declaration as soon as its statement is parsed. spec can be a stream from stream_spec.
+  The declarations and paths also accumulate in interp, if one is given.
+  """
+  if interp is None:
+    interp = new_interp()
+
+  for i, statement in enumerate(spec):
+    num_declarations = len(interp[0])
+    parse_top_level_statement(statement, i, interp)
+    yield from interp[0][num_declarations:]
+
+def parse_top_level_statement(statement, index: int, interp: tuple[list, list]):
+  # Same as parsing item `index` in parse_list(spec, key_parent=None, val_parent=None, interp=interp, depth=0)
+  # Top-level statements don't depend on each other, so they can be parsed separately.
+  if type(statement) is str:
+    parse_str(statement, parent=None, interp=interp, depth=1, path=(None, index))
+  elif type(statement) is dict:
+    parse_dict(statement, key_parent=None, val_parent=None, interp=interp, depth=1, path=(None, index))
+
+# --- incremental parsing
+class DeclarationDelta(NamedTuple):
+  added: list[tuple]
+  removed: list[tuple]
+
+"""
+Keeps the parse of each top-level statement of a spec, so that re-parsing an edited
+spec only parses the statements that changed. eg. in an editor loop:
+
+  incremental = IncrementalParse()
+  delta = incremental.update(spec)         # parses everything
+  delta = incremental.update(edited_spec)  # only parses the edited statements
+  incremental.interp                       # same as make_relations(edited_spec)
+
+Statements are matched by content, so inserting or deleting a statement doesn't
+re-parse the ones after it; their recorded paths are renumbered instead.
+"""
+class IncrementalParse:
+  def __init__(self):
+    self.interp = new_interp()
+    self._fingerprints: list[str] = []  # per top-level statement
+    self._declarations: list[tuple[tuple, ...]] = []
+    self._paths: list[list] = []  # [statement, path], with the statement's index at the root of path
+    self._table_sizes: list[int] = []  # len(self.interp[0]) after adding each statement
+    self._counts: dict[tuple, int] = {}  # how many statements declare each declaration
+
+  def update(self, spec: list) -> DeclarationDelta:
+    """
+    Parse spec, reusing statements from the previous update. Returns the declarations
+    that were added and removed since then. If parsing fails, nothing is changed.
+    """
+    assert type(spec) is list, 'Top level of YAML specification must be a list.'
+    fingerprints = [repr(statement) for statement in spec]
+
+    declarations = []
+    paths = []
+    counts = dict(self._counts)
+    changed = []  # (declarations, +1/-1) for each statement that was parsed or dropped
+
+    matcher = difflib.SequenceMatcher(None, self._fingerprints, fingerprints, autojunk=False)
+    for opcode, old_start, old_end, new_start, new_end in matcher.get_opcodes():
+      if opcode == 'equal':
+        for old_index, new_index in zip(range(old_start, old_end), range(new_start, new_end)):
+          declarations.append(self._declarations[old_index])
+          paths.append(self._paths[old_index] if old_index == new_index else _renumber_paths(self._paths[old_index], new_index))
+        continue
+
+      for old_index in range(old_start, old_end):
+        changed.append((self._declarations[old_index], -1))
+      for new_index in range(new_start, new_end):
+        statement_interp = new_interp()
+        parse_top_level_statement(spec[new_index], new_index, statement_interp)
+        declarations.append(tuple(statement_interp[0]))
+        paths.append(statement_interp[1])
+        changed.append((declarations[-1], 1))
+
+    # Everything parsed, so now we can update.
+    previous_counts = {}  # of the declarations that changed
+    for statement_declarations, change in changed:
+      for declaration in statement_declarations:
+        count = counts.get(declaration, 0)
+        previous_counts.setdefault(declaration, count)
+        if count + change == 0:
+          del counts[declaration]
+        else:
+          counts[declaration] = count + change
+
+    # The declarations are re-added in order, so that the table matches make_relations(spec).
+    # Statements before the first change are where they were, so their rows are kept.
+    num_kept = _num_unchanged_statements(matcher)
+    num_kept_rows = self._table_sizes[num_kept - 1] if num_kept > 0 else 0
+    interp = (self.interp[0].head(num_kept_rows), [])
+    table_sizes = self._table_sizes[:num_kept]
+    for statement_declarations in declarations[num_kept:]:
+      interp[0].extend(statement_declarations)
+      table_sizes.append(len(interp[0]))
+    for statement_paths in paths:
+      interp[1].extend(statement_paths)
+
+    self.interp = interp
+    self._fingerprints = fingerprints
+    self._declarations = declarations
+    self._paths = paths
+    self._table_sizes = table_sizes
+    self._counts = counts
+    # A declaration that moved between statements is neither added nor removed.
+    return DeclarationDelta(
+      added=[declaration for declaration, count in previous_counts.items() if count == 0 and declaration in counts],
+      removed=[declaration for declaration, count in previous_counts.items() if count > 0 and declaration not in counts],
+    )
+
+def _num_unchanged_statements(matcher: difflib.SequenceMatcher) -> int:
+  # How many statements at the start of the spec were kept as they were.
+  opcodes = matcher.get_opcodes()
+  if not opcodes:
+    # Both specs are empty.
+    return 0
+  opcode, old_start, old_end, new_start, new_end = opcodes[0]
+  return old_end if opcode == 'equal' else 0
+
+def _renumber_paths(paths: list, index: int) -> list:
+  # The statement's index is the root of its paths, so every node is rebuilt on top of a new root.
+  # NOTE: some paths are empty (eg. and-phrases), so they don't say which statement they're from.
+  renumbered = {}  # id(old_node): new_node
+
+  def renumber(path: PathNode) -> PathNode:
+    if path is None:
+      return None
+    new_path = renumbered.get(id(path))
+    if new_path is None:
+      parent, segment = path
+      new_path = renumbered[id(path)] = (None, index) if parent is None else (renumber(parent), segment)
+    return new_path
+
+  return [[statement, renumber(path)] for statement, path in paths]
+
 
 if __name__ == '__main__':
   spec = spec_from_file('calendar.yaml')
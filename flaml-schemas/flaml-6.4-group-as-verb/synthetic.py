@@ -0,0 +1,125 @@
+"""
+Synthetic FLAML specs of tunable size and shape.
+
+The hand-written specs are all small, so this makes larger ones for benchmarks and
+stress tests. A spec is a list of instances, each with a `group foreach>` of parts,
+an `affects>` target that is a compound like `items3.sel1/part0->items7`, an alias
+chain, a view and an action. SpecShape controls how many of each and how deep.
+
+Generated specs are deterministic for a given shape (including its seed).
+"""
+import random
+from typing import NamedTuple
+
+import yaml
+
+# Standard types (see standard.yaml) that instances can be tagged with.
+STRUCTURE_TYPES = ('linear', 'tree', 'digraph', '2D')
+ENCODINGS = ('vstack', 'hstack', 'hwrap', 'vwrap', 'cluster')
+MARKS = ('points', 'rectangles', 'text', 'hlines', 'icons')
+
+class SpecShape(NamedTuple):
+  instances: int = 10           # top-level instances, each with its own view and action
+  fanout: int = 2               # parts in each instance's `group foreach>`
+  compound_depth: int = 1       # segments (`.x`, `/x`, `->x`) in each `affects>` target
+  alias_chain: int = 0          # `x =: y` links in each instance's alias chain
+  standard_types: bool = True   # tag instances, views and actions with standard types
+  type_definitions: int = 0     # extra `def (kindN)` types, used by instances in turn
+  seed: int = 0
+
+def _instance_name(index: int) -> str:
+  return f'items{index}'
+
+def _compound(rng: random.Random, shape: SpecShape) -> str:
+  # Start somewhere else in the spec, so compounds link instances together.
+  expression = _instance_name(rng.randrange(shape.instances))
+  for depth in range(shape.compound_depth):
+    match rng.randrange(3):
+      case 0:
+        expression += f'.sel{depth}'
+      case 1:
+        expression += f'/part{rng.randrange(shape.fanout)}'
+      case 2:
+        expression += f'->{_instance_name(rng.randrange(shape.instances))}'
+  return expression
+
+def _type_prefix(shape: SpecShape, type_name: str) -> str:
+  return f'({type_name}) ' if shape.standard_types else ''
+
+def _instance_type(shape: SpecShape, index: int) -> str | None:
+  num_types = len(STRUCTURE_TYPES) + shape.type_definitions
+  type_index = index % num_types
+  if type_index >= len(STRUCTURE_TYPES):
+    return f'kind{type_index - len(STRUCTURE_TYPES)}'  # user types are tagged either way
+  if shape.standard_types:
+    return STRUCTURE_TYPES[type_index]
+  return None
+
+def _make_type_definitions(shape: SpecShape) -> list:
+  spec = []
+  for type_index in range(shape.type_definitions):
+    parent = STRUCTURE_TYPES[type_index % len(STRUCTURE_TYPES)]
+    spec.append({f'def (kind{type_index}) extends ({parent})': {
+      'group foreach>': [f'/slot{slot}' for slot in range(shape.fanout)],
+    }})
+  return spec
+
+def _make_instance(rng: random.Random, index: int, shape: SpecShape) -> list:
+  name = _instance_name(index)
+  type_name = _instance_type(shape, index)
+  prefix = f'({type_name}) ' if type_name is not None else ''
+
+  statements = [{f'{prefix}{name}': {
+    'group foreach>': [f'/part{part}' for part in range(shape.fanout)],
+    'affects>': _compound(rng, shape),
+  }}]
+
+  # alias{i}_0 =: items{i}, alias{i}_1 =: alias{i}_0, ...
+  shown = name
+  for link in range(shape.alias_chain):
+    alias = f'alias{index}_{link}'
+    statements.append({f'{alias} =': shown})
+    shown = alias
+
+  statements.append({f'{_type_prefix(shape, "gui")}view{index}': {
+    f'/marks.{rng.choice(MARKS)} <>': shown,
+    f'/encoding.{rng.choice(ENCODINGS)} <>': f'{name}/part0',
+  }})
+  statements.append({f'{_type_prefix(shape, "action")}select{index}': {
+    'update>': f'{name}.selected subset> {name}',
+    'directions>': name,
+  }})
+  return statements
+
+def make_spec(shape: SpecShape = SpecShape()) -> list:
+  """
+  Make a spec (as loaded from YAML) with the given shape.
+  """
+  assert shape.instances > 0, 'A spec needs at least one instance.'
+  assert shape.fanout > 0, '`group foreach>` needs at least one part.'
+  rng = random.Random(shape.seed)
+  spec = _make_type_definitions(shape)
+  for index in range(shape.instances):
+    spec.extend(_make_instance(rng, index, shape))
+  return spec
+
+def make_spec_yaml(shape: SpecShape = SpecShape()) -> str:
+  """
+  make_spec, as YAML text (eg. to write to a file for the cache or the viewer).
+  """
+  return yaml.safe_dump(make_spec(shape), sort_keys=False)
+
+def nodes_per_instance(shape: SpecShape) -> int:
+  """
+  Rough number of compiled graph nodes each instance adds, to size specs by nodes.
+  """
+  # instance, its parts, its `affects>` target (unless it's just another instance)
+  # and `.selected`, the view with its mark and encoding, and the action.
+  return 1 + shape.fanout + (shape.compound_depth > 0) + 1 + 3 + 1
+
+def shape_for_nodes(num_nodes: int, **shape_fields) -> SpecShape:
+  """
+  A shape whose compiled graph has roughly num_nodes nodes.
+  """
+  shape = SpecShape(**shape_fields)
+  return shape._replace(instances=max(1, round(num_nodes / nodes_per_instance(shape))))
@@ -0,0 +1,103 @@
+import pickle
+import pytest
+
+import networkx as nx
+import cache
+import compiler
+import parser
+from parser import rel, dpower
+
+SPEC = """
+- def (video):
+    group foreach>:
+      - /timestamps
+- (video) clips
+"""
+
+@pytest.fixture
+def spec_file(tmp_path, monkeypatch):
+  monkeypatch.setenv('FLAML_CACHE_DIR', str(tmp_path / 'cache'))
+  file_path = tmp_path / 'spec.yaml'
+  file_path.write_text(SPEC)
+  return file_path
+
+def cache_entries():
+  return sorted(path.name.split('.')[1] for path in cache.cache_dir().iterdir())
+
+class TestCache:
+  def test_matches_parser(self, spec_file):
+    spec = parser.spec_from_string(SPEC)
+    for _ in range(2):  # cold, then warm
+      assert cache.load_spec(spec_file) == spec
+      assert list(cache.load_relations(spec_file)[0]) == list(parser.make_relations(spec)[0])
+      assert cache.load_relations(spec_file)[1] == parser.make_relations(spec)[1]
+      assert cache.load_type_definitions(spec_file) == parser.parse_type_definitions(spec)
+    assert cache_entries() == ['relations', 'spec', 'types']
+
+  def test_warm_skips_yaml(self, spec_file, monkeypatch):
+    cache.load_relations(spec_file)
+    monkeypatch.setattr(cache, '_load_yaml', None)
+    assert len(cache.load_relations(spec_file)[0]) > 0
+
+  def test_fresh_copies(self, spec_file):
+    type_interps, _ = cache.load_type_definitions(spec_file)
+    type_interps['video'].append(('x', rel.GROUP, 'y', dpower.WEAK))
+    assert ('x', rel.GROUP, 'y', dpower.WEAK) not in cache.load_type_definitions(spec_file)[0]['video']
+
+  def test_content_invalidation(self, spec_file):
+    assert 'audio' not in cache.load_type_definitions(spec_file)[0]
+    spec_file.write_text(SPEC.replace('video', 'audio'))
+    assert 'audio' in cache.load_type_definitions(spec_file)[0]
+    assert len(cache_entries()) == 2
+
+  def test_corrupt_entry(self, spec_file):
+    spec = cache.load_spec(spec_file)
+    for path in cache.cache_dir().iterdir():
+      path.write_bytes(b'not a pickle')
+    assert cache.load_spec(spec_file) == spec
+
+  def test_disabled(self, spec_file, monkeypatch):
+    monkeypatch.setenv('FLAML_CACHE', '0')
+    cache.load_spec(spec_file)
+    assert not cache.cache_dir().exists()
+
+  def test_unwritable(self, spec_file):
+    # The cache dir is a file, so it can't be made.
+    cache.cache_dir().write_text('')
+    assert cache.load_spec(spec_file) == parser.spec_from_string(SPEC)
+
+  def test_failed_write(self, spec_file, monkeypatch):
+    def dump(*args, **kwargs):
+      raise pickle.PicklingError('no')
+    monkeypatch.setattr(pickle, 'dump', dump)
+    with pytest.raises(pickle.PicklingError):
+      cache.load_spec(spec_file)
+    assert cache_entries() == []  # no leftover temporary file
+
+class TestGraphCache:
+  def test_matches_compiler(self, spec_file):
+    graph = compiler.compile(str(spec_file))
+    for _ in range(2):  # cold, then warm
+      assert nx.utils.graphs_equal(compiler.compile_cached(str(spec_file)), graph)
+    spec = parser.spec_from_string(SPEC)
+    for _ in range(2):
+      assert nx.utils.graphs_equal(compiler.compile_cached(spec), graph)
+    assert cache_entries().count('graph') == 2
+
+  def test_warm_skips_compiling(self, spec_file, monkeypatch):
+    compiler.compile_cached(str(spec_file))
+    compiler.compile_cached(parser.spec_from_string(SPEC))
+    monkeypatch.setattr(compiler, 'compile_parsed', None)
+    monkeypatch.setattr(compiler, 'compile_spec', None)
+    assert 'clips' in compiler.compile_cached(str(spec_file))
+    assert 'clips' in compiler.compile_cached(parser.spec_from_string(SPEC))
+
+  def test_fresh_copies(self, spec_file):
+    compiler.compile_cached(str(spec_file)).add_node('extra')
+    assert 'extra' not in compiler.compile_cached(str(spec_file))
+
+  def test_compiler_invalidation(self, spec_file, monkeypatch):
+    compiler.compile_cached(str(spec_file))
+    monkeypatch.setattr(cache, 'compiler_version', lambda: 'changed')
+    compiler.compile_cached(str(spec_file))
+    assert cache_entries().count('graph') == 2
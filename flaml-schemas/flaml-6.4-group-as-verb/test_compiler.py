@@ -1,8 +1,11 @@
 from pathlib import Path
 import yaml
+import pytest
 
 import networkx as nx
+import numpy as np
 import compiler
+import parser
 
 def get_test_specs():
   real_path = Path(__file__).with_name('test-specs.yaml')  # https://stackoverflow.com/a/65174822
@@ -44,3 +47,537 @@ class TestCompilationSmoke:
       print('Compiling', spec_file_name)
       graph = compiler.compile(spec_file_name)
       assert not is_graph_empty(graph)
+
+class TestStandardLibrary:
+  def test_shared_snapshot(self):
+    standard = compiler.load_standard_library()
+    compiler.compile('calendar.yaml')
+    assert compiler.load_standard_library() is standard
+
+  def test_read_only(self):
+    standard = compiler.load_standard_library()
+    with pytest.raises(TypeError):
+      standard.type_interps['linear'] = []
+    assert isinstance(standard.type_interps['linear'], tuple)
+    assert isinstance(standard.standard_types, frozenset)
+
+  def test_expanded(self):
+    standard = compiler.load_standard_library()
+    # (linear) extends (tree), so it includes tree's attributes.
+    assert set(standard.type_interps['tree']) <= set(standard.type_interps['linear'])
+    assert standard.type_ancestry['linear'] == {'linear': 0, 'tree': 1, 'digraph': 2, 'structure': 3}
+
+  def test_invalidation(self, tmp_path, monkeypatch):
+    standard = compiler.load_standard_library()
+    standard_file = tmp_path / 'standard.yaml'
+    standard_file.write_text(parser.standard_path().read_text())
+    monkeypatch.setattr(parser, 'standard_path', lambda: standard_file)
+    monkeypatch.setenv('FLAML_CACHE_DIR', str(tmp_path / 'cache'))
+
+    assert compiler.load_standard_library() is standard  # same content
+    standard_file.write_text(standard_file.read_text() + '\n- def (extra)\n')
+    assert 'extra' in compiler.load_standard_library().standard_types
+
+  def test_spec_extends_standard_root(self):
+    # Giving a standard type a new parent means the snapshot's expansion can't be used.
+    graph = compiler.compile_spec(parser.spec_from_string("""
+- def (collection):
+    group foreach>:
+      - /size
+- def (structure) extends (collection):
+    group foreach>:
+      - /shape
+- (linear) items:
+    group foreach>: a
+    affects>: /size
+"""))
+    assert 'items/size' in graph.nodes
+    assert graph.nodes['items']['ancestry_distances']['collection'] == 4
+
+  def test_spec_extends_standalone_standard_type(self):
+    # (action) has no parent or children in the standard library.
+    graph = compiler.compile_spec(parser.spec_from_string("""
+- def (foo)
+- def (action) extends (foo):
+    group foreach>:
+      - /bar
+- (action) x
+"""))
+    assert graph.nodes['x']['ancestry_distances'] == {'action': 0, 'foo': 1}
+
+class TestTypeRegistryExtension:
+  type_interps = {
+    'gui': [('linear', parser.rel.TYPE, '@/tracks', parser.dpower.STRONG)],
+    'linear': [('point', parser.rel.TYPE, '@/head', parser.dpower.STRONG)],
+    'point': [],
+  }
+
+  def test_nested(self):
+    extension = compiler.make_type_registry_extension({'view': 'gui'}, compiler.make_type_templates(self.type_interps), ['view/tracks', 'view/tracks/head'], lambda node: node)
+    assert extension == {'view/tracks': 'linear', 'view/tracks/head': 'point'}
+
+  def test_only_valid_nodes(self):
+    extension = compiler.make_type_registry_extension({'view': 'gui'}, compiler.make_type_templates(self.type_interps), ['view/tracks'], lambda node: node)
+    assert extension == {'view/tracks': 'linear'}
+
+  def test_cycle(self):
+    # A type that tags its own instance again stops instead of recursing forever.
+    type_interps = {'loop': [('loop', parser.rel.TYPE, '@', parser.dpower.STRONG)]}
+    extension = compiler.make_type_registry_extension({'a': 'loop'}, compiler.make_type_templates(type_interps), ['a'], lambda node: node)
+    assert extension == {'a': 'loop'}
+
+class TestEdgeStore:
+  def test_duplicates(self):
+    edge_store = compiler.EdgeStore()
+    edge_store.add_edge('a', parser.rel.GROUP, 'b')
+    edge_store.add_edge('a', parser.rel.GROUP, 'b')
+    edge_store.add_edge('a', parser.rel.AFFECTS, 'b')
+    assert len(edge_store) == 2
+    assert 'a' in edge_store and 'c' not in edge_store
+
+    graph = edge_store.to_multidigraph()
+    assert sorted(relation for _, _, relation in graph.edges(data='relation')) == ['AFFECTS', 'GROUP']
+
+  def test_relation_order(self):
+    # Edges come out grouped by relation, in the order relations are defined.
+    edge_store = compiler.EdgeStore()
+    edge_store.add_edge('c', parser.rel.AFFECTS, 'd')
+    edge_store.add_edge('a', parser.rel.MAPTO, 'b')
+    graph = edge_store.to_multidigraph()
+    assert list(graph.nodes) == ['a', 'b', 'c', 'd']
+
+  def test_relations_between_same_nodes(self):
+    # `move-event` both updates and directions `time`; the graph keeps both.
+    graph = compiler.compile('calendar.yaml')
+    relations = {data['relation'] for data in graph.get_edge_data('move-event', 'time').values()}
+    assert relations == {'UPDATE_SRC', 'DIRECTION'}
+
+class TestAliasResolver:
+  def test_classes(self):
+    aliases = compiler.AliasResolver()
+    aliases.union('c', 'a')
+    aliases.union('x', 'y')
+    aliases.union('a', 'b')
+    # Members are in the order they were first declared, not by size or name.
+    assert aliases.classes() == [['c', 'a', 'b'], ['x', 'y']]
+    assert aliases.registry() == {
+      'c': 'c = a = b', 'a': 'c = a = b', 'b': 'c = a = b',
+      'x': 'x = y', 'y': 'x = y',
+    }
+
+  def test_merge_classes(self):
+    aliases = compiler.AliasResolver()
+    aliases.union('a', 'b')
+    aliases.union('c', 'd')
+    aliases.union('d', 'b')
+    assert aliases.find('a') == aliases.find('c')
+    assert aliases.classes() == [['a', 'b', 'c', 'd']]
+
+  def test_graph_index(self):
+    graph = compiler.compile_spec(parser.spec_from_string("""
+- videos:
+    group foreach>: /frames
+- clips =: videos
+- (gui) player:
+    /marks.points <>: clips
+"""))
+    assert 'videos = clips' in graph.nodes
+    assert graph.graph['aliases'] == {'videos': 'videos = clips', 'clips': 'videos = clips'}
+
+class TestTypeTemplates:
+  type_interp = [
+    ('linear', parser.rel.TYPE, '@/timeline', parser.dpower.STRONG),
+    ('@/timeline', parser.rel.AFFECTS, '@/images', parser.dpower.WEAK),
+    ('@', parser.rel.GROUP_FOREACH, 'frames', parser.dpower.STRONG),
+  ]
+
+  def test_matches_substitution(self):
+    template = compiler.make_type_template(self.type_interp)
+    for instance_name in ['videos', 'videos.in-editor = editors/videos']:
+      assert compiler.instantiate(template.declarations, instance_name) == [
+        parser.substitute_instance_name_in_decl(declaration, instance_name) for declaration in self.type_interp
+      ]
+
+  def test_subsets(self):
+    template = compiler.make_type_template(self.type_interp)
+    assert compiler.instantiate(template.type_declarations, 'videos') == [('linear', parser.rel.TYPE, 'videos/timeline', parser.dpower.STRONG)]
+    assert compiler.instantiate(template.weak_declarations, 'videos') == [('videos/timeline', parser.rel.AFFECTS, 'videos/images', parser.dpower.WEAK)]
+
+  def test_interp_unchanged(self):
+    # Declarations from types aren't added to the caller's table.
+    spec = parser.spec_from_file('video-editor.yaml')
+    interp = parser.make_relations(spec)
+    num_declarations = len(interp[0])
+    compiler.compile_parsed(interp, parser.parse_type_definitions(spec))
+    assert len(interp[0]) == num_declarations
+
+class TestTypeHierarchy:
+  type_interps = {
+    'tree': [('tree', parser.rel.GROUP_FOREACH, '@/root', parser.dpower.STRONG)],
+    'linear': [
+      ('linear', parser.rel.GROUP_FOREACH, '@/first', parser.dpower.STRONG),
+      ('tree', parser.rel.GROUP_FOREACH, '@/root', parser.dpower.STRONG),
+    ],
+    'timeline': [],
+  }
+  type_parents = {'linear': 'tree', 'timeline': 'linear'}
+
+  def test_ancestry(self):
+    hierarchy = compiler.TypeHierarchy(self.type_interps, self.type_parents)
+    assert hierarchy.ancestry_distances('timeline') == {'timeline': 0, 'linear': 1, 'tree': 2}
+    assert hierarchy.has_ancestry('tree')
+    assert not hierarchy.has_ancestry('gui')
+
+  def test_flattened(self):
+    # Nearest first, and the declaration linear repeats from tree is only there once.
+    hierarchy = compiler.TypeHierarchy(self.type_interps, self.type_parents)
+    assert hierarchy.declarations('timeline') == (
+      ('linear', parser.rel.GROUP_FOREACH, '@/first', parser.dpower.STRONG),
+      ('tree', parser.rel.GROUP_FOREACH, '@/root', parser.dpower.STRONG),
+    )
+    assert hierarchy.declarations('timeline') is hierarchy.declarations('timeline')
+
+  def test_cycle(self):
+    with pytest.raises(AssertionError):
+      compiler.TypeHierarchy(self.type_interps, self.type_parents | {'tree': 'timeline'})
+
+  def test_extend(self):
+    standard = compiler.load_standard_library()
+    hierarchy = standard.hierarchy.extend({'timeline': []}, {'timeline': 'linear'})
+    assert hierarchy.ancestry_distances('timeline')['structure'] == 4
+    # The standard library's types are shared, not worked out again.
+    assert hierarchy.template('linear') is standard.hierarchy.template('linear')
+
+    # Unless the spec changes their ancestry.
+    hierarchy = standard.hierarchy.extend({'collection': []}, {'structure': 'collection'})
+    assert hierarchy.ancestry_distances('linear')['collection'] == 4
+    assert hierarchy.template('linear') is not standard.hierarchy.template('linear')
+
+  def test_own_type_wins(self):
+    # linear's own type for @/root wins over the one from tree.
+    type_interps = self.type_interps | {
+      'tree': [('digraph', parser.rel.TYPE, '@/root', parser.dpower.STRONG)],
+      'linear': [('point', parser.rel.TYPE, '@/root', parser.dpower.STRONG)],
+    }
+    hierarchy = compiler.TypeHierarchy(type_interps, self.type_parents)
+    template = hierarchy.template('timeline')
+    assert compiler.instantiate(template.type_declarations, 'time') == [('point', parser.rel.TYPE, 'time/root', parser.dpower.STRONG)]
+
+class TestLayers:
+  def test_propagate(self):
+    layers = compiler.propagate_layers(
+      {'view': 'presentation', 'tracks': 'conceptual', 'videos': 'conceptual', 'other': 'conceptual'},
+      {'view': ['tracks'], 'tracks': ['videos']},
+    )
+    assert layers == {'view': 'presentation', 'tracks': 'presentation', 'videos': 'presentation', 'other': 'conceptual'}
+
+  def test_nearest_wins(self):
+    # A (gui) inside an (action) stays presentation, and so do the things it groups.
+    layers = compiler.propagate_layers(
+      {'play': 'action', 'preview': 'presentation', 'frames': 'conceptual', 'button': 'conceptual'},
+      {'play': ['preview', 'button'], 'preview': ['frames']},
+    )
+    assert layers == {'play': 'action', 'preview': 'presentation', 'frames': 'presentation', 'button': 'action'}
+
+  def test_tie(self):
+    # Equally near: the first layer in node_layers wins.
+    layers = compiler.propagate_layers(
+      {'view': 'presentation', 'play': 'action', 'time': 'conceptual'},
+      {'view': ['time'], 'play': ['time']},
+    )
+    assert layers['time'] == 'presentation'
+
+  def test_deep(self):
+    depth = 2000
+    spec = [{'(gui) v0': {'group foreach>': 'v1'}}] + [{f'v{i}': {'group foreach>': f'v{i + 1}'}} for i in range(1, depth)]
+    graph = compiler.compile_spec(spec)
+    assert all(layer == 'presentation' for _, layer in graph.nodes(data='layer'))
+
+class TestCompileStats:
+  def test_passes(self):
+    spec = parser.spec_from_file('calendar.yaml')
+    stats = compiler.CompileStats()
+    graph = compiler.compile_spec(spec, stats=stats)
+    assert nx.utils.graphs_equal(graph, compiler.compile_spec(spec))
+
+    passes = {pass_stats.name: pass_stats for pass_stats in stats.passes}
+    assert list(passes) == ['parse', 'parse types', 'standard library', 'alias', 'strong', 'ancestry',
+                            'type instantiation', 'weak', 'types', 'layers', 'combine']
+    assert all(pass_stats.seconds >= 0 for pass_stats in stats.passes)
+    assert passes['parse'].declarations == len(parser.make_relations(spec)[0])
+    assert passes['strong'].edges_added + passes['weak'].edges_added == graph.number_of_edges()
+    assert passes['weak'].weak_rejected > 0
+    assert passes['weak'].edges_added <= passes['weak'].declarations - passes['weak'].weak_rejected
+    assert (passes['combine'].nodes, passes['combine'].edges) == (graph.number_of_nodes(), graph.number_of_edges())
+
+    for line, pass_stats in zip(stats.format().splitlines()[1:], stats.passes):
+      assert line.startswith(pass_stats.name)
+    assert stats.to_json()[0]['name'] == 'parse'
+
+  def test_compile(self):
+    stats = compiler.CompileStats()
+    compact = compiler.compile_spec(parser.spec_from_file('calendar.yaml'), compact=True, stats=stats)
+    assert stats.passes[-1].nodes == compact.number_of_nodes()
+
+    stats = compiler.CompileStats()
+    compiler.compile('calendar.yaml', stats=stats)
+    assert stats.passes[0].name == 'load'
+
+class TestFinalise:
+  spec = [
+    {'(linear) a': {'group foreach>': '/x'}},
+    {'(linear) b': {'group foreach>': '/y'}},
+    {'(gui) view': {'/marks.points <>': 'a'}},
+  ]
+
+  def test_shared_ancestry(self):
+    graph = compiler.compile_spec(self.spec)
+    a_ancestry = graph.nodes['a']['ancestry_distances']
+    assert a_ancestry is graph.nodes['b']['ancestry_distances']
+    assert a_ancestry == compiler.load_standard_library().type_ancestry['linear']
+    assert graph.nodes['a/x']['ancestry_distances'] is None
+    with pytest.raises(TypeError):
+      a_ancestry['linear'] = 3
+    with pytest.raises(TypeError):
+      a_ancestry.update(tree=1)
+
+  def test_copies(self):
+    import copy
+    import pickle
+    graph = compiler.compile_spec(self.spec)
+    for copied in (pickle.loads(pickle.dumps(graph)), copy.deepcopy(graph)):
+      assert nx.utils.graphs_equal(graph, copied)
+      assert copied.nodes['a']['ancestry_distances'] == graph.nodes['a']['ancestry_distances']
+
+  def test_json(self):
+    orjson = pytest.importorskip('orjson')
+    graph = compiler.compile_spec(self.spec)
+    data = orjson.loads(orjson.dumps(nx.node_link_data(graph)))
+    nodes = {node['id']: node for node in data['nodes']}
+    assert nodes['a']['ancestry_distances'] == dict(graph.nodes['a']['ancestry_distances'])
+
+class TestCompactGraph:
+  spec = [
+    {'(linear) a': {'group foreach>': '/x', 'affects>': 'b'}},
+    {'(linear) b': {'group foreach>': '/y'}},
+    {'(gui) view': {'/marks.points <>': 'a', '/encoding.vstack <>': 'a/x'}},
+  ]
+
+  def test_arrays(self):
+    graph = compiler.compile_spec(self.spec)
+    compact = compiler.make_compact_graph(graph)
+    assert list(compact.nodes) == list(graph.nodes)
+    assert compact.number_of_edges() == graph.number_of_edges()
+    for node, attributes in graph.nodes(data=True):
+      node_id = compact.node_ids[node]
+      type_id = compact.node_type[node_id]
+      assert (compact.types[type_id] if type_id >= 0 else None) == attributes.get('type')
+      assert compiler.LAYERS[compact.node_layer[node_id]] == attributes['layer']
+      assert compact.is_standard[node_id] == attributes['is_standard']
+
+    # CSR, and COO with edge_sources.
+    a = compact.node_ids['a']
+    a_edges = slice(compact.edge_offsets[a], compact.edge_offsets[a + 1])
+    assert sorted(compact.nodes[target] for target in compact.edge_targets[a_edges]) == sorted(graph.successors('a'))
+    edges = zip(compact.edge_sources().tolist(), compact.edge_targets.tolist(), compact.edge_relations.tolist(), compact.edge_keys().tolist())
+    assert [(compact.nodes[source], compact.nodes[target], key, parser.rel(relation).name) for source, target, relation, key in edges] == \
+      [(source, target, key, relation) for source, target, key, relation in graph.edges(keys=True, data='relation')]
+
+  def test_round_trip(self):
+    for spec in (self.spec, parser.spec_from_file('calendar.yaml'), parser.spec_from_file('video-editor.yaml')):
+      graph = compiler.compile_spec(spec)
+      compact = compiler.compile_spec(spec, compact=True)
+      copied = compact.to_multidigraph()
+      # Same order too, so the exporters give the same results from either form.
+      assert list(copied.nodes(data=True)) == list(graph.nodes(data=True))
+      assert list(copied.edges(keys=True, data=True)) == list(graph.edges(keys=True, data=True))
+      assert copied.graph == graph.graph
+      assert compiler.node_link_data(compact) == compiler.node_link_data(graph)
+      assert compiler.mermaid_graph(compact) == compiler.mermaid_graph(graph)
+
+      converted = compiler.make_compact_graph(graph)
+      for field, value in compact._asdict().items():
+        assert np.array_equal(getattr(converted, field), value) if isinstance(value, np.ndarray) else getattr(converted, field) == value
+
+  def test_parallel_edges(self):
+    graph = nx.MultiDiGraph(aliases={})
+    graph.add_node('a', is_standard=False, layer='conceptual', ancestry_distances=None)
+    graph.add_node('b', is_standard=False, layer='conceptual', ancestry_distances=None)
+    graph.add_edge('a', 'b', relation='GROUP', layers=('conceptual', 'conceptual'))
+    graph.add_edge('b', 'a', relation='MAPTO', layers=('conceptual', 'conceptual'))
+    graph.add_edge('a', 'b', relation='AFFECTS', layers=('conceptual', 'conceptual'))
+    compact = compiler.make_compact_graph(graph)
+    assert compact.edge_offsets.tolist() == [0, 2, 3]
+    assert compact.edge_keys().tolist() == [0, 1, 0]
+    assert list(compact.to_multidigraph().edges(keys=True, data='relation')) == list(graph.edges(keys=True, data='relation'))
+
+def graph_contents(graph: nx.MultiDiGraph):
+  # Graphs are equal if these are, whatever the order of their nodes and edges.
+  nodes = {node: dict(attributes) for node, attributes in graph.nodes(data=True)}
+  edges = sorted((source, target, attributes['relation'], attributes['layers']) for source, target, attributes in graph.edges(data=True))
+  return nodes, edges, graph.graph['aliases']
+
+class TestIncrementalCompile:
+  def check(self, incremental: compiler.IncrementalCompile, spec: list):
+    assert graph_contents(incremental.graph) == graph_contents(compiler.compile_spec(spec))
+
+  def test_specs(self):
+    for spec_file_name in ['imessage.yaml', 'calendar.yaml', 'video-editor.yaml', 'figma.yaml']:
+      spec = parser.spec_from_file(spec_file_name)
+      incremental = compiler.IncrementalCompile()
+      delta = incremental.update(spec)
+      assert len(delta.added_nodes) == incremental.graph.number_of_nodes()
+      self.check(incremental, spec)
+
+  def test_empty(self):
+    incremental = compiler.IncrementalCompile()
+    delta = incremental.update([])
+    assert delta == compiler.GraphDelta([], [], [], [], [])
+    self.check(incremental, [])
+
+    spec = get_test_specs()['calendar']
+    delta = incremental.update(spec)
+    assert len(delta.added_nodes) == incremental.graph.number_of_nodes()
+    self.check(incremental, spec)
+
+  def test_edits(self):
+    specs = get_test_specs()
+    spec = specs['calendar']
+    incremental = compiler.IncrementalCompile()
+    incremental.update(spec)
+    graph = incremental.graph
+
+    # Remove, move, add from another spec, and put everything back.
+    edits = [spec[1:], spec[::-1], spec + specs['slack'][:3], spec]
+    for edited_spec in edits:
+      incremental.update(edited_spec)
+      self.check(incremental, edited_spec)
+    assert incremental.graph is graph  # changed in place
+
+  def test_delta(self):
+    incremental = compiler.IncrementalCompile()
+    incremental.update(['(linear) events', {'weeks': {'group foreach>': 'days'}}])
+    delta = incremental.update(['(linear) events', {'weeks': {'group foreach>': 'hours'}}])
+    assert delta.added_nodes == ['hours']
+    assert delta.removed_nodes == ['days']
+    assert delta.added_edges == [('weeks', parser.rel.GROUP_FOREACH, 'hours')]
+    assert delta.removed_edges == [('weeks', parser.rel.GROUP_FOREACH, 'days')]
+
+    # Typing an existing node changes it, and its layer spreads to what it groups.
+    delta = incremental.update(['(linear) events', {'(gui) weeks': {'group foreach>': 'hours'}}])
+    assert set(delta.changed_nodes) == {'weeks', 'hours'}
+    assert incremental.graph.nodes['hours']['layer'] == 'presentation'
+    assert incremental.graph.edges['weeks', 'hours', 0]['layers'] == ('presentation', 'presentation')
+
+  def test_aliases(self):
+    spec = parser.spec_from_string("""
+- (linear) tracks:
+    group foreach>: clips
+- clips:
+    affects>: timeline
+- reels =: clips
+""")
+    incremental = compiler.IncrementalCompile()
+    incremental.update(spec)
+    self.check(incremental, spec)
+    assert 'clips = reels' in incremental.graph
+
+    for edited_spec in [spec[:2], spec + ['films =: reels'], spec]:
+      incremental.update(edited_spec)
+      self.check(incremental, edited_spec)
+
+  def test_types(self):
+    # The instances that types declare come and go with their type and nodes.
+    spec = parser.spec_from_string("""
+- def (playlist):
+    group foreach>:
+      - (linear) /songs
+- (playlist) mix:
+    affects>: mix/songs
+- player:
+    group foreach>: mix
+""")
+    incremental = compiler.IncrementalCompile()
+    incremental.update(spec)
+    self.check(incremental, spec)
+    assert incremental.graph.nodes['mix/songs']['type'] == 'linear'
+
+    for edited_spec in [[spec[0], 'mix', spec[2]], [spec[0], spec[1]], spec, spec[2:]]:
+      incremental.update(edited_spec)
+      self.check(incremental, edited_spec)
+
+  def test_conflicting_types(self):
+    # Two instances declare the same node with different types. The one that
+    # declares it last wins, like compile_spec.
+    spec = parser.spec_from_string("""
+- def (kind-a):
+    group foreach>:
+      - (linear) /x
+- def (kind-b):
+    group foreach>:
+      - (tree) /y
+- (kind-a) p:
+    affects>: p/x
+- (kind-b) q:
+    affects>: q/y
+- p/x =: q/y
+""")
+    incremental = compiler.IncrementalCompile()
+    for edited_spec in [spec, spec[:-1], spec]:
+      incremental.update(edited_spec)
+      self.check(incremental, edited_spec)
+
+  def test_provenance(self):
+    spec = parser.spec_from_string("""
+- def (playlist):
+    group foreach>:
+      - (linear) /songs
+- (playlist) mix:
+    affects>: mix/songs
+- mix/songs.liked:
+    affects>: mix
+""")
+    incremental = compiler.IncrementalCompile()
+    incremental.update(spec)
+    rel, dpower = parser.rel, parser.dpower
+
+    assert incremental.node_provenance('mix') == [
+      compiler.Provenance('strong', ('mix', rel.AFFECTS, 'mix/songs', dpower.STRONG)),
+      compiler.Provenance('strong', ('mix/songs.liked', rel.AFFECTS, 'mix', dpower.STRONG)),
+      compiler.Provenance('strong', ('playlist', rel.TYPE, 'mix', dpower.STRONG)),
+    ]
+    assert incremental.node_provenance('mix/songs')[-1] == compiler.Provenance('type', ('linear', rel.TYPE, 'mix/songs', dpower.WEAK), 'mix')
+    assert incremental.edge_provenance('mix/songs.liked', rel.SUBSET, 'mix/songs') == [
+      compiler.Provenance('weak', ('mix/songs.liked', rel.SUBSET, 'mix/songs', dpower.WEAK)),
+    ]
+    # `mix/songs` declares it, and so does (playlist).
+    assert incremental.edge_provenance('mix', rel.GROUP_FOREACH, 'mix/songs') == [
+      compiler.Provenance('weak', ('mix', rel.GROUP_FOREACH, 'mix/songs', dpower.WEAK)),
+      compiler.Provenance('type', ('mix', rel.GROUP_FOREACH, 'mix/songs', dpower.WEAK), 'mix'),
+    ]
+    assert incremental.edge_provenance('mix', rel.SUBSET, 'mix/songs') == []
+
+  def test_type_definitions(self):
+    spec = parser.spec_from_string("""
+- def (playlist):
+    group foreach>:
+      - /songs
+- (playlist) mix:
+    affects>: mix/songs
+""")
+    incremental = compiler.IncrementalCompile()
+    incremental.update(spec)
+    spec[0] = {'def (playlist)': {'group foreach>': ['/songs', '/covers']}}
+    spec.append({'mix': {'affects>': 'mix/covers'}})
+    delta = incremental.update(spec)
+    assert 'mix' in delta.removed_nodes and 'mix' in delta.added_nodes  # recompiled
+    self.check(incremental, spec)
+
+  def test_failed_update(self):
+    spec = get_test_specs()['slack']
+    incremental = compiler.IncrementalCompile()
+    incremental.update(spec)
+    with pytest.raises(AssertionError):
+      incremental.update([*spec, '(gui) time'])  # time is already (linear)
+    incremental.update(spec)
+    self.check(incremental, spec)
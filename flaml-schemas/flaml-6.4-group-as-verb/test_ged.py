@@ -0,0 +1,107 @@
+import networkx as nx
+
+import compiler
+import metalgo
+import ged
+from parser import rel
+from test_metalgo import get_specs
+
+COSTS = {
+  'node_subst_cost': metalgo.node_subst_cost,
+  'node_del_cost': metalgo.node_diff_cost,
+  'node_ins_cost': metalgo.node_diff_cost,
+  'edge_subst_cost': metalgo.edge_subst_cost,
+  'edge_del_cost': metalgo.edge_diff_cost,
+  'edge_ins_cost': metalgo.edge_diff_cost,
+}
+
+def make_graph(nodes: dict, edges: list):
+  graph = nx.MultiDiGraph()
+  for node, (layer, node_type) in nodes.items():
+    graph.add_node(node, layer=layer, type=node_type, is_standard=node_type is not None)
+  for source, relation, target in edges:
+    graph.add_edge(source, target, relation=relation.name)
+  return graph
+
+"""
+Cost of an edit path, checking that it edits every node and edge once.
+"""
+def path_cost(G1, G2, node_path, edge_path):
+  matches = dict(node_path)
+  assert sorted(u for u, _ in node_path if u is not None) == sorted(G1.nodes)
+  assert sorted(v for _, v in node_path if v is not None) == sorted(G2.nodes)
+  assert sorted(e for e, _ in edge_path if e is not None) == sorted(G1.edges(keys=True))
+  assert sorted(e for _, e in edge_path if e is not None) == sorted(G2.edges(keys=True))
+
+  cost = 0
+  for u, v in node_path:
+    if u is None:
+      cost += COSTS['node_ins_cost'](G2.nodes[v])
+    elif v is None:
+      cost += COSTS['node_del_cost'](G1.nodes[u])
+    else:
+      cost += COSTS['node_subst_cost'](G1.nodes[u], G2.nodes[v])
+  for e1, e2 in edge_path:
+    if e1 is None:
+      cost += COSTS['edge_ins_cost'](G2.edges[e2])
+    elif e2 is None:
+      cost += COSTS['edge_del_cost'](G1.edges[e1])
+    else:
+      assert (matches[e1[0]], matches[e1[1]]) == e2[:2]
+      cost += COSTS['edge_subst_cost'](G1.edges[e1], G2.edges[e2])
+  return cost
+
+SINISTER = make_graph(
+  {
+    'chats': ('conceptual', 'entity'),
+    'messages': ('conceptual', 'entity'),
+    'time': ('conceptual', None),
+    'chat-view': ('presentation', 'gui'),
+  },
+  [
+    ('chats', rel.GROUP, 'messages'),
+    ('time', rel.SUBSET, 'chats'),
+    ('chat-view', rel.COVERS, 'chats'),
+    ('chat-view', rel.COVERS, 'chats'),  # parallel
+    ('messages', rel.MAPTO, 'messages'),  # loop
+  ],
+)
+
+DEXTER = make_graph(
+  {
+    'channels': ('conceptual', 'entity'),
+    'posts': ('conceptual', 'entity'),
+    'name': ('conceptual', None),
+    'channel-view': ('presentation', 'gui'),
+    'post-view': ('presentation', 'gui'),
+  },
+  [
+    ('channels', rel.GROUP, 'posts'),
+    ('name', rel.SUBSET, 'channels'),
+    ('channel-view', rel.COVERS, 'channels'),
+    ('post-view', rel.COVERS, 'posts'),
+    ('channels', rel.GROUP, 'posts'),  # parallel
+  ],
+)
+
+class TestEditPaths:
+  def test_same_as_networkx(self):
+    for G1, G2 in [(SINISTER, DEXTER), (DEXTER, SINISTER), (SINISTER, SINISTER), (SINISTER, nx.MultiDiGraph())]:
+      *_, (_, _, expected) = nx.optimize_edit_paths(G1, G2, **COSTS)
+      *_, (_, _, cost) = ged.optimize_edit_paths(G1, G2, **COSTS)
+      assert cost == expected
+
+  def test_labels(self):
+    *_, (_, _, expected) = ged.optimize_edit_paths(SINISTER, DEXTER, **COSTS)
+    *_, (_, _, cost) = ged.optimize_edit_paths(SINISTER, DEXTER, **COSTS, node_label=metalgo.node_label, edge_label=metalgo.edge_label)
+    assert cost == expected
+
+  def test_paths(self):
+    specs = get_specs()
+    sinister = compiler.compile_spec(specs['calendar'])
+    dexter = compiler.compile_spec(specs['video-editor'])
+    costs = []
+    for node_path, edge_path, cost in ged.optimize_edit_paths(sinister, dexter, **COSTS, timeout=1):
+      assert path_cost(sinister, dexter, node_path, edge_path) == cost
+      costs.append(cost)
+    assert costs == sorted(set(costs), reverse=True)
@@ -3,6 +3,8 @@ from pathlib import Path
 import yaml
 import pprint
 
+import numpy as np
+
 import parser
 import compiler
 import analogylib
@@ -74,6 +76,111 @@ class TestAnalogyComparison:
     analogylib.print_analogy(ablated_analogy)
     assert analogylib.compare(analogy, ablated_analogy, nodes_only=False, verbose=True) == [('deleted edge', (('people', 'messages', 0), ('people', 'messages', 0)))]
 
+class TestCompactGraph:
+  def test_conceptual_adjacent_edges(self):
+    graph = compiler.compile_spec(get_specs()['slack'])
+    compact = compiler.make_compact_graph(graph)
+    assert metalgo.get_conceptual_adjacent_edges(compact) == metalgo.get_conceptual_adjacent_edges(graph)
+
+  def test_cost(self):
+    specs = get_specs()
+    imessage_graph = compiler.compile_spec(specs['imessage'])
+    slack_graph = compiler.compile_spec(specs['slack'])
+    analogy = ({'conversations': 'channels', 'messages': 'messages'}, {('conversations', 'messages', 0): ('channels', 'messages', 0)})
+    analogylib.populate_is_pruned(analogy)
+    compact_cost = metalgo.calculate_cost(analogy, compiler.make_compact_graph(imessage_graph), compiler.make_compact_graph(slack_graph))
+    assert compact_cost == metalgo.calculate_cost(analogy, imessage_graph, slack_graph)
+
+class TestCostModel:
+  def test_costs(self):
+    specs = get_specs()
+    sinister = compiler.compile_spec(specs['calendar'])
+    dexter = compiler.compile_spec(specs['video-editor'])
+    sinister.add_node('events', preference_id=0)
+    dexter.add_node('editors/videos', preference_id=0)
+    dexter.add_node('play', preference_id=1)
+    model = metalgo.cost_model(sinister, dexter)
+
+    sinister_nodes = [data for _, data in sinister.nodes(data=True)]
+    dexter_nodes = [data for _, data in dexter.nodes(data=True)]
+    assert model.node_subst_costs().tolist() == [[metalgo.node_subst_cost(n1, n2) for n2 in dexter_nodes] for n1 in sinister_nodes]
+    assert model.sinister_node_diff().tolist() == [metalgo.node_diff_cost(n1) for n1 in sinister_nodes]
+    assert model.dexter_node_diff().tolist() == [metalgo.node_diff_cost(n2) for n2 in dexter_nodes]
+
+    sinister_edges = [data for *_, data in sinister.edges(keys=True, data=True)]
+    dexter_edges = [data for *_, data in dexter.edges(keys=True, data=True)]
+    assert model.edge_subst_costs().tolist() == [[metalgo.edge_subst_cost(e1, e2) for e2 in dexter_edges] for e1 in sinister_edges]
+    assert model.sinister_edge_diff().tolist() == [metalgo.edge_diff_cost(e1) for e1 in sinister_edges]
+    assert model.dexter_edge_diff().tolist() == [metalgo.edge_diff_cost(e2) for e2 in dexter_edges]
+
+  def test_constrained(self):
+    specs = get_specs()
+    slack_graph = compiler.compile_spec(specs['slack'])
+    imessage_graph = compiler.compile_spec(specs['imessage'])
+    penalized = metalgo.cost_model(slack_graph, imessage_graph)
+    constrained = metalgo.cost_model(slack_graph, imessage_graph, constrained=True)
+    assert np.array_equal(np.isinf(constrained.node_subst), penalized.node_subst == metalgo.MAX_COST)
+    assert np.array_equal(np.isinf(constrained.edge_subst), penalized.edge_subst == metalgo.MAX_COST)
+
+    # Both searches finish well within the timeout.
+    _, iterations = metalgo.compute_analogy(slack_graph, imessage_graph, timeout=10)
+    _, constrained_iterations = metalgo.compute_analogy(slack_graph, imessage_graph, timeout=10, constrained=True)
+    assert constrained_iterations['costs'][-1] == iterations['costs'][-1]
+
+class TestBipartite:
+  def test_isomorphism(self):
+    specs = get_specs()
+    graph = compiler.compile_spec(specs['calendar'])  # has parallel edges
+    analogy, iterations = metalgo.compute_analogy(graph, graph, mode='bipartite')
+
+    for sinister_node, dexter_node in analogylib.get_nodes(analogy, None):
+      assert sinister_node == dexter_node
+    for sinister_edge, dexter_edge in analogylib.get_edges(analogy, None):
+      assert sinister_edge == dexter_edge
+    assert len(analogylib.get_edges(analogy, None)) == graph.number_of_edges()
+    assert iterations['costs'] == [metalgo.calculate_cost(analogy, graph, graph)]
+
+  def test_cost(self):
+    specs = get_specs()
+    slack_graph = compiler.compile_spec(specs['slack'])
+    imessage_graph = compiler.compile_spec(specs['imessage'])
+    _, iterations = metalgo.compute_analogy(slack_graph, imessage_graph, mode='bipartite')
+    # Nothing gets matched across layers or relations.
+    assert iterations['costs'][0] < metalgo.MAX_COST
+
+class TestStream:
+  def test_first_analogy(self, monkeypatch):
+    made = []
+    analogy_from_edit_path = metalgo.analogy_from_edit_path
+    def counted(*args, **kwargs):
+      made.append(args)
+      return analogy_from_edit_path(*args, **kwargs)
+    monkeypatch.setattr(metalgo, 'analogy_from_edit_path', counted)
+
+    specs = get_specs()
+    calendar_graph = compiler.compile_spec(specs['calendar'])
+    veditor_graph = compiler.compile_spec(specs['video-editor'])
+    stream = metalgo.stream_analogies(calendar_graph, veditor_graph, timeout=60)
+    first = next(stream)
+    second = next(stream)
+    assert second.cost < first.cost and second.seconds >= first.seconds
+    stream.close()  # stops the search, well before the timeout
+
+    # Analogies are only made when asked for, and only once.
+    assert made == []
+    analogy = second.analogy()
+    assert second.analogy() is analogy
+    assert len(made) == 1
+    assert len(analogylib.get_nodes(analogy, None)) > 0
+
+  def test_same_as_compute(self):
+    specs = get_specs()
+    graph = compiler.compile_spec(specs['slack'])
+    *_, streamed = metalgo.stream_analogies(graph, graph, timeout=5)
+    analogy, iterations = metalgo.compute_analogy(graph, graph, timeout=5)
+    assert streamed.cost == iterations['costs'][-1]
+    assert streamed.analogy() == analogy
+
 class TestIsomorphism:
   def test_slack_isomorphism(self):
     specs = get_specs()
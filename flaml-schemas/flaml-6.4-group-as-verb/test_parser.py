@@ -6,7 +6,7 @@ pytest flaml-schemas/flaml-6.4-group-as-verb/test.py -rA
 import pprint
 import pytest
 import parser
-from parser import rel, dpower
+from parser import rel, dpower, tok
 
 def parse_str(statement: str, interp: list):
   return parser.parse_str(statement=statement, parent=None, interp=interp, depth=0)
@@ -28,7 +28,7 @@ NOTE: test_interp is a proper interp, including a path.
 """
 def compare_declarations(test_interp, expected: list, verbose=False):
   assert type(test_interp) == tuple, f'Expected tuple, got `{type(test_interp)}` instead.'
-  assert type(test_interp[0]) == list, f'Expected list, got `{type(test_interp)}` instead.'
+  assert isinstance(test_interp[0], (list, parser.DeclarationTable)), f'Expected list or DeclarationTable, got `{type(test_interp[0])}` instead.'
   test = test_interp[0]
 
 
@@ -55,6 +55,102 @@ def compare_declarations(test_interp, expected: list, verbose=False):
    
   return True
 
+class TestLexer:
+  def test_compound(self):
+    assert parser.tokenize('(gui) a.b->/c') == (
+      (tok.TYPE, '(gui) '), (tok.ATOM, 'a'), (tok.DOT, '.'), (tok.ATOM, 'b'),
+      (tok.ARROW, '->'), (tok.SLASH, '/'), (tok.ATOM, 'c'),
+    )
+
+  def test_hyphens(self):
+    assert parser.tokenize('a-b->c-d') == ((tok.ATOM, 'a-b'), (tok.ARROW, '->'), (tok.ATOM, 'c-d'))
+
+  def test_keywords(self):
+    assert parser.tokenize('a and b =') == ((tok.ATOM, 'a'), (tok.AND, ' and '), (tok.ATOM, 'b'), (tok.ALIAS, ' ='))
+    assert parser.tokenize('/marks <>') == ((tok.SLASH, '/'), (tok.ATOM, 'marks'), (tok.MAP, ' <>'))
+    assert parser.tokenize('group foreach>') == ((tok.RELATION, 'group foreach>'),)
+    assert parser.tokenize('items.selected subset> items') == (
+      (tok.ATOM, 'items'), (tok.DOT, '.'), (tok.ATOM, 'selected'), (tok.SPACE, ' '),
+      (tok.RELATION, 'subset>'), (tok.SPACE, ' '), (tok.ATOM, 'items'),
+    )
+
+  def test_lossless(self):
+    for statement in ['(a) b.c/d and (x) y.z->w', 'channels.!dm', '@/timeline', 'a  and b']:
+      assert parser.tokens_to_str(parser.tokenize(statement)) == statement
+
+class TestDeclarationTable:
+  def test_round_trip(self):
+    declarations = [
+      ('a.b', rel.SUBSET, 'a', dpower.WEAK),
+      ('a', rel.GROUP, 'b', dpower.STRONG),
+      ('b', rel.ALIAS, 'c', dpower.STRONG),
+    ]
+    table = parser.DeclarationTable(declarations)
+    assert list(table) == declarations
+    assert table[1] == declarations[1]
+    assert table[1:] == declarations[1:]
+    assert table.symbols == ['a.b', 'a', 'b', 'c']
+
+  def test_packed_fields(self):
+    # Every relation and power has its own bits, even next to the largest node ids.
+    largest_id = (1 << parser._NODE_BITS) - 1
+    keys = {
+      parser._pack_row(source_id, relation.value, target_id, power.value)
+      for source_id, target_id in [(0, 0), (0, largest_id), (largest_id, 0), (largest_id, largest_id)]
+      for relation in rel
+      for power in dpower
+    }
+    assert len(keys) == 4 * len(rel) * len(dpower)
+    assert 0 < min(keys) and max(keys) < 1 << 63
+
+  def test_duplicates(self):
+    table = parser.DeclarationTable()
+    table.append(('a', rel.GROUP, 'b', dpower.STRONG))
+    table.append(('a', rel.GROUP, 'b', dpower.WEAK))
+    table.append(('a', rel.GROUP, 'b', dpower.STRONG))
+    assert len(table) == 2
+    assert ('a', rel.GROUP, 'b', dpower.WEAK) in table
+    assert ('a', rel.MAPTO, 'b', dpower.WEAK) not in table
+    assert ('a', rel.GROUP, 'z', dpower.WEAK) not in table
+
+  def test_many_duplicates(self):
+    declarations = [(f'n{i % 50}', rel.SUBSET, f'n{i % 70}', dpower.WEAK) for i in range(5000)]
+    assert list(parser.DeclarationTable(declarations)) == list(dict.fromkeys(declarations))
+
+  def test_views(self):
+    table = parser.DeclarationTable([
+      ('a', rel.GROUP, 'b', dpower.STRONG),
+      ('b', rel.ALIAS, 'c', dpower.STRONG),
+      ('b.x', rel.SUBSET, 'b', dpower.WEAK),
+    ])
+    strong = table.strong()
+    weak = table.weak()
+    assert list(strong) == [('a', rel.GROUP, 'b', dpower.STRONG), ('b', rel.ALIAS, 'c', dpower.STRONG)]
+    assert list(weak) == [('b.x', rel.SUBSET, 'b', dpower.WEAK)]
+    assert list(table.by_relation(rel.ALIAS)) == [('b', rel.ALIAS, 'c', dpower.STRONG)]
+    assert list(table.by_relation(rel.COVERS)) == []
+
+    # Views see rows appended after they were made.
+    table.append(('c', rel.MAPTO, 'a', dpower.WEAK))
+    assert len(weak) == 2
+    assert len(strong) == 2
+
+  def test_head(self):
+    declarations = [(f'n{i}', rel.SUBSET, f'n{i + 1}', dpower.WEAK) for i in range(100)]
+    table = parser.DeclarationTable(declarations)
+    for num_rows in (10, 90):  # rebuilt, then mostly kept
+      head = table.head(num_rows)
+      assert list(head) == declarations[:num_rows]
+      head.extend(declarations)  # the kept rows are still duplicates
+      assert list(head) == declarations
+
+  def test_compatibility(self):
+    declaration = parser.DeclarationTable([('a', rel.GROUP, 'b', dpower.STRONG)])[0]
+    assert parser.get_declaration_source(declaration) == 'a'
+    assert parser.get_declaration_relation(declaration) is rel.GROUP
+    assert parser.get_declaration_target(declaration) == 'b'
+    assert parser.get_declaration_power(declaration) is dpower.STRONG
+
 class TestCompoundObjectParser:
   def test_subsets(self):
     interp = parser.new_interp()
@@ -233,6 +329,22 @@ class TestCompoundObjectParser:
                             ('y.z->w', rel.SUBSET, 'w', dpower.WEAK),
                           ])
   
+  def test_repeated_compound_objects(self):
+    # The second parse is replayed from the memo, and its duplicates are dropped.
+    once = parser.new_interp()
+    parser.parse_compound_object('a.b->c/d', 'p', once)
+
+    twice = parser.new_interp()
+    assert parser.parse_compound_object('a.b->c/d', 'p', twice) == 'a.b->c/d'
+    assert parser.parse_compound_object('a.b->c/d', 'p', twice) == 'a.b->c/d'
+    assert list(twice[0]) == list(once[0])
+
+    # The memo is keyed on the parent too.
+    other_parent = parser.new_interp()
+    assert parser.parse_compound_object('/a->b', 'x', other_parent) == 'x/a->b'
+    assert parser.parse_compound_object('/a->b', 'y', other_parent) == 'y/a->b'
+    assert ('y/a', rel.MAPTO, 'b', dpower.WEAK) in other_parent[0]
+
   def test_realistic_compound_objects(self):
     interp = parser.new_interp()
     parser.parse_compound_object('playhead->video/timestamps', '', interp)
@@ -482,6 +594,174 @@ class TestRecursiveDescent:
                   ])
 
 
+  def test_deep_nesting(self):
+    # Nesting deeper than Python's recursion limit still parses.
+    depth = 3000
+    spec = 'leaf'
+    for i in reversed(range(depth)):
+      spec = {f'n{i}': {'/a <>': 'b', f'kid{i}': [spec]}}
+    declarations, _ = parser.make_relations([spec])
+    assert len(declarations) == 3 * depth
+    assert declarations[-1] == ('b', rel.MAPTO, f'n{depth - 1}/a', dpower.STRONG)
+
+class TestStreaming:
+  spec = """
+- def (video):
+    group foreach>:
+      - /timestamps
+- (video) clips:
+    /timestamps <>: &times seconds
+- items:
+    group foreach>: [a, b]
+- (gui) notes:
+    /marks <>: *times
+"""
+
+  def test_stream_spec(self):
+    assert list(parser.stream_spec(self.spec)) == parser.spec_from_string(self.spec)
+
+  def test_stream_spec_from_file(self):
+    assert list(parser.stream_spec_from_file('calendar.yaml')) == parser.spec_from_file('calendar.yaml')
+
+  def test_not_a_list(self):
+    with pytest.raises(AssertionError):
+      list(parser.stream_spec('a: b'))
+
+  def test_make_relations(self):
+    interp = parser.make_relations(parser.spec_from_string(self.spec))
+    stream_interp = parser.make_relations(parser.stream_spec(self.spec))
+    assert list(stream_interp[0]) == list(interp[0])
+    assert stream_interp[1] == interp[1]
+
+  def test_stream_relations(self):
+    declarations = parser.stream_relations(parser.stream_spec(self.spec))
+    assert next(declarations) == ('video', rel.TYPE, 'clips', dpower.STRONG)
+    assert list(declarations) == list(parser.make_relations(parser.spec_from_string(self.spec))[0])[1:]
+
+  def test_type_definitions(self):
+    assert parser.parse_type_definitions(parser.stream_spec(self.spec)) == parser.parse_type_definitions(parser.spec_from_string(self.spec))
+
+
+class TestLookup:
+  spec = """
+- (gui) week-view:
+    /marks.rectangles <>: events
+- a and b
+"""
+
+  def test_lookup(self):
+    interp = parser.make_relations(parser.spec_from_string(self.spec))
+    assert parser.get_lookup(interp) == [
+      ['week-view', [0, ('__KEY', '(gui) week-view')]],
+      ['week-view/marks.rectangles', [0, '(gui) week-view', ('__KEY', '/marks.rectangles <>')]],
+      ['events', [0, '(gui) week-view', '/marks.rectangles <>']],
+      ['a', []],  # NOTE: and-phrases don't get a path
+      ['b', []],
+      ['a and b', [1]],
+    ]
+
+  def test_shared_nodes(self):
+    interp = parser.make_relations(parser.spec_from_string(self.spec))
+    paths = {statement: path for statement, path in interp[1]}
+    # Both paths go through the same node for `(gui) week-view`.
+    assert paths['week-view/marks.rectangles'][0] is paths['events'][0]
+
+  def test_compact_lookup(self):
+    interp = parser.make_relations(parser.spec_from_string(self.spec))
+    compact = parser.compact_lookup(interp)
+    assert compact['nodes'] == [
+      [-1, 0],
+      [0, ('__KEY', '(gui) week-view')],
+      [0, '(gui) week-view'],
+      [2, ('__KEY', '/marks.rectangles <>')],
+      [2, '/marks.rectangles <>'],
+      [-1, 1],
+    ]
+
+    # Decoding gives back the lookup.
+    paths = []
+    for parent, segment in compact['nodes']:
+      paths.append([segment] if parent == -1 else [*paths[parent], segment])
+    decoded = [[statement, paths[node] if node != -1 else []] for statement, node in compact['entries']]
+    assert decoded == parser.get_lookup(interp)
+
+
+class TestIncrementalParse:
+  spec = """
+- (gui) week-view:
+    /marks.rectangles <>: events
+- weeks:
+    group foreach>: days
+- events subset> days
+"""
+
+  def check(self, incremental: parser.IncrementalParse, spec: list):
+    interp = parser.make_relations(spec)
+    assert list(incremental.interp[0]) == list(interp[0])
+    assert incremental.interp[1] == interp[1]
+
+  def test_empty(self):
+    incremental = parser.IncrementalParse()
+    delta = incremental.update([])
+    assert delta.added == [] and delta.removed == []
+    self.check(incremental, [])
+
+  def test_first_update(self):
+    spec = parser.spec_from_string(self.spec)
+    incremental = parser.IncrementalParse()
+    delta = incremental.update(spec)
+    assert delta.added == list(parser.make_relations(spec)[0])
+    assert delta.removed == []
+    self.check(incremental, spec)
+
+  def test_edit(self):
+    spec = parser.spec_from_string(self.spec)
+    incremental = parser.IncrementalParse()
+    incremental.update(spec)
+
+    spec[1] = {'weeks': {'group foreach>': 'hours'}}
+    delta = incremental.update(spec)
+    assert set(delta.added) == {
+      ('weeks', rel.GROUP_FOREACH, 'hours', dpower.STRONG),
+    }
+    assert set(delta.removed) == {
+      ('weeks', rel.GROUP_FOREACH, 'days', dpower.STRONG),
+    }
+    self.check(incremental, spec)
+
+  def test_insert_and_delete(self):
+    spec = parser.spec_from_string(self.spec)
+    incremental = parser.IncrementalParse()
+    incremental.update(spec)
+
+    spec.insert(0, 'calendars')
+    delta = incremental.update(spec)
+    assert delta.added == []  # `calendars` alone doesn't declare anything
+    self.check(incremental, spec)
+    # The paths of the statements that moved are renumbered.
+    assert ['events subset> days', [3]] in parser.get_lookup(incremental.interp)
+
+    del spec[1]
+    delta = incremental.update(spec)
+    assert ('gui', rel.TYPE, 'week-view', dpower.STRONG) in delta.removed
+    self.check(incremental, spec)
+
+  def test_shared_declarations(self):
+    # A declaration stays until every statement that declares it is gone.
+    incremental = parser.IncrementalParse()
+    incremental.update(['a.b', 'a.b'])
+    assert incremental.update(['a.b']) == parser.DeclarationDelta(added=[], removed=[])
+    assert incremental.update([]) == parser.DeclarationDelta(added=[], removed=[('a.b', rel.SUBSET, 'a', dpower.WEAK)])
+
+  def test_failed_update(self):
+    spec = parser.spec_from_string(self.spec)
+    incremental = parser.IncrementalParse()
+    incremental.update(spec)
+    with pytest.raises(AssertionError):
+      incremental.update([*spec, {'weeks': {'affects': 'days'}}])  # missing the angle bracket
+    self.check(incremental, spec)
+
+
 class TestTypeDeclarations:
   def test_basic(self):
     type_decls, _ = parser.parse_type_definitions(parser.spec_from_string("""
@@ -0,0 +1,58 @@
+import benchmark
+import compiler
+import parser
+import synthetic
+from parser import rel
+
+class TestSyntheticSpecs:
+  def test_compiles(self):
+    for shape in [
+      synthetic.SpecShape(),
+      synthetic.SpecShape(instances=20, fanout=3, compound_depth=4, alias_chain=2, type_definitions=2),
+      synthetic.SpecShape(instances=20, compound_depth=0, standard_types=False),
+    ]:
+      graph = compiler.compile_spec(synthetic.make_spec(shape))
+      assert graph.number_of_nodes() > 0
+
+  def test_deterministic(self):
+    shape = synthetic.SpecShape(instances=30, compound_depth=5, seed=3)
+    assert synthetic.make_spec(shape) == synthetic.make_spec(shape)
+    assert synthetic.make_spec(shape) != synthetic.make_spec(shape._replace(seed=4))
+
+  def test_yaml(self):
+    shape = synthetic.SpecShape(instances=5, alias_chain=2, type_definitions=1)
+    assert parser.spec_from_string(synthetic.make_spec_yaml(shape)) == synthetic.make_spec(shape)
+
+  def test_alias_chain(self):
+    spec = synthetic.make_spec(synthetic.SpecShape(instances=1, alias_chain=3))
+    declarations, _ = parser.make_relations(spec)
+    assert len(declarations.by_relation(rel.ALIAS)) == 3
+    # The whole chain collapses into one node.
+    assert 'items0 = alias0_0 = alias0_1 = alias0_2' in compiler.compile_spec(spec).nodes
+
+  def test_shape_for_nodes(self):
+    for num_nodes in [100, 1000]:
+      graph = compiler.compile_spec(synthetic.make_spec(synthetic.shape_for_nodes(num_nodes, compound_depth=3)))
+      assert 0.8 * num_nodes <= graph.number_of_nodes() <= 1.2 * num_nodes
+
+
+class TestBenchmark:
+  def test_run(self):
+    results = benchmark.run_benchmarks([10, 50], repeat=1)
+    assert [run['size'] for run in results['runs']] == [10, 50]
+    for run in results['runs']:
+      assert set(run['benchmarks']) == set(benchmark.BENCHMARKS)
+      assert all(measurement['seconds'] > 0 for measurement in run['benchmarks'].values())
+
+    assert len(benchmark.compare(results, results)) == 2 * len(benchmark.BENCHMARKS)
+
+  def test_cold(self):
+    spec = synthetic.make_spec(synthetic.shape_for_nodes(50))
+    cache_sizes = []
+    def function(spec):
+      cache_sizes.append(parser.lex.cache_info().currsize)
+      parser.make_relations(spec)
+
+    parser.make_relations(spec)
+    benchmark.measure(function, spec, repeat=2)
+    assert cache_sizes == [0, 0, 0]  # two timed runs, and the tracemalloc one
@@ -103,6 +103,32 @@ export type ViewNode = {
 
 export type SpecPath = (number | string | ["__KEY", string])[];
 
+/**
+ * specs.json stores the lookup's paths once, as a tree of [parent, segment] nodes
+ * (-1 is the root). Each entry is [statement, node], where -1 is the empty path.
+ */
+export type CompactLookup = {
+  nodes: [number, SpecPath[number]][];
+  entries: [string, number][];
+};
+
+export function decode_lookup(
+  lookup: [string, SpecPath][] | CompactLookup
+): [string, SpecPath][] {
+  if (Array.isArray(lookup)) return lookup; // older specs.json
+
+  // Parents come before their children.
+  const paths: SpecPath[] = [];
+  for (const [parent, segment] of lookup.nodes) {
+    paths.push(parent === -1 ? [segment] : [...paths[parent], segment]);
+  }
+
+  return lookup.entries.map(([statement, node]) => [
+    statement,
+    node === -1 ? [] : paths[node],
+  ]);
+}
+
 function render(thing: any, path: SpecPath): ViewNode {
   if (typeof thing === "object" && !Array.isArray(thing)) {
     return render_obj(thing, path);
@@ -3,7 +3,11 @@ import {
   make_analogy_viewer,
   Spec,
 } from "./analogy-viewer/analogy-viewer";
-import { SpecPath } from "./analogy-viewer/viewer/viewer";
+import {
+  CompactLookup,
+  decode_lookup,
+  SpecPath,
+} from "./analogy-viewer/viewer/viewer";
 import { make_cost_matrix } from "./cost-matrix/cost-matrix";
 import "./style.css";
 import { vtabs } from "./utilities/ui-utilities";
@@ -14,7 +18,7 @@ async function main() {
     string,
     {
       yaml: object;
-      lookup: [string, SpecPath][];
+      lookup: [string, SpecPath][] | CompactLookup;
     }
   >;
 
@@ -26,7 +30,7 @@ async function main() {
     return {
       name,
       yaml: specs[name].yaml,
-      lookup: specs[name].lookup,
+      lookup: decode_lookup(specs[name].lookup),
     };
   };
 